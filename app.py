@@ -1,29 +1,43 @@
+import concurrent.futures
+import functools
+import itertools
 import json
+import os
 import re
-import sqlite3
+import threading
 
-import markovify
-
-from flask import abort, Flask, request
+from flask import abort, Flask, g, request, Response, stream_with_context
 from flask_cors import CORS
 
-from jptext import JPText
-from txtsplit import split_into_morps
+from genpool import GenerationPool
+from modelreg import ModelRegistry, load_model
+from resdb import ConnectionPool, ResourceLookup
+from searchidx import (POSTINGS_TABLE, SNIPPET_CHARS, TEXTS_TABLE,
+                       has_search_index, is_indexable, joined_text,
+                       like_pattern, make_snippet, matching_morps_query,
+                       matching_rowids_query)
+from sentpool import SentencePool
+from txtsplit import split_into_morps, warm_up_taggers
 from txtutils import KANA_REGEX, KANJI_REGEX, chunk_and_split
 
-with open("giin_model_state4.json") as f:
-    giin_model = JPText.from_json(f.read())
-    print(f"Giin model: state_size={giin_model.state_size}")
-with open("gyosei_model_state4.json") as f:
-    gyosei_model = JPText.from_json(f.read())
-    print(f"Gyosei model: state_size={gyosei_model.state_size}")
+# markovify (jptext) and MeCab (txtsplit) are imported when the models and the
+# tagger are first used, so that endpoints not using them are available soon
+# after the app is started.
 
+# mkmamodel.py の `WORD_BOUNDS` と同じ範囲にすること
 GIIN_MIN_WORDS, GIIN_MAX_WORDS = 17, 21
 GYOSEI_MIN_WORDS, GYOSEI_MAX_WORDS = 12, 30
+# モデル名: (モデルファイル名 (拡張子なし), 最小単語数, 最大単語数)
+MODELS = {
+    "giin": ("giin_model_state4", GIIN_MIN_WORDS, GIIN_MAX_WORDS),
+    "gyosei": ("gyosei_model_state4", GYOSEI_MIN_WORDS, GYOSEI_MAX_WORDS),
+}
 DEFAULT_MAKE_SENTENCE_KWARGS = {
     "test_output": False,
     "reject_co_exps": True,
     "tries": 10,
+    # 単語数の範囲内で終わるように連鎖をたどる
+    "constrain_length": True,
     # ですます調の文章
     "allowed_output_regex": re.compile(
         f"^([ 'a-z]|{KANA_REGEX}|{KANJI_REGEX})+(([でま](し(た|ょう)|す)|ません)[かよ]?ね?|ませ)$"
@@ -32,32 +46,153 @@ DEFAULT_MAKE_SENTENCE_KWARGS = {
 }
 
 app = Flask(__name__)
+app.config.update(
+    DB_PATH="resource.sqlite3",
+    # 同時に開く読み取り専用接続の上限 (スレッド数以上を推奨)
+    DB_POOL_SIZE=8,
+    # 実行中に DB ファイルが更新されない場合のみ True にできる
+    DB_IMMUTABLE=False,
+    DB_MMAP_SIZE=256 * 1024 ** 2,  # bytes
+    DB_CACHE_SIZE=64 * 1024,  # KiB
+    # `/generate` で一度に生成できる文章数の上限
+    GENERATE_MAX_COUNT=100,
+    # prompt なしの `/generate` 用に生成しておく文章数 (0 の場合は生成しない)
+    SENTENCE_POOL_DEPTH=32,
+    # モデルファイルの更新を確認する間隔 (秒、0 の場合は再読み込みしない)
+    MODEL_RELOAD_INTERVAL=5.0,
+    # 起動時にモデルと形態素解析器をバックグラウンドで読み込んでおく
+    # (False の場合は最初に使用するリクエストで読み込む)
+    WARM_UP=True,
+    # 文章を生成するワーカープロセスの数 (0 の場合はリクエストを処理するプロセスで生成する)
+    GENERATION_WORKERS=0,
+    # ワーカープロセスでの生成を待つ秒数
+    GENERATION_TIMEOUT=30.0,
+)
+# 環境変数 `FLASK_DB_POOL_SIZE` などで上書きできる
+app.config.from_prefixed_env()
 CORS(app)
 
-@app.route("/search", methods=["POST"])
-def search_sections():
-    def snippet_match(kws:list[str], sentences:list[list[str]] | str,
-                      max_chars:int=100):
-        if type(sentences) is str:
-            joined_sentences = sentences
-        else:
-            joined_sentences = " | ".join([" ".join(grams) for grams in sentences])
+db_pool = ConnectionPool(
+    app.config["DB_PATH"],
+    size=app.config["DB_POOL_SIZE"],
+    immutable=app.config["DB_IMMUTABLE"],
+    mmap_size=app.config["DB_MMAP_SIZE"],
+    cache_size=app.config["DB_CACHE_SIZE"],
+)
+# 会議 (councils) 及び発言者 (speakers) の参照用テーブル
+resource_lookup = ResourceLookup(app.config["DB_PATH"])
+
+def load_app_model(path:str):
+    """
+    Loads a model, and prepares the probabilities of its bounds of the number
+    of words for `constrain_length` (see `FlatChain.band_probabilities()`)
+    before the model is used.
+    """
+    model = load_model(path)
+    for basename, min_words, max_words in MODELS.values():
+        if os.path.basename(path).startswith(basename + ".") and \
+           hasattr(model.chain, "band_probabilities"):
+            # バイナリファイルに保存されていればそれを使い、なければここで計算する
+            model.chain.band_probabilities(
+                -1 if min_words is None else min_words, max_words
+            )
+    return model
+
+# モデルファイルが更新されると、新しいモデルをバックグラウンドで読み込んで置き換える
+# (処理中のリクエストは古いモデルのまま完了する)
+model_registry = ModelRegistry(load_app_model,
+                               interval=app.config["MODEL_RELOAD_INTERVAL"])
+for name, (basename, _, _) in MODELS.items():
+    model_registry.register(name, basename, lazy=True)
+
+# マルチコアを使って文章を生成するワーカープロセスのプール
+generation_pool = None
+if app.config["GENERATION_WORKERS"] > 0:
+    generation_pool = GenerationPool(app.config["GENERATION_WORKERS"],
+                                     app.config["GENERATION_TIMEOUT"])
+
+def call_model(model_name:str, loaded, method:str, *args, **kwargs):
+    """
+    Calls `loaded.model.<method>(*args, **kwargs)` in the generation pool, or
+    in this process if the pool is disabled. Raises
+    `concurrent.futures.TimeoutError` if the pool does not return the result
+    in time.
+    """
+    if generation_pool is None:
+        return getattr(loaded.model, method)(*args, **kwargs)
+    return generation_pool.call(model_name, loaded, method, *args, **kwargs)
+
+def make_pooled_sentence(model_name:str, min_words:int, max_words:int):
+    """
+    Makes a sentence for the pool with the current version of the model.
+    """
+    try:
+        return call_model(model_name, model_registry.get(model_name),
+                          "make_sentence", min_words=min_words,
+                          max_words=max_words, **DEFAULT_MAKE_SENTENCE_KWARGS)
+    except concurrent.futures.TimeoutError:
+        return None
+
+# prompt なしの文章をバックグラウンドで生成しておくプール
+sentence_pools = {}
+if app.config["SENTENCE_POOL_DEPTH"] > 0:
+    for name, (_, min_words, max_words) in MODELS.items():
+        sentence_pools[name] = SentencePool(
+            functools.partial(make_pooled_sentence, name, min_words,
+                              max_words),
+            app.config["SENTENCE_POOL_DEPTH"]
+        )
+
+    # 古いモデルで生成した文章は捨てる
+    model_registry.add_listener(
+        lambda name, loaded: sentence_pools[name].clear()
+    )
 
-        ind = joined_sentences.index(kws[0])
-        ret = joined_sentences[joined_sentences.index(kws[0]):][:max_chars]
-        if len(ret) == 40:
-            ret += " (…)"
-        if ind != 0:
-            ret = f"(…) {ret}"
-        return ret
+def warm_up():
+    """
+    Loads the models and the tagger in background threads, and returns the
+    threads.
+    """
+    # リクエストごとのスレッドはプールのタガーを借りて使うため、最初の
+    # リクエストまでに作成しておく
+    tagger_thread = threading.Thread(target=warm_up_taggers, daemon=True)
+    tagger_thread.start()
+    return [model_registry.warm_up(), tagger_thread]
+
+if app.config["WARM_UP"]:
+    warm_up()
+
+@app.after_request
+def add_model_headers(response):
+    """
+    Reports the version of the model used by `/generate` in the headers.
+    """
+    loaded = g.get("loaded_model")
+    if loaded is not None:
+        response.headers["X-Model-Version"] = loaded.version
+        response.headers["X-Model-Load-Time"] = f"{loaded.load_seconds:.3f}"
+    return response
+
+def make_sentence_without_start(model_name:str, loaded, **kwargs):
+    """
+    Returns a sentence popped from the pool of the model, or made by
+    `make_sentence()` of the model `loaded` if the pool is empty (or
+    disabled). `**kwargs` are passed to `make_sentence()`.
+    """
+    output = None
+    if model_name in sentence_pools:
+        output = sentence_pools[model_name].pop()
+    return output or call_model(model_name, loaded, "make_sentence", **kwargs,
+                                **DEFAULT_MAKE_SENTENCE_KWARGS)
 
+@app.route("/search", methods=["POST"])
+def search_sections():
     receive = request.get_json()
 
     if receive["splitQuery"] == True:
         kws = chunk_and_split(split_into_morps, receive["query"].lower())
     else:
         kws = receive["query"].lower().split(" ")
-    kws_like =  [f"%{kw}%" for kw in kws]  # SQL 文の LIKE 用キーワード
 
     if receive["target"] == "content":
         target_col = "content"
@@ -66,52 +201,92 @@ def search_sections():
     else:
         abort(500)
 
-    where_cond = " AND ".join([f"{target_col} LIKE ?" for _ in kws])
-
-    conn = sqlite3.connect("resource.sqlite3")
-    cur = conn.cursor()
-
-    cur.execute(
-        f"SELECT COUNT(*) FROM sections WHERE {where_cond}", kws_like
-    )
-    total_items = cur.fetchone()[0]
-
-    cur.execute(
-        f"SELECT id, council_id, speaker_id, type, role, {target_col} FROM sections WHERE {where_cond} LIMIT ? OFFSET ?",
-        kws_like + [receive["fetchItems"], receive["fetchOffset"]],
-    )
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+
+        # 形態素単位の検索は転置インデックスから行う (`searchidx.py` で構築)
+        # キーワードを含む形態素を求めるため、ヒットは LIKE による部分一致と同じになる
+        # 部分一致と同じにならないキーワード (記号を含むなど) や、古いインデックスは使用しない
+        # スニペットは、最初のキーワードを含む最初の形態素の位置から SQLite で切り出す
+        if receive["splitQuery"] == True and target_col == "parsed_sentences" \
+           and is_indexable(kws) and has_search_index(cur):
+            rowids_query = matching_rowids_query(kws)
+            patterns = [like_pattern(kw) for kw in kws]
+
+            cur.execute(f"SELECT COUNT(*) FROM ({rowids_query})", patterns)
+            total_items = cur.fetchone()[0]
+
+            cur.execute(
+                f"SELECT id, council_id, speaker_id, type, role, hits.position, substr(text, hits.position + 1, ?), length(text) FROM (SELECT section_rowid, MIN(position) AS position FROM {POSTINGS_TABLE} WHERE morp IN ({matching_morps_query()}) AND section_rowid IN ({rowids_query}) GROUP BY section_rowid ORDER BY section_rowid LIMIT ? OFFSET ?) AS hits JOIN sections ON sections.rowid = hits.section_rowid JOIN {TEXTS_TABLE} USING (section_rowid) ORDER BY section_rowid",
+                # 最後の単語が途中で切れているかを判定するため 1 文字多く切り出す
+                [SNIPPET_CHARS + 1, patterns[0]] + patterns
+                + [receive["fetchItems"], receive["fetchOffset"]],
+            )
+            records = cur.fetchall()
+        elif target_col == "content":
+            kws_like =  [f"%{kw}%" for kw in kws]  # SQL 文の LIKE 用キーワード
+            where_cond = " AND ".join([f"{target_col} LIKE ?" for _ in kws])
 
-    items = [{
-        "id": fields[0],
-        "councilID": fields[1],
-        "speakerID": fields[2],
-        "type": fields[3],
-        "role": fields[4],
-        "snippetSentence": snippet_match(
-            kws,
-            json.loads(fields[5]) if target_col == "parsed_sentences" else fields[5]
-        )
-    } for fields in cur.fetchall()]
+            cur.execute(
+                f"SELECT COUNT(*) FROM sections WHERE {where_cond}", kws_like
+            )
+            total_items = cur.fetchone()[0]
 
-    for item in items:
-        cur.execute(
-            f"SELECT name, held_on FROM councils WHERE id='{item['councilID']}'"
-        )
-        council_records = cur.fetchall()
-        if len(council_records) == 1:
-            item["councilName"], item["councilDate"] = council_records[0]
+            # LIKE と同じく英字の大文字・小文字を区別せずに位置を求める
+            cur.execute(
+                f"SELECT id, council_id, speaker_id, type, role, snippet_position, substr(content, snippet_position + 1, ?), length(content) FROM (SELECT *, max(instr(lower(content), ?) - 1, 0) AS snippet_position FROM sections WHERE {where_cond} LIMIT ? OFFSET ?)",
+                [SNIPPET_CHARS, kws[0]] + kws_like
+                + [receive["fetchItems"], receive["fetchOffset"]],
+            )
+            records = cur.fetchall()
         else:
-            item["councilName"], item["councilDate"] = "", ""
+            # 転置インデックスを使用しない場合は、発言ごとに形態素の列を結合する
+            kws_like =  [f"%{kw}%" for kw in kws]  # SQL 文の LIKE 用キーワード
+            where_cond = " AND ".join([f"{target_col} LIKE ?" for _ in kws])
 
-        cur.execute(f"SELECT name, party FROM speakers WHERE id='{item['speakerID']}'")
-        speaker_records = cur.fetchall()
-        if len(speaker_records) == 1:
-            item["speakerName"], item["speakerParty"] = speaker_records[0]
-        else:
-            item["speakerName"], item["speakerParty"] = "", ""
+            cur.execute(
+                f"SELECT COUNT(*) FROM sections WHERE {where_cond}", kws_like
+            )
+            total_items = cur.fetchone()[0]
+
+            cur.execute(
+                f"SELECT id, council_id, speaker_id, type, role, {target_col} FROM sections WHERE {where_cond} LIMIT ? OFFSET ?",
+                kws_like + [receive["fetchItems"], receive["fetchOffset"]],
+            )
+            records = []
+            for fields in cur.fetchall():
+                text = joined_text(json.loads(fields[5]))
+                position = max(text.find(kws[0]), 0)
+                records.append(fields[:5] + (
+                    position, text[position:position + SNIPPET_CHARS],
+                    len(text)
+                ))
+
+        items = []
+        for fields in records:
+            snippet, highlights = make_snippet(fields[6], kws, fields[5],
+                                               fields[7])
+            items.append({
+                "id": fields[0],
+                "councilID": fields[1],
+                "speakerID": fields[2],
+                "type": fields[3],
+                "role": fields[4],
+                "snippetSentence": snippet,
+                # スニペット中のすべてのキーワードの位置 [開始, 終了]
+                "snippetHighlights": highlights,
+            })
+
+        councils, speakers = resource_lookup.tables(cur)
+        for item in items:
+            item["councilName"], item["councilDate"] = councils.get(
+                item["councilID"], ("", "")
+            )
+            item["speakerName"], item["speakerParty"] = speakers.get(
+                item["speakerID"], ("", "")
+            )
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     return {
         "totalItems": total_items,
@@ -123,29 +298,28 @@ def search_sections():
 def get_councils():
     receive = request.get_json()
 
-    conn = sqlite3.connect("resource.sqlite3")
-    cur = conn.cursor()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM councils")
-    total_items = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM councils")
+        total_items = cur.fetchone()[0]
 
-    cur.execute(
-        "SELECT id, name, held_on, retrieved_at, url FROM councils ORDER BY held_on LIMIT ? OFFSET ?",
-        [receive["fetchItems"], receive["fetchOffset"]]
-    )
-    items = [
-        {
-            "id": fields[0],
-            "name": fields[1],
-            "heldOn": fields[2],
-            "retrievedAt": fields[3],
-            "url": fields[4]
-        }
-        for fields in cur.fetchall()
-    ]
+        cur.execute(
+            "SELECT id, name, held_on, retrieved_at, url FROM councils ORDER BY held_on LIMIT ? OFFSET ?",
+            [receive["fetchItems"], receive["fetchOffset"]]
+        )
+        items = [
+            {
+                "id": fields[0],
+                "name": fields[1],
+                "heldOn": fields[2],
+                "retrievedAt": fields[3],
+                "url": fields[4]
+            }
+            for fields in cur.fetchall()
+        ]
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     return {
         "totalItems": total_items,
@@ -156,55 +330,49 @@ def get_councils():
 def view_council():
     receive = request.get_json()
 
-    conn = sqlite3.connect("resource.sqlite3")
-    cur = conn.cursor()
-
-    cur.execute(
-        "SELECT name, held_on, retrieved_at, url FROM councils WHERE id=?",
-        [receive["id"]]
-    )
-    council_records = cur.fetchall()
-    if len(council_records) == 0:
-        abort(404)
-    elif len(council_records) > 1:
-        abort(500)
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute(
-        "SELECT id, speaker_id, type, role, content FROM sections WHERE council_id=? ORDER BY position",
-        [receive["id"]]
-    )
-    section_records = cur.fetchall()
-
-    ret = {
-        "name": council_records[0][0],
-        "heldOn": council_records[0][1],
-        "retrievedAt": council_records[0][2],
-        "url": council_records[0][3],
-        "sections": [
-            {
-                "id": section_record[0],
-                "speakerID": section_record[1],
-                "type": section_record[2],
-                "role": section_record[3],
-                "content": section_record[4]
-            }
-            for section_record in section_records
-        ]
-    }
+        cur.execute(
+            "SELECT name, held_on, retrieved_at, url FROM councils WHERE id=?",
+            [receive["id"]]
+        )
+        council_records = cur.fetchall()
+        if len(council_records) == 0:
+            abort(404)
+        elif len(council_records) > 1:
+            abort(500)
 
-    for section in ret["sections"]:
         cur.execute(
-            "SELECT name, party FROM speakers WHERE id=?",
-            [section["speakerID"]]
+            "SELECT id, speaker_id, type, role, content FROM sections WHERE council_id=? ORDER BY position",
+            [receive["id"]]
         )
-        speaker_records = cur.fetchall()
-        if len(speaker_records) == 1:
-            section["speakerName"], section["speakerParty"] = speaker_records[0]
-        else:
-            section["speakerName"], section["speakerParty"] = "", ""
+        section_records = cur.fetchall()
+
+        ret = {
+            "name": council_records[0][0],
+            "heldOn": council_records[0][1],
+            "retrievedAt": council_records[0][2],
+            "url": council_records[0][3],
+            "sections": [
+                {
+                    "id": section_record[0],
+                    "speakerID": section_record[1],
+                    "type": section_record[2],
+                    "role": section_record[3],
+                    "content": section_record[4]
+                }
+                for section_record in section_records
+            ]
+        }
 
-    cur.close()
-    conn.close()
+        _, speakers = resource_lookup.tables(cur)
+        for section in ret["sections"]:
+            section["speakerName"], section["speakerParty"] = speakers.get(
+                section["speakerID"], ("", "")
+            )
+
+        cur.close()
 
     return ret
 
@@ -212,33 +380,32 @@ def view_council():
 def get_speakers():
     receive = request.get_json()
 
-    conn = sqlite3.connect("resource.sqlite3")
-    cur = conn.cursor()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM speakers WHERE id != ''")
-    total_items = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM speakers WHERE id != ''")
+        total_items = cur.fetchone()[0]
 
-    cur.execute(
-        "SELECT id, name, kana_family_name, kana_given_name, birth_year, gender, party, faction, address FROM speakers WHERE id != '' LIMIT ? OFFSET ?",
-        [receive["fetchItems"], receive["fetchOffset"]]
-    )
-    items = [
-        {
-            "id": fields[0],
-            "name": fields[1],
-            "kanaFamilyName": fields[2],
-            "kanaGivenName": fields[3],
-            "birthYear": fields[4],
-            "gender": fields[5],
-            "party": fields[6],
-            "faction": fields[7],
-            "address": fields[8]
-        }
-        for fields in cur.fetchall()
-    ]
+        cur.execute(
+            "SELECT id, name, kana_family_name, kana_given_name, birth_year, gender, party, faction, address FROM speakers WHERE id != '' LIMIT ? OFFSET ?",
+            [receive["fetchItems"], receive["fetchOffset"]]
+        )
+        items = [
+            {
+                "id": fields[0],
+                "name": fields[1],
+                "kanaFamilyName": fields[2],
+                "kanaGivenName": fields[3],
+                "birthYear": fields[4],
+                "gender": fields[5],
+                "party": fields[6],
+                "faction": fields[7],
+                "address": fields[8]
+            }
+            for fields in cur.fetchall()
+        ]
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     return {
         "totalItems": total_items,
@@ -249,17 +416,16 @@ def get_speakers():
 def view_speaker():
     receive = request.get_json()
 
-    conn = sqlite3.connect("resource.sqlite3")
-    cur = conn.cursor()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute(
-        "SELECT name, kana_family_name, kana_given_name, birth_year, gender, party, faction, address FROM speakers WHERE id=?",
-        [receive["id"]]
-    )
-    speaker_records = cur.fetchall()
+        cur.execute(
+            "SELECT name, kana_family_name, kana_given_name, birth_year, gender, party, faction, address FROM speakers WHERE id=?",
+            [receive["id"]]
+        )
+        speaker_records = cur.fetchall()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     if len(speaker_records) == 0:
         abort(404)
@@ -280,18 +446,29 @@ def view_speaker():
     
     return ret
 
+@app.route("/status", methods=["GET"])
+def get_status():
+    return {
+        "models": model_registry.status()
+    }
+
 @app.route("/generate", methods=["POST"])
 def generate():
+    from markovify.text import ParamError
+
     receive = request.get_json()
+    count = receive.get("count", 1)  # 2 以上の場合は NDJSON で順次返す
 
-    if receive["model"] == "giin":
-        model = giin_model
-        min_words, max_words = GIIN_MIN_WORDS, GIIN_MAX_WORDS
-    elif receive["model"] == "gyosei":
-        model = gyosei_model
-        min_words, max_words = GYOSEI_MIN_WORDS, GYOSEI_MAX_WORDS
-    else:
+    # モデルの取得 (初回の読み込みを待つことがある) より前に検証する
+    if type(count) is not int or not 1 <= count <= app.config["GENERATE_MAX_COUNT"]:
+        abort(400)
+
+    if receive["model"] not in MODELS:
         abort(500)
+    _, min_words, max_words = MODELS[receive["model"]]
+    # このリクエストの間は、モデルが置き換えられても同じバージョンを使う
+    g.loaded_model = model_registry.get(receive["model"])
+    model = g.loaded_model.model
 
     beginning = tuple(
         model.word_split(receive["prompt"].removeprefix("「").lower())
@@ -299,40 +476,121 @@ def generate():
     over_state_size = len(beginning) > model.state_size
     strict = not over_state_size and receive["prompt"].startswith("「")
 
-    if beginning:  # When beginning is not empty
-        try:
-            output = model.make_sentence_with_start(
+    def format_output(output):
+        if receive["wakachi"] == True:
+            formatted_sentence = " ".join(output["words"])
+        else:
+            formatted_sentence = output["sentence"]
+
+        if over_state_size:
+            formatted_sentence = f"… {formatted_sentence}"
+        elif strict:
+            formatted_sentence = f"「{formatted_sentence}」"
+
+        return {
+            "sentence": formatted_sentence,
+            "existsInCorpus": model.exists_in_corpus(output["words"])
+        }
+
+    if count > 1:
+        return generate_batch(receive["model"], g.loaded_model, beginning,
+                              strict, count, format_output,
+                              min_words=min_words, max_words=max_words)
+
+    try:
+        if beginning:  # When beginning is not empty
+            output = call_model(
+                receive["model"],
+                g.loaded_model,
+                "make_sentence_with_start",
                 beginning=beginning[-model.state_size:],
                 strict=strict,
                 min_words=min_words,
                 max_words=max_words,
                 **DEFAULT_MAKE_SENTENCE_KWARGS
             )
-        except KeyError:  # prompt で始まる文章が model に存在しないときなど
-            output = None
-        except markovify.text.ParamError:  # promot が state_size を超える単語数のときなど
-            output = None
-    else:
-        output = model.make_sentence(
-            min_words=min_words,
-            max_words=max_words,
-            **DEFAULT_MAKE_SENTENCE_KWARGS
-        )
+        else:
+            output = make_sentence_without_start(
+                receive["model"],
+                g.loaded_model,
+                min_words=min_words,
+                max_words=max_words
+            )
+    except KeyError:  # prompt で始まる文章が model に存在しないときなど
+        output = None
+    except ParamError:  # promot が state_size を超える単語数のときなど
+        output = None
+    except concurrent.futures.TimeoutError:  # ワーカープロセスでの生成が時間切れのとき
+        abort(503)
 
     if not output:
         abort(500)
 
-    if receive["wakachi"] == True:
-        formatted_sentence = " ".join(output["words"])
+    return format_output(output)
+
+def generate_batch(model_name:str, loaded, beginning:tuple[str],
+                   strict:bool, count:int, format_output, **kwargs):
+    """
+    Returns a streaming response of `count` sentences in NDJSON. Each line is
+    written as soon as the sentence has been made, and sentences failed to be
+    made are omitted.
+
+    `beginning` has already been split, and its initial states are looked up
+    only once for all sentences. Without `beginning`, sentences are taken from
+    the pool of the model as far as it has. With the generation pool,
+    sentences are made in parallel by the worker processes. `**kwargs` are
+    passed to `make_sentence()`.
+    """
+    from markovify.text import ParamError
+
+    model = loaded.model
+    if beginning and generation_pool is not None:
+        outputs = generation_pool.map(
+            model_name, loaded, "make_sentence_with_start_or_none", count,
+            beginning[-model.state_size:], strict=strict, **kwargs,
+            **DEFAULT_MAKE_SENTENCE_KWARGS
+        )
+    elif beginning:
+        outputs = model.make_sentences_with_start(
+            beginning[-model.state_size:], count, strict=strict,
+            **kwargs, **DEFAULT_MAKE_SENTENCE_KWARGS
+        )
+    elif generation_pool is not None:
+        pooled = []
+        while model_name in sentence_pools and len(pooled) < count:
+            output = sentence_pools[model_name].pop()
+            if output is None:
+                break
+            pooled.append(output)
+        outputs = itertools.chain(pooled, generation_pool.map(
+            model_name, loaded, "make_sentence", count - len(pooled),
+            **kwargs, **DEFAULT_MAKE_SENTENCE_KWARGS
+        ))
     else:
-        formatted_sentence = output["sentence"]
+        outputs = (
+            make_sentence_without_start(model_name, loaded, **kwargs)
+            for _ in range(count)
+        )
 
-    if over_state_size:
-        formatted_sentence = f"… {formatted_sentence}"
-    elif strict:
-        formatted_sentence = f"「{formatted_sentence}」"
+    # 最初の文章を生成してから応答を開始する (prompt が不正な場合に 500 を返すため)
+    try:
+        first_output = next(outputs)
+    except KeyError:  # prompt で始まる文章が model に存在しないときなど
+        abort(500)
+    except ParamError:  # promot が state_size を超える単語数のときなど
+        abort(500)
+    except concurrent.futures.TimeoutError:  # ワーカープロセスでの生成が時間切れのとき
+        abort(503)
 
-    return {
-        "sentence": formatted_sentence,
-        "existsInCorpus": output["sentence"] in model.rejoined_text
-    }
+    def stream():
+        try:
+            for output in itertools.chain([first_output], outputs):
+                if output:
+                    yield json.dumps(format_output(output),
+                                     ensure_ascii=False) + "\n"
+        except concurrent.futures.TimeoutError:
+            # 時間内に生成できた文章までを返す
+            pass
+
+    return Response(stream_with_context(stream()),
+                    mimetype="application/x-ndjson")
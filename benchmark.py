@@ -0,0 +1,642 @@
+"""
+Benchmarks of the text generation and processing.
+
+Usage:
+    python benchmark.py <benchmark> [options]
+
+Run `python benchmark.py -h` to list benchmarks.
+"""
+import argparse
+import collections
+import filecmp
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+def measure(func, number: int):
+    """ Calls `func()` `number` times and returns calls per second. """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return number / (time.perf_counter() - start)
+
+def load_json_model(path: str, **kwargs):
+    from jptext import JPText
+
+    start = time.perf_counter()
+    with open(path) as f:
+        model = JPText.from_json(f.read(), **kwargs)
+    return model, time.perf_counter() - start
+
+def bench_chain(args):
+    """ Sentences/sec of `markovify.Chain` and `intchain.IntChain`. """
+    for path in args.models:
+        models = {}
+        for name, int_chain in [("markovify", False), ("IntChain", True)]:
+            models[name], load_time = load_json_model(path,
+                                                      int_chain=int_chain)
+            print(f"{path} ({name}): loaded in {load_time:.2f} s")
+
+        for name, model in models.items():
+            random.seed(args.seed)
+            walks = measure(model.chain.walk, args.number)
+            random.seed(args.seed)
+            sentences = measure(
+                lambda: model.make_sentence(test_output=False,
+                                            allowed_output_regex=None),
+                args.number
+            )
+            print(f"{path} ({name}): chain.walk {walks:,.0f}/s, "
+                  f"make_sentence {sentences:,.0f}/s")
+
+def bench_novelty(args):
+    """ test_sentence_output/sec with the novelty index and the rejoined
+    text. """
+    for path in args.models:
+        model, load_time = load_json_model(path, int_chain=True)
+        print(f"{path}: loaded in {load_time:.2f} s")
+        start = time.perf_counter()
+        novelty_index = model.novelty_index
+        print(f"{path}: novelty index ready in "
+              f"{time.perf_counter() - start:.2f} s")
+
+        random.seed(args.seed)
+        candidates = [model.chain.walk() for _ in range(args.number)]
+        candidates = iter(candidates * 2)
+        for name, index in [("novelty index", novelty_index),
+                            ("rejoined text", None)]:
+            model.novelty_index = index
+            checks = measure(
+                lambda: model.test_sentence_output(next(candidates)),
+                args.number
+            )
+            print(f"{path} ({name}): test_sentence_output {checks:,.0f}/s")
+        model.novelty_index = novelty_index
+
+def bench_length(args):
+    """ Accept rate, sentences/sec and distribution of lengths of
+    `make_sentence` with and without `constrain_length`. """
+    bands = {"giin": (17, 21), "gyosei": (12, 30)}
+    for path in args.models:
+        model, load_time = load_json_model(path, int_chain=True)
+        print(f"{path}: loaded in {load_time:.2f} s")
+        min_words, max_words = args.min_words, args.max_words
+        if min_words is None and max_words is None:
+            # Bounds of the model in app.py
+            min_words, max_words = next(
+                (band for name, band in bands.items() if name in path),
+                (None, None)
+            )
+
+        start = time.perf_counter()
+        model.chain.length_masks
+        print(f"{path}: length masks computed in "
+              f"{time.perf_counter() - start:.2f} s")
+        start = time.perf_counter()
+        model.chain.band_probabilities(
+            -1 if min_words is None else min_words, max_words
+        )
+        print(f"{path}: band probabilities computed in "
+              f"{time.perf_counter() - start:.2f} s")
+
+        for constrain_length in [False, True]:
+            random.seed(args.seed)
+            start = time.perf_counter()
+            outputs = [
+                model.make_sentence(
+                    min_words=min_words, max_words=max_words, tries=1,
+                    test_output=False, allowed_output_regex=None,
+                    constrain_length=constrain_length, verbose=True
+                )
+                for _ in range(args.number)
+            ]
+            elapsed = time.perf_counter() - start
+            lengths = collections.Counter(output["wordCount"]
+                                          for output in outputs
+                                          if output is not None)
+            accepted = sum(lengths.values())
+            print(f"{path} (constrain_length={constrain_length}, "
+                  f"{min_words} < words < {max_words}): "
+                  f"accepted {accepted / args.number:.1%} of tries, "
+                  f"{accepted / elapsed:,.0f} sentences/s")
+            print("  words: " + ", ".join(
+                f"{length}: {count / accepted:.1%}"
+                for length, count in sorted(lengths.items())
+            ))
+
+def bench_build(args):
+    """ Wall-clock time of the serial and parallel model builds. The output
+    files of the builds are checked to be identical. """
+    from mkmamodel import make_giin_gyosei_model, save_models
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        times = {}
+        paths = {}
+        models = {}
+        for name, workers in [("serial", 1), ("parallel", args.workers)]:
+            start = time.perf_counter()
+            models[name] = make_giin_gyosei_model(
+                args.db_path, state_size=args.state_size, workers=workers
+            )
+            times[name] = time.perf_counter() - start
+            print(f"{name} (workers={workers}): "
+                  f"{times[name]:.1f} s")
+
+            os.mkdir(os.path.join(tmp_dir, name))
+            paths[name] = save_models(*models[name],
+                                      os.path.join(tmp_dir, name))
+
+        for serial_path, parallel_path in zip(paths["serial"],
+                                              paths["parallel"]):
+            identical = filecmp.cmp(serial_path, parallel_path, shallow=False)
+            print(f"{os.path.basename(serial_path)}: "
+                  f"{'identical' if identical else 'DIFFERENT'}")
+    print(f"Speedup: {times['serial'] / times['parallel']:.2f}x")
+
+def bench_pool(args):
+    """ make_sentence/sec in this process and in the generation pool. """
+    from genpool import GenerationPool
+    from modelreg import ModelRegistry, load_model
+
+    registry = ModelRegistry(load_model, interval=0)
+    for path in args.models:
+        registry.register(path, path.rsplit(".", 1)[0])
+        loaded = registry.get(path)
+        kwargs = {"test_output": False, "allowed_output_regex": None}
+
+        sentences = measure(lambda: loaded.model.make_sentence(**kwargs),
+                            args.number)
+        print(f"{loaded.path} (in process): make_sentence {sentences:,.0f}/s")
+
+        pool = GenerationPool(args.workers)
+        # Start the workers and load the model in them
+        list(pool.map(path, loaded, "make_sentence", args.workers, **kwargs))
+        start = time.perf_counter()
+        list(pool.map(path, loaded, "make_sentence", args.number, **kwargs))
+        sentences = args.number / (time.perf_counter() - start)
+        print(f"{loaded.path} ({args.workers} workers): "
+              f"make_sentence {sentences:,.0f}/s")
+
+def bench_tokenize(args):
+    """ Chunks/sec of MeCab: one parse per chunk without and with the cache,
+    and one parse per section by the batch API. """
+    import sqlite3
+    import txtsplit
+    from txtutils import clean_split_text
+
+    with sqlite3.connect(args.db_path) as conn:
+        rows = conn.execute("SELECT content FROM sections LIMIT ?",
+                            [args.sections]).fetchall()
+    # Chunks of each section
+    sections = [[chunk for sentence in clean_split_text(row[0])
+                 for chunk in sentence.split(" ") if chunk] for row in rows]
+    n_chunks = sum(len(chunks) for chunks in sections)
+    txtsplit.warm_up_taggers()
+
+    def run(split_chunks):
+        start = time.perf_counter()
+        for chunks in sections:
+            split_chunks(chunks)
+        return n_chunks / (time.perf_counter() - start)
+
+    uncached = run(lambda chunks: [
+        txtsplit.parse(chunk, wakati=True).strip().split(" ")
+        for chunk in chunks
+    ])
+    txtsplit.clear_morps_cache()
+    cold = run(lambda chunks: [txtsplit.split_into_morps(chunk)
+                               for chunk in chunks])
+    warm = run(lambda chunks: [txtsplit.split_into_morps(chunk)
+                               for chunk in chunks])
+    txtsplit.clear_morps_cache()
+    batch = run(txtsplit.split_chunks_into_morps)
+    print(f"{len(sections):,} sections, {n_chunks:,} chunks")
+    print(f"uncached: {uncached:,.0f} chunks/s")
+    print(f"cached (cold): {cold:,.0f} chunks/s")
+    print(f"cached (warm): {warm:,.0f} chunks/s")
+    print(f"batch: {batch:,.0f} chunks/s")
+
+def bench_tagger(args):
+    """ Chunks/sec of MeCab in 1, 2, 4, ... threads, each of which borrows a
+    tagger from the pool of `txtsplit` while parsing. """
+    import concurrent.futures
+    import sqlite3
+    import txtsplit
+    from txtutils import clean_split_text
+
+    with sqlite3.connect(args.db_path) as conn:
+        rows = conn.execute("SELECT content FROM sections LIMIT ?",
+                            [args.sections]).fetchall()
+    chunks = [chunk for row in rows for sentence in clean_split_text(row[0])
+              for chunk in sentence.split(" ") if chunk]
+
+    def run(part):
+        for chunk in part:
+            txtsplit.parse(chunk, wakati=True)
+
+    threads = 1
+    while threads <= args.threads:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            # Create as many taggers as threads (up to the pool size)
+            txtsplit.warm_up_taggers(threads)
+            start = time.perf_counter()
+            list(executor.map(run, [chunks[i::threads]
+                                    for i in range(threads)]))
+            elapsed = time.perf_counter() - start
+        print(f"{threads} threads: {len(chunks) / elapsed:,.0f} chunks/s")
+        threads *= 2
+
+def bench_preprocess(args):
+    """ Sentences/sec (in total and per core) of cleaning and splitting
+    sections into words in 1 and --workers processes. """
+    import sqlite3
+    from preproc import iter_parsed_texts
+
+    with sqlite3.connect(args.db_path) as conn:
+        texts = [row[0] for row in conn.execute(
+            "SELECT content FROM sections LIMIT ?", [args.sections]
+        )]
+
+    for name, workers in [("serial", 1), ("parallel", args.workers)]:
+        start = time.perf_counter()
+        results = list(iter_parsed_texts(texts, workers))
+        elapsed = time.perf_counter() - start
+        n_sentences = sum(len(runs) for runs in results)
+        cores = min(workers, os.cpu_count())
+        print(f"{name} (workers={workers}): "
+              f"{n_sentences / elapsed:,.0f} sentences/s, "
+              f"{n_sentences / elapsed / cores:,.0f} sentences/s per core")
+        if name == "serial":
+            expected = results
+        else:
+            print(f"Identical results: {results == expected}")
+
+def bench_tokcache(args):
+    """ Seconds of the full and incremental updates of the token cache, and
+    sections/sec of reading parsed sentences as JSON and from the cache. """
+    import sqlite3
+    import tokcache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "resource.sqlite3")
+        with sqlite3.connect(args.db_path) as src, \
+             sqlite3.connect(db_path) as dst:
+            dst.execute("CREATE TABLE sections (type INTEGER, content TEXT, "
+                        "parsed_sentences TEXT)")
+            dst.executemany("INSERT INTO sections VALUES (?, ?, ?)", src.execute(
+                "SELECT type, content, parsed_sentences FROM sections "
+                "ORDER BY rowid LIMIT ?", [args.sections]
+            ))
+
+        for name in ["full", "unchanged"]:
+            start = time.perf_counter()
+            n_tokenized = tokcache.update_token_cache(db_path,
+                                                      workers=args.workers)
+            print(f"{name} update: {time.perf_counter() - start:.2f} s "
+                  f"({n_tokenized} sections tokenized)")
+
+        with sqlite3.connect(db_path) as conn:
+            # Change 1% of the sections
+            conn.execute("UPDATE sections SET content = content || '。' "
+                         "WHERE rowid % 100 = 0")
+        start = time.perf_counter()
+        n_tokenized = tokcache.update_token_cache(db_path,
+                                                  workers=args.workers)
+        print(f"1% changed update: {time.perf_counter() - start:.2f} s "
+              f"({n_tokenized} sections tokenized)")
+
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT parsed_sentences, tokens FROM sections JOIN "
+                f"{tokcache.CACHE_TABLE} ON section_rowid = sections.rowid"
+            ).fetchall()
+            start = time.perf_counter()
+            words = tokcache.load_vocab(conn.cursor())
+            decoded = [tokcache.decode_runs(row[1], words) for row in rows]
+            cache_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        [json.loads(row[0]) for row in rows if row[0]]
+        json_elapsed = time.perf_counter() - start
+        print(f"json: {len(rows) / json_elapsed:,.0f} sections/s "
+              f"({sum(len(row[0].encode()) for row in rows if row[0]) / 1e6:.1f}"
+              " MB)")
+        print(f"cache: {len(rows) / cache_elapsed:,.0f} sections/s "
+              f"({sum(len(row[1]) for row in rows) / 1e6:.1f} MB, "
+              f"{sum(len(runs) for runs in decoded)} sentences)")
+
+def bench_clean(args):
+    """ MB/s of clean_split_text() with the fused CLEAN_TEXT_SUBS
+    (clean_text()) and with the substitutions applied one by one. """
+    import sqlite3
+    from txtutils import CLEAN_TEXT_SUBS, clean_split_text
+
+    with sqlite3.connect(args.db_path) as conn:
+        texts = [row[0] for row in conn.execute(
+            "SELECT content FROM sections LIMIT ?", [args.sections]
+        )]
+    megabytes = sum(len(text.encode()) for text in texts) / 1e6
+
+    # A copy of `CLEAN_TEXT_SUBS` is applied one by one
+    for name, subs in [("cascade", list(CLEAN_TEXT_SUBS)),
+                       ("fused", CLEAN_TEXT_SUBS)]:
+        start = time.perf_counter()
+        results = [clean_split_text(text, subs=subs) for text in texts]
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {megabytes / elapsed:.2f} MB/s")
+        if name == "cascade":
+            expected = results
+        else:
+            print(f"Identical results: {results == expected}")
+
+def bench_parens(args):
+    """ Seconds of tear_paren_contents() on pathological inputs, in one scan
+    and by the regular expression loop. """
+    import txtutils
+
+    n = args.size
+    inputs = {
+        "many": "".join(f"ほげ(注{i}ふが)foo " for i in range(n)),
+        "nested": "".join(f"ほげ{i}(" for i in range(n)) + "もげ"
+                  + "".join(f")ふが{i}" for i in reversed(range(n))),
+        "chained": "".join(f"({i}" for i in range(n)) + ")" * n,
+    }
+    invalid_reptns = txtutils.INVALID_PAREN_CONTENTS
+    for name, text in inputs.items():
+        results = []
+        for func in [txtutils._tear_parens_in_one_scan,
+                     txtutils._tear_parens_by_regex]:
+            contents = []
+            start = time.perf_counter()
+            torn = func(text, "(", ")", invalid_reptns, contents)
+            elapsed = time.perf_counter() - start
+            results.append((torn, contents))
+            print(f"{name} ({len(text):,} chars) {func.__name__}: "
+                  f"{elapsed:.3f} s")
+        print(f"Identical results: {results[0] == results[1]}")
+
+def bench_join(args):
+    """ Sentences/sec of join_chunks() in one pass and by the previous loop of
+    regular expression passes, and of join_chunks_bulk(). """
+    from txtutils import (SPACE_BETWEEN_FULLWIDTH_REPTN, join_chunks,
+                          join_chunks_bulk)
+
+    def join_chunks_by_loop(chunks):
+        text = " ".join(chunks)
+        while True:
+            text, n = SPACE_BETWEEN_FULLWIDTH_REPTN.subn(r"\1\2", text)
+            if n == 0:
+                return text
+
+    import sqlite3
+
+    with sqlite3.connect(args.db_path) as conn:
+        runs = []
+        for row in conn.execute("SELECT parsed_sentences FROM sections"):
+            runs += json.loads(row[0])
+            if len(runs) >= args.number:
+                break
+    runs = runs[:args.number]
+    for name, func in [("loop", lambda: [join_chunks_by_loop(run)
+                                         for run in runs]),
+                       ("one pass", lambda: [join_chunks(run)
+                                             for run in runs]),
+                       ("bulk", lambda: join_chunks_bulk(runs))]:
+        start = time.perf_counter()
+        joined = func()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {len(runs) / elapsed:,.0f} sentences/s")
+        if name == "loop":
+            expected = joined
+        else:
+            print(f"Identical results: {joined == expected}")
+
+def bench_syntax(args):
+    """ Checks/sec of co-occurrence expressions by the compiled
+    SyntaxChecker and by searching the patterns one by one. """
+    import sqlite3
+    from txtutils import (CO_EXPS, check_co_exps_exist,
+                          check_co_exps_fulfilled)
+
+    with sqlite3.connect(args.db_path) as conn:
+        runs = []
+        for row in conn.execute("SELECT parsed_sentences FROM sections"):
+            runs += json.loads(row[0])
+            if len(runs) >= args.number:
+                break
+    runs = runs[:args.number]
+
+    # A copy of `CO_EXPS` is searched one by one
+    for name, co_exps in [("one by one", list(CO_EXPS)),
+                          ("compiled", CO_EXPS)]:
+        start = time.perf_counter()
+        results = [(check_co_exps_exist(run, co_exps=co_exps),
+                    check_co_exps_fulfilled(run, co_exps=co_exps))
+                   for run in runs]
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {len(runs) / elapsed:,.0f} checks/s")
+        if name == "one by one":
+            expected = results
+        else:
+            print(f"Identical results: {results == expected}")
+
+def bench_snippet(args):
+    """ Hits/sec of the snippets of /search cut out from the search index by
+    SQLite, and made from the whole parsed sentences of each hit. """
+    import sqlite3
+    import searchidx
+
+    with sqlite3.connect(args.db_path) as conn:
+        if not searchidx.has_search_index(conn.cursor()):
+            sys.exit("The search index has not been built (run searchidx.py).")
+        kws = [row[0] for row in conn.execute(
+            f"SELECT morp FROM {searchidx.POSTINGS_TABLE} GROUP BY morp "
+            "ORDER BY COUNT(*) DESC LIMIT ?", [args.number]
+        )]
+
+        hits = 0
+        start = time.perf_counter()
+        for kw in kws:
+            for position, window, length in conn.execute(
+                f"SELECT position, substr(text, position + 1, ?), "
+                f"length(text) FROM {searchidx.POSTINGS_TABLE} JOIN "
+                f"{searchidx.TEXTS_TABLE} USING (section_rowid) "
+                "WHERE morp = ? LIMIT ?", [searchidx.SNIPPET_CHARS, kw,
+                                           args.fetch_items]
+            ):
+                searchidx.make_snippet(window, [kw], position, length)
+                hits += 1
+        print(f"index: {hits / (time.perf_counter() - start):,.0f} hits/s")
+
+        hits = 0
+        start = time.perf_counter()
+        for kw in kws:
+            for (parsed_sentences,) in conn.execute(
+                f"SELECT parsed_sentences FROM sections WHERE rowid IN "
+                f"(SELECT section_rowid FROM {searchidx.POSTINGS_TABLE} "
+                "WHERE morp = ? LIMIT ?)", [kw, args.fetch_items]
+            ):
+                text = searchidx.joined_text(json.loads(parsed_sentences))
+                position = text.index(kw)
+                searchidx.make_snippet(
+                    text[position:position + searchidx.SNIPPET_CHARS], [kw],
+                    position, len(text)
+                )
+                hits += 1
+        print(f"whole sections: "
+              f"{hits / (time.perf_counter() - start):,.0f} hits/s")
+
+# Run in a new process by `bench_startup()`
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.post("/councils", json={"fetchItems": 1, "fetchOffset": 0})
+councils = time.perf_counter()
+client.post("/generate", json={"model": "giin", "prompt": "", "wakachi": False})
+generated = time.perf_counter()
+print(imported - start, councils - start, generated - start)
+"""
+
+def bench_startup(args):
+    """ Seconds from the start of importing app.py until it is imported, and
+    until the first responses of /councils and /generate. """
+    for warm_up in [False, True]:
+        env = dict(os.environ, FLASK_WARM_UP="true" if warm_up else "false")
+        times = []
+        for _ in range(args.number):
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT],
+                                    env=env, capture_output=True, text=True,
+                                    check=True).stdout
+            times.append([float(t) for t in output.split()[-3:]])
+        imported, councils, generated = [min(ts) for ts in zip(*times)]
+        print(f"WARM_UP={warm_up}: imported in {imported:.3f} s, "
+              f"/councils in {councils:.3f} s, /generate in {generated:.3f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    chain_parser = subparsers.add_parser("chain", help=bench_chain.__doc__)
+    chain_parser.add_argument(
+        "models", nargs="*",
+        default=["giin_model_state4.json", "gyosei_model_state4.json"]
+    )
+    chain_parser.add_argument("-n", "--number", type=int, default=10000)
+    chain_parser.add_argument("--seed", type=int, default=0)
+    chain_parser.set_defaults(func=bench_chain)
+
+    novelty_parser = subparsers.add_parser("novelty",
+                                           help=bench_novelty.__doc__)
+    novelty_parser.add_argument(
+        "models", nargs="*",
+        default=["giin_model_state4.json", "gyosei_model_state4.json"]
+    )
+    novelty_parser.add_argument("-n", "--number", type=int, default=1000)
+    novelty_parser.add_argument("--seed", type=int, default=0)
+    novelty_parser.set_defaults(func=bench_novelty)
+
+    length_parser = subparsers.add_parser("length", help=bench_length.__doc__)
+    length_parser.add_argument(
+        "models", nargs="*",
+        default=["giin_model_state4.json", "gyosei_model_state4.json"]
+    )
+    length_parser.add_argument("-n", "--number", type=int, default=10000)
+    length_parser.add_argument("--min-words", type=int)
+    length_parser.add_argument("--max-words", type=int)
+    length_parser.add_argument("--seed", type=int, default=0)
+    length_parser.set_defaults(func=bench_length)
+
+    build_parser = subparsers.add_parser("build", help=bench_build.__doc__)
+    build_parser.add_argument("db_path", nargs="?",
+                              default="./resource.sqlite3")
+    build_parser.add_argument("--state-size", type=int, default=4)
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    build_parser.set_defaults(func=bench_build)
+
+    startup_parser = subparsers.add_parser("startup",
+                                           help=bench_startup.__doc__)
+    startup_parser.add_argument("-n", "--number", type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+
+    pool_parser = subparsers.add_parser("pool", help=bench_pool.__doc__)
+    pool_parser.add_argument(
+        "models", nargs="*",
+        default=["giin_model_state4.bin", "gyosei_model_state4.bin"]
+    )
+    pool_parser.add_argument("-n", "--number", type=int, default=10000)
+    pool_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    pool_parser.set_defaults(func=bench_pool)
+
+    tokenize_parser = subparsers.add_parser("tokenize",
+                                            help=bench_tokenize.__doc__)
+    tokenize_parser.add_argument("db_path", nargs="?",
+                                 default="./resource.sqlite3")
+    tokenize_parser.add_argument("--sections", type=int, default=1000)
+    tokenize_parser.set_defaults(func=bench_tokenize)
+
+    tagger_parser = subparsers.add_parser("tagger", help=bench_tagger.__doc__)
+    tagger_parser.add_argument("db_path", nargs="?",
+                               default="./resource.sqlite3")
+    tagger_parser.add_argument("--sections", type=int, default=1000)
+    tagger_parser.add_argument("--threads", type=int,
+                               default=os.cpu_count() * 2)
+    tagger_parser.set_defaults(func=bench_tagger)
+
+    preprocess_parser = subparsers.add_parser(
+        "preprocess", help=bench_preprocess.__doc__
+    )
+    preprocess_parser.add_argument("db_path", nargs="?",
+                                   default="./resource.sqlite3")
+    preprocess_parser.add_argument("--sections", type=int, default=1000)
+    preprocess_parser.add_argument("--workers", type=int,
+                                   default=os.cpu_count())
+    preprocess_parser.set_defaults(func=bench_preprocess)
+
+    tokcache_parser = subparsers.add_parser("tokcache",
+                                            help=bench_tokcache.__doc__)
+    tokcache_parser.add_argument("db_path", nargs="?",
+                                 default="./resource.sqlite3")
+    tokcache_parser.add_argument("--sections", type=int, default=10000)
+    tokcache_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    tokcache_parser.set_defaults(func=bench_tokcache)
+
+    clean_parser = subparsers.add_parser("clean", help=bench_clean.__doc__)
+    clean_parser.add_argument("db_path", nargs="?",
+                              default="./resource.sqlite3")
+    clean_parser.add_argument("--sections", type=int, default=10000)
+    clean_parser.set_defaults(func=bench_clean)
+
+    parens_parser = subparsers.add_parser("parens", help=bench_parens.__doc__)
+    parens_parser.add_argument("--size", type=int, default=2000)
+    parens_parser.set_defaults(func=bench_parens)
+
+    join_parser = subparsers.add_parser("join", help=bench_join.__doc__)
+    join_parser.add_argument("db_path", nargs="?",
+                             default="./resource.sqlite3")
+    join_parser.add_argument("-n", "--number", type=int, default=100000)
+    join_parser.set_defaults(func=bench_join)
+
+    syntax_parser = subparsers.add_parser("syntax", help=bench_syntax.__doc__)
+    syntax_parser.add_argument("db_path", nargs="?",
+                               default="./resource.sqlite3")
+    syntax_parser.add_argument("-n", "--number", type=int, default=100000)
+    syntax_parser.set_defaults(func=bench_syntax)
+
+    snippet_parser = subparsers.add_parser("snippet",
+                                           help=bench_snippet.__doc__)
+    snippet_parser.add_argument("db_path", nargs="?",
+                                default="./resource.sqlite3")
+    snippet_parser.add_argument("-n", "--number", type=int, default=100,
+                                help="number of keywords")
+    snippet_parser.add_argument("--fetch-items", type=int, default=100)
+    snippet_parser.set_defaults(func=bench_snippet)
+
+    args = parser.parse_args()
+    args.func(args)
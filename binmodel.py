@@ -0,0 +1,332 @@
+import array
+import collections.abc
+import json
+import mmap
+import os
+import struct
+import sys
+
+from intchain import FlatChain, IntChain
+from novelty import NoveltyIndex
+from stateidx import StatePrefixIndex
+
+# Binary model file format
+# ------------------------
+# header:    magic "JPTB", format version, byte order ("<" or ">"), state size,
+#            number of sections
+# directory: `(name, offset, size)` of each section
+# sections:  8-byte aligned arrays in the native byte order of the writer
+#   "wordoffs": uint32[n_words + 1]  Byte offsets of words in "words"
+#   "words":    UTF-8                Vocabulary (word ID -> word)
+#   "states":   uint32[n_states * state_size]  Word IDs of states
+#   "offsets":  uint32[n_states + 1] State -> offset of its transitions
+#   "nextids":  uint32[n_trans]      Word IDs of following words
+#   "nextsts":  uint32[n_trans]      Successor states of transitions
+#   "cumwts":   float64[n_trans]     Cumulative weights of transitions
+#   "slots":    uint32[n_slots]      Open addressing hash table of states
+#                                    (state index + 1, or 0 if empty)
+#   "lenmasks": uint64[n_states]     Numbers of words each state can emit
+#                                    before `END` (see `intchain.py`)
+#   "prefixix": uint32[n_states]     States sorted by their words without
+#                                    `BEGIN`s (see `stateidx.py`)
+#   "bands":    float32[n_tables * n_states]  Probabilities of ending within
+#                                    bands of lengths (optional, see
+#                                    `intchain.compute_band_probabilities()`),
+#                                    listed in "bands" of "meta"
+#   "meta":     UTF-8                JSON object of metadata
+#   "text":     UTF-8                Rejoined text of the corpus (optional)
+# and, if the model has a novelty index (see `novelty.py`),
+#   "nvwdoffs": uint32[n_words + 1]  Byte offsets of words in "nvwords"
+#   "nvwords":  UTF-8                Vocabulary of the novelty index
+#   "nvcorpus": uint32[n_tokens]     Word IDs of the corpus
+#   "nvsuffix": uint32[n_suffixes]   Suffix array of the corpus
+MAGIC = b"JPTB"
+VERSION = 1
+_HEADER = struct.Struct("=4sHcxII")
+_SECTION = struct.Struct("=8sQQ")
+_ALIGN = 8
+
+_FNV_OFFSET = 0xcbf29ce484222325
+_FNV_PRIME = 0x100000001b3
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+def _hash_ids(ids):
+    """ FNV-1a hash of a sequence of word IDs. """
+    h = _FNV_OFFSET
+    for i in ids:
+        h = ((h ^ i) * _FNV_PRIME) & _MASK64
+    return h
+
+def build_state_slots(states, state_size: int):
+    """ Builds the open addressing hash table (load factor <= 0.5) of states.
+
+    Args:
+        states: Flat sequence of word IDs of states.
+        state_size: Number of words in a state.
+
+    Return:
+        array: uint32 array of state indices + 1 (0 for empty slots).
+    """
+    n_states = len(states) // state_size
+    n_slots = 1
+    while n_slots < n_states * 2:
+        n_slots <<= 1
+    mask = n_slots - 1
+
+    slots = array.array("I", bytes(4 * n_slots))
+    for state_no in range(n_states):
+        slot = _hash_ids(
+            states[state_no * state_size : (state_no + 1) * state_size]
+        ) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = state_no + 1
+    return slots
+
+class MappedWords(collections.abc.Sequence):
+    """ Vocabulary (word ID -> word) decoded on demand from a UTF-8 buffer. """
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return str(self._blob[self._offsets[i] : self._offsets[i + 1]], "utf-8")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+class MappedText:
+    """ UTF-8 text in a memory-mapped file, supporting `substring in text`
+    without decoding the whole text. """
+    def __init__(self, buffer, start: int, end: int):
+        self._buffer = buffer
+        self._start = start
+        self._end = end
+
+    def __contains__(self, sub: str):
+        return self._buffer.find(sub.encode(), self._start, self._end) != -1
+
+    def __str__(self):
+        return self._buffer[self._start : self._end].decode()
+
+    def encode(self):
+        return self._buffer[self._start : self._end]
+
+class MappedChain(FlatChain):
+    """ `FlatChain` over arrays of a memory-mapped binary model file.
+
+    States are looked up in the hash table stored in the file, so nothing is
+    rebuilt in memory on load, and processes mapping the same file share its
+    physical pages.
+    """
+    def __init__(self, state_size, words, states, offsets, next_ids,
+                 next_states, cumweights, slots):
+        super().__init__(state_size, words, states, offsets, next_ids,
+                         next_states, cumweights)
+        self.slots = slots
+        self._mask = len(slots) - 1
+
+    def state_index(self, ids: tuple[int]) -> int:
+        state_size = self.state_size
+        slot = _hash_ids(ids) & self._mask
+        while True:
+            value = self.slots[slot]
+            if value == 0:
+                raise KeyError(ids)
+            base = (value - 1) * state_size
+            if tuple(self.states[base : base + state_size]) == ids:
+                return value - 1
+            slot = (slot + 1) & self._mask
+
+def _pack_words(words):
+    """ Returns a tuple `(offsets, blob)` of packed words in bytes. """
+    blobs = [word.encode() for word in words]
+    offsets = array.array("I", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return offsets.tobytes(), b"".join(blobs)
+
+def write_model(model, path: str, bands=()):
+    """ Writes a `JPText` model into the binary model file `path`.
+
+    The probabilities of the chain ending within `bands` (pairs of
+    `(min_words, max_words)`, see `FlatChain.walk_within()`) are computed and
+    stored, as well as those already computed for the chain, so that they
+    are not computed after the file is loaded.
+
+    The file is written into a temporary file and renamed to `path`, so that
+    processes which have mapped the previous file keep reading it safely.
+    """
+    chain = model.chain
+    # The chain as encoded in this file
+    flat_chain = chain if isinstance(chain, FlatChain) \
+                 else IntChain(None, model.state_size, chain.model)
+    flat = {
+        "words": flat_chain.words,
+        "states": flat_chain.states,
+        "offsets": flat_chain.offsets,
+        "next_ids": flat_chain.next_ids,
+        "next_states": flat_chain.next_states,
+        "cumweights": flat_chain.cumweights,
+    }
+
+    word_offsets, word_blob = _pack_words(flat["words"])
+    meta = {}
+
+    sections = [
+        (b"wordoffs", word_offsets),
+        (b"words", word_blob),
+        (b"states", flat["states"].tobytes()),
+        (b"offsets", flat["offsets"].tobytes()),
+        (b"nextids", flat["next_ids"].tobytes()),
+        (b"nextsts", flat["next_states"].tobytes()),
+        (b"cumwts", flat["cumweights"].tobytes()),
+        (b"slots", build_state_slots(flat["states"],
+                                     model.state_size).tobytes()),
+        (b"lenmasks", flat_chain.length_masks.tobytes()),
+    ]
+    state_prefix_index = getattr(model, "state_prefix_index", None)
+    if isinstance(chain, FlatChain) and state_prefix_index is not None:
+        sections.append((b"prefixix", state_prefix_index.order.tobytes()))
+    else:
+        sections.append((b"prefixix",
+                         StatePrefixIndex(flat_chain).order.tobytes()))
+    band_keys = [(-1 if lowest is None else lowest, highest)
+                  for lowest, highest in bands]
+    band_keys += [key for key in flat_chain._band_cache
+                  if len(key) == 2 and key not in band_keys]
+    if band_keys:
+        meta["bands"] = []
+        band_data = []
+        for lowest, highest in band_keys:
+            tables, tail = flat_chain.band_probabilities(lowest, highest)
+            meta["bands"].append([lowest, highest, len(tables), tail])
+            band_data += [table.tobytes() for table in tables]
+        sections.append((b"bands", b"".join(band_data)))
+    novelty_index = getattr(model, "novelty_index", None)
+    rejoined_text = getattr(model, "rejoined_text", None)
+    if novelty_index is not None:
+        # The rejoined text is not needed for the novelty check
+        word_offsets, word_blob = _pack_words(novelty_index.words)
+        sections += [
+            (b"nvwdoffs", word_offsets),
+            (b"nvwords", word_blob),
+            (b"nvcorpus", novelty_index.corpus.tobytes()),
+            (b"nvsuffix", novelty_index.suffixes.tobytes()),
+        ]
+        meta["novelty_depth"] = novelty_index.depth
+    elif rejoined_text is not None:
+        sections.append((b"text", rejoined_text.encode()))
+    high_water_mark = getattr(model, "high_water_mark", None)
+    if high_water_mark is not None:
+        meta["high_water_mark"] = high_water_mark
+    sections.append((b"meta", json.dumps(meta).encode()))
+
+    header = _HEADER.pack(MAGIC, VERSION, b"<" if sys.byteorder == "little"
+                          else b">", model.state_size, len(sections))
+    offset = len(header) + _SECTION.size * len(sections)
+    directory = []
+    for name, data in sections:
+        offset += -offset % _ALIGN
+        directory.append(_SECTION.pack(name, offset, len(data)))
+        offset += len(data)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(directory))
+        for name, data in sections:
+            f.write(bytes(-f.tell() % _ALIGN))
+            f.write(data)
+    os.replace(tmp_path, path)
+
+def read_model(path: str):
+    """ Maps the binary model file `path` into memory.
+
+    Return:
+        dict: `{"state_size": int, "chain": MappedChain,
+              "state_prefix_index": StatePrefixIndex,
+              "rejoined_text": MappedText | None,
+              "novelty_index": NoveltyIndex | None, "meta": dict}`.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, byteorder, state_size, n_sections = _HEADER.unpack_from(
+        buffer, 0
+    )
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a binary model file.")
+    if version != VERSION:
+        raise ValueError(
+            f"Unsupported binary model version {version} (expected {VERSION})."
+        )
+    if byteorder != (b"<" if sys.byteorder == "little" else b">"):
+        raise ValueError(f"Byte order of '{path}' differs from this machine.")
+
+    spans = {}
+    for i in range(n_sections):
+        name, offset, size = _SECTION.unpack_from(
+            buffer, _HEADER.size + _SECTION.size * i
+        )
+        spans[name.rstrip(b"\0").decode()] = (offset, offset + size)
+
+    view = memoryview(buffer)
+
+    def section(name, typecode=None):
+        start, end = spans[name]
+        return view[start:end].cast(typecode) if typecode else view[start:end]
+
+    meta = json.loads(bytes(section("meta"))) if "meta" in spans else {}
+
+    chain = MappedChain(
+        state_size,
+        MappedWords(section("wordoffs", "I"), section("words")),
+        section("states", "I"),
+        section("offsets", "I"),
+        section("nextids", "I"),
+        section("nextsts", "I"),
+        section("cumwts", "d"),
+        section("slots", "I"),
+    )
+    if "lenmasks" in spans:
+        chain.length_masks = section("lenmasks", "Q")
+    if "bands" in spans:
+        tables = section("bands", "f")
+        n_states = len(chain.offsets) - 1
+        start = 0
+        for lowest, highest, n_tables, tail in meta["bands"]:
+            chain._band_cache[(lowest, highest)] = (
+                [tables[start + n_states * j : start + n_states * (j + 1)]
+                 for j in range(n_tables)],
+                tail
+            )
+            start += n_states * n_tables
+
+    state_prefix_index = StatePrefixIndex(
+        chain, section("prefixix", "I") if "prefixix" in spans else None
+    )
+
+    rejoined_text = MappedText(buffer, *spans["text"]) if "text" in spans \
+                    else None
+
+    if "nvcorpus" in spans:
+        novelty_index = NoveltyIndex(
+            MappedWords(section("nvwdoffs", "I"), section("nvwords")),
+            section("nvcorpus", "I"),
+            section("nvsuffix", "I"),
+            meta["novelty_depth"],
+        )
+    else:
+        novelty_index = None
+
+    return {
+        "state_size": state_size,
+        "chain": chain,
+        "state_prefix_index": state_prefix_index,
+        "rejoined_text": rejoined_text,
+        "novelty_index": novelty_index,
+        "meta": meta,
+    }
@@ -0,0 +1,147 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+from modelreg import LoadedModel, file_stamp, load_model
+
+# Number of versions of a model kept in a worker process, so that requests
+# still holding the previous version after a reload do not make the worker
+# load the versions by turns
+WORKER_MODEL_VERSIONS = 2
+
+# Models loaded in a worker process: name -> {stamp: model}, the most
+# recently used last
+_worker_models = {}
+
+class ModelVersionGone(Exception):
+    """ Raised in a worker process when the version of a model asked for is
+    not loaded in the worker, and the model file has been replaced with
+    another version. """
+
+def _call_in_worker(name: str, path: str, stamp: tuple, method: str, args,
+                    kwargs):
+    """ Calls a method of the version `stamp` of the model in a worker
+    process, loading it from `path` if the worker has not loaded it yet. """
+    versions = _worker_models.setdefault(name, {})
+    model = versions.pop(stamp, None)
+    if model is None:
+        # Checked before and after loading, since the file can be replaced
+        # at any time
+        if file_stamp(path) != stamp:
+            raise ModelVersionGone(f"Model '{name}' has been replaced.")
+        model = load_model(path)
+        if file_stamp(path) != stamp:
+            raise ModelVersionGone(f"Model '{name}' has been replaced.")
+    versions[stamp] = model
+    while len(versions) > WORKER_MODEL_VERSIONS:
+        del versions[next(iter(versions))]
+    return getattr(model, method)(*args, **kwargs)
+
+class GenerationPool:
+    """ Pool of worker processes calling methods of models, e.g.
+    `make_sentence()`, to use all cores for the generation, which holds the
+    GIL in a process.
+
+    Each worker loads the models by itself from the model files, on the first
+    call for a version of a model (see `modelreg.ModelRegistry`), and keeps
+    the last `WORKER_MODEL_VERSIONS` versions used. A call is run with the
+    version passed to it, even if the file has been reloaded since. If the
+    worker has not loaded the version and the file has already been replaced,
+    the call is run in this process with the model passed instead. Binary
+    model files are memory-mapped, so all the workers share the physical pages
+    of a model. JSON model files are loaded as a copy in each worker instead.
+
+    A call that has timed out is not stopped if it is already running
+    (`Future.cancel()` only removes calls waiting in the queue), and keeps the
+    worker busy until it returns, e.g. until `make_sentence()` runs out of
+    `tries`.
+
+    Workers are started with the "spawn" method (on first use in each
+    process), since forking a process running threads is unsafe.
+
+    Args:
+        workers: Number of worker processes.
+        timeout: Default seconds to wait for a result. None waits forever.
+
+    Example:
+        ```
+        >>> pool = GenerationPool(4, timeout=10)
+        >>> pool.call("giin", registry.get("giin"), "make_sentence", tries=10)
+        {"sentence": "...", ...}
+        ```
+    """
+    def __init__(self, workers: int, timeout: float | None = None):
+        if workers < 1:
+            raise ValueError(f"Number of workers must be positive, got "
+                             f"{workers}.")
+
+        self.workers = workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, name: str, loaded: LoadedModel, method: str, *args,
+               **kwargs):
+        """ Calls `loaded.model.<method>(*args, **kwargs)` of the model `name`
+        in a worker process, and returns a `concurrent.futures.Future`. """
+        return self._get_executor().submit(
+            _call_in_worker, name, loaded.path, loaded.stamp, method, args,
+            kwargs
+        )
+
+    def _result(self, future, timeout: float | None, loaded: LoadedModel,
+                method: str, args, kwargs):
+        try:
+            return future.result(timeout)
+        except ModelVersionGone:
+            return getattr(loaded.model, method)(*args, **kwargs)
+
+    def call(self, name: str, loaded: LoadedModel, method: str, *args,
+             **kwargs):
+        """ Calls the method in a worker process (see `submit()`) and returns
+        the result. Raises `concurrent.futures.TimeoutError` if it takes more
+        than `timeout` seconds (the call keeps running if it has started), or
+        the exception raised by the method. """
+        future = self.submit(name, loaded, method, *args, **kwargs)
+        try:
+            return self._result(future, self.timeout, loaded, method, args,
+                                kwargs)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def map(self, name: str, loaded: LoadedModel, method: str, count: int,
+            *args, **kwargs):
+        """ Calls the method `count` times in worker processes, and yields the
+        results in order. Raises `concurrent.futures.TimeoutError` if all the
+        results are not ready in `timeout` seconds (the calls which have
+        started keep running). """
+        futures = [self.submit(name, loaded, method, *args, **kwargs)
+                   for _ in range(count)]
+        deadline = None if self.timeout is None \
+                   else time.monotonic() + self.timeout
+        try:
+            for future in futures:
+                yield self._result(
+                    future,
+                    None if deadline is None
+                    else max(deadline - time.monotonic(), 0),
+                    loaded, method, args, kwargs
+                )
+        finally:
+            # Not to be run when the results are not needed any more
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,637 @@
+import abc
+import array
+import bisect
+import collections
+import collections.abc
+import functools
+import json
+import math
+import operator
+import random
+import threading
+
+from markovify.chain import BEGIN, END
+
+# Word IDs reserved for the markovify sentinels.
+BEGIN_ID, END_ID = 0, 1
+# Successor of a transition to `END`, i.e. no state.
+NO_STATE = 0xFFFFFFFF
+# Out-degree of a state above which `FlatChain.walk_within()` caches the
+# cumulative weights of its transitions (e.g. the `BEGIN` state)
+BAND_CACHE_MIN_DEGREE = 64
+# Largest bound of the number of words whose probabilities are computed (see
+# `compute_band_probabilities()`), each of which takes a table of the states
+MAX_BAND_WORDS = 128
+# Held while probabilities of a band are computed (see
+# `FlatChain.band_probabilities()`), so that they are computed once
+_band_lock = threading.Lock()
+# Bits of length masks (see `compute_length_masks()`). The top bit stands for
+# all lengths >= `LENGTH_MASK_BITS - 1`.
+LENGTH_MASK_BITS = 64
+_LENGTH_MASK_ALL = (1 << LENGTH_MASK_BITS) - 1
+_LENGTH_MASK_TOP = 1 << (LENGTH_MASK_BITS - 1)
+
+class Vocabulary:
+    """ Interning table of words. IDs are assigned in order of appearance,
+    after the reserved IDs of `BEGIN` and `END`. """
+    def __init__(self):
+        self.words = [BEGIN, END]
+        self.word_ids = {BEGIN: BEGIN_ID, END: END_ID}
+
+    def __len__(self):
+        return len(self.words)
+
+    def intern(self, word: str) -> int:
+        """ Returns the ID of `word`, assigning a new one if unknown. """
+        try:
+            return self.word_ids[word]
+        except KeyError:
+            self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            return self.word_ids[word]
+
+def count_transitions(corpus, state_size: int, vocab: Vocabulary | None = None):
+    """ Counts transitions of runs in the same way as `markovify.Chain.build()`,
+    but with states as tuples of word IDs.
+
+    Args:
+        corpus: Iterable of runs (lists of words).
+        state_size: Number of words in a state.
+        vocab: `Vocabulary` to intern words. A new one is made if None.
+
+    Return:
+        tuple: `(vocab, model)`. `model` is a dict
+               `{state of word IDs: {next word ID: count}}`.
+    """
+    if vocab is None:
+        vocab = Vocabulary()
+    intern = vocab.intern
+    model = count_id_transitions(
+        ([intern(word) for word in run] for run in corpus), state_size
+    )
+    return vocab, model
+
+def count_id_transitions(corpus, state_size: int, model: dict | None = None):
+    """ Counts transitions of runs of word IDs (see `count_transitions()`).
+
+    Args:
+        corpus: Iterable of runs (lists of word IDs).
+        state_size: Number of words in a state.
+        model: Dict of counts to be added to. A new one is made if None.
+
+    Return:
+        dict: `{state of word IDs: {next word ID: count}}`.
+    """
+    if model is None:
+        model = {}
+    begin = (BEGIN_ID,) * state_size
+
+    for run in corpus:
+        state = begin
+        for next_id in run + [END_ID]:
+            follows = model.get(state)
+            if follows is None:
+                follows = model[state] = {}
+            follows[next_id] = follows.get(next_id, 0) + 1
+            state = state[1:] + (next_id,)
+
+    return model
+
+def encode_model(model: dict, vocab: Vocabulary | None = None):
+    """ Encodes a markovify chain model into a model of word IDs.
+
+    Args:
+        model: `markovify.Chain.model`, i.e. a dict
+               `{state: {next word: weight}}` (or
+               `{state: [next words, cumulative weights]}` if compiled).
+        vocab: `Vocabulary` to intern words. A new one is made if None.
+
+    Return:
+        tuple: `(vocab, model)`. `model` is a dict
+               `{state of word IDs: {next word ID: weight}}`.
+    """
+    if vocab is None:
+        vocab = Vocabulary()
+    intern = vocab.intern
+
+    id_model = {}
+    for state, follows in model.items():
+        if type(follows) is list:  # Compiled chain
+            follow_words, cumdist = follows
+            weights = [cum - prev for cum, prev
+                       in zip(cumdist, [0] + cumdist[:-1])]
+        else:
+            follow_words, weights = follows.keys(), follows.values()
+        id_model[tuple(intern(word) for word in state)] = {
+            intern(word): weight for word, weight in zip(follow_words, weights)
+        }
+
+    return vocab, id_model
+
+def flatten_id_model(model: dict, words: list[str], state_size: int):
+    """ Lays out a model of word IDs (see `count_transitions()`) in flat
+    arrays.
+
+    States and their following words keep the insertion order of `model`, so
+    that a `FlatChain` consumes random numbers exactly like `markovify.Chain`.
+
+    Return:
+        dict: `{"words": list[str], "states": array, "offsets": array,
+              "next_ids": array, "next_states": array, "cumweights": array}`.
+              Transitions of the state `i` are at
+              `offsets[i]:offsets[i + 1]` of `next_ids`, `next_states` and
+              `cumweights`.
+    """
+    state_index = {state: i for i, state in enumerate(model)}
+
+    states = array.array("I")
+    offsets = array.array("I", [0])
+    next_ids = array.array("I")
+    next_states = array.array("I")
+    cumweights = array.array("d")
+    for state, follows in model.items():
+        states.extend(state)
+        tail = state[1:]
+        cum = 0
+        for next_id, weight in follows.items():
+            cum += weight
+            next_ids.append(next_id)
+            next_states.append(
+                NO_STATE if next_id == END_ID
+                else state_index.get(tail + (next_id,), NO_STATE)
+            )
+            cumweights.append(cum)
+        offsets.append(len(next_ids))
+
+    return {
+        "words": words,
+        "states": states,
+        "offsets": offsets,
+        "next_ids": next_ids,
+        "next_states": next_states,
+        "cumweights": cumweights,
+    }
+
+def _accumulate(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+def flatten_model(model: dict, state_size: int):
+    """ Encodes a markovify chain model into integer IDs and flat arrays.
+    See `encode_model()` and `flatten_id_model()`. """
+    vocab, id_model = encode_model(model)
+    return flatten_id_model(id_model, vocab.words, state_size)
+
+def compute_length_masks(chain):
+    """ Computes which numbers of words each state of a `FlatChain` can emit
+    before reaching `END`.
+
+    The bit k of the mask of a state is set if a walk from the state can
+    reach `END` after exactly k more words (the top bit: k or more words).
+    Masks are propagated backwards from the states having a transition to
+    `END`, through a reverse adjacency list of the states, until no mask
+    changes.
+
+    Return:
+        array: uint64 array of the masks of the states.
+    """
+    offsets, next_ids, next_states = \
+        chain.offsets, chain.next_ids, chain.next_states
+    n_states = len(offsets) - 1
+
+    # Predecessors of each state (CSR)
+    pred_offsets = [0] * (n_states + 1)
+    for t in next_states:
+        if t != NO_STATE:
+            pred_offsets[t + 1] += 1
+    for state_no in range(n_states):
+        pred_offsets[state_no + 1] += pred_offsets[state_no]
+    preds = array.array("I", bytes(4 * pred_offsets[-1]))
+    cursor = pred_offsets[:-1]
+    for state_no in range(n_states):
+        for i in range(offsets[state_no], offsets[state_no + 1]):
+            t = next_states[i]
+            if t != NO_STATE:
+                preds[cursor[t]] = state_no
+                cursor[t] += 1
+
+    masks = [0] * n_states
+    queued = bytearray(n_states)
+    worklist = collections.deque()
+    for state_no in range(n_states):
+        for i in range(offsets[state_no], offsets[state_no + 1]):
+            if next_ids[i] == END_ID:
+                worklist.append(state_no)
+                queued[state_no] = 1
+                break
+
+    while worklist:
+        state_no = worklist.popleft()
+        queued[state_no] = 0
+
+        mask = 0
+        for i in range(offsets[state_no], offsets[state_no + 1]):
+            t = next_states[i]
+            if next_ids[i] == END_ID:
+                mask |= 1
+            elif t != NO_STATE:
+                mask |= ((masks[t] << 1) & _LENGTH_MASK_ALL) | \
+                        (masks[t] & _LENGTH_MASK_TOP)
+
+        if mask != masks[state_no]:
+            masks[state_no] = mask
+            for pred in preds[pred_offsets[state_no] :
+                              pred_offsets[state_no + 1]]:
+                if not queued[pred]:
+                    queued[pred] = 1
+                    worklist.append(pred)
+
+    return array.array("Q", masks)
+
+def compute_band_probabilities(chain, lowest: int, highest: int | None):
+    """ Computes the probability that a walk of a `FlatChain` ends with a
+    length `c` such that `lowest < c < highest` (or `lowest < c` if highest is
+    None).
+
+    The probability `f_j(s)` for a walk at the state `s` after `j` words is
+    the sum of the probabilities of the transitions of `s`, each multiplied by
+    whether `j` is within the bounds for `END`, or by `f_{j+1}` of its
+    successor. It is computed backwards from the largest `j` whose
+    probabilities are not all the same, i.e. `highest - 1` (0 beyond it), or
+    `lowest` if highest is None (1 beyond it, as all walks end). `highest` is
+    capped at the longest run the chain can make (see `max_run_length()`),
+    so no probabilities are computed for unreachable lengths. Raises
+    `ValueError` if more than `MAX_BAND_WORDS` tables are still needed.
+
+    Return:
+        tuple[list[array], float]: Probabilities `f_j` of the states (float32
+                                   arrays) for j = 0, 1, ..., and the
+                                   probability for all states beyond them.
+    """
+    offsets, cumweights = chain.offsets, chain.cumweights
+    next_ids, next_states = chain.next_ids, chain.next_states
+    n_states = len(offsets) - 1
+
+    longest = max_run_length(chain)
+    if longest is not None:
+        if lowest >= longest:
+            return [], 0.0
+        if highest is None or highest > longest + 1:
+            highest = longest + 1
+
+    if highest is None:
+        last_j, tail = lowest, 1.0
+    else:
+        last_j, tail = highest - 1, 0.0
+    if last_j < 0:
+        return [], tail
+    if last_j >= MAX_BAND_WORDS:
+        raise ValueError(f"Bounds of the number of words must be at most "
+                         f"{MAX_BAND_WORDS}, got ({lowest}, {highest}).")
+
+    # Probability of each transition, and the index of its successor in
+    # `f_{j+1} + [f of END, 0.0]`
+    probs = array.array("d", bytes(8 * len(next_ids)))
+    targets = array.array("I", bytes(4 * len(next_ids)))
+    for state_no in range(n_states):
+        lo, hi = offsets[state_no], offsets[state_no + 1]
+        total = cumweights[hi - 1]
+        prev = 0
+        for i in range(lo, hi):
+            probs[i] = (cumweights[i] - prev) / total
+            prev = cumweights[i]
+            if next_ids[i] == END_ID:
+                targets[i] = n_states
+            elif next_states[i] == NO_STATE:
+                targets[i] = n_states + 1
+            else:
+                targets[i] = next_states[i]
+    slices = list(map(slice, offsets[:-1], offsets[1:]))
+
+    tables = [None] * (last_j + 1)
+    following = [tail] * n_states
+    for j in range(last_j, -1, -1):
+        end_ok = lowest < j and (highest is None or j < highest)
+        following += [1.0 if end_ok else 0.0, 0.0]
+        contributions = list(map(operator.mul, probs,
+                                 map(following.__getitem__, targets)))
+        # Sums of the transitions of each state, without cancellation
+        following = list(map(math.fsum,
+                             map(contributions.__getitem__, slices)))
+        tables[j] = array.array("f", following)
+    return tables, tail
+
+def max_run_length(chain):
+    """ Returns the maximum length of the runs which a `FlatChain` can make
+    from any state, including the words of the initial state, or None if it
+    has no maximum (i.e. some state can emit `LENGTH_MASK_BITS - 1` or more
+    words, see `compute_length_masks()`). """
+    masks = chain.length_masks
+    longest = max(masks, default=0)
+    if longest & _LENGTH_MASK_TOP:
+        return None
+    return longest.bit_length() - 1 + chain.state_size
+
+def length_band_mask(min_k: int, max_k: int):
+    """ Returns a length mask whose bits `min_k` to `max_k` (inclusive) are
+    set, where the top bit stands for all lengths from
+    `LENGTH_MASK_BITS - 1`. """
+    if min_k > max_k:
+        return 0
+    min_k = min(max(min_k, 0), LENGTH_MASK_BITS - 1)
+    max_k = min(max_k, LENGTH_MASK_BITS - 1)
+    if min_k > max_k:
+        return 0
+    return ((1 << (max_k + 1)) - 1) & ~((1 << min_k) - 1)
+
+class _ModelView(collections.abc.Mapping):
+    """ Read-only view of a `FlatChain` as a markovify chain model
+    `{state: {next word: weight}}`. """
+    def __init__(self, chain):
+        self._chain = chain
+
+    def __getitem__(self, state):
+        chain = self._chain
+        state_no = chain.state_index(chain.encode(state))
+        lo, hi = chain.offsets[state_no], chain.offsets[state_no + 1]
+        follows = {}
+        prev = 0
+        for i in range(lo, hi):
+            weight = chain.cumweights[i] - prev
+            if type(weight) is float and weight.is_integer():
+                weight = int(weight)
+            follows[chain.words[chain.next_ids[i]]] = weight
+            prev = chain.cumweights[i]
+        return follows
+
+    def __iter__(self):
+        chain = self._chain
+        for state_no in range(len(self)):
+            yield chain.decode_state(state_no)
+
+    def __len__(self):
+        return len(self._chain.offsets) - 1
+
+class FlatChain(abc.ABC):
+    """ Markov chain whose words, states and transitions are encoded as
+    integers in flat arrays (see `flatten_model()`).
+
+    The chain walks by following `next_states`, the precomputed successor state
+    of every transition, so that no state tuple is hashed or built in the loop.
+    Arrays may be any sequence of numbers, e.g. `array.array` or a memoryview
+    over a memory-mapped file. Subclasses implement `state_index()`, e.g.
+    `IntChain` and `binmodel.MappedChain`.
+
+    This class provides the interface of `markovify.Chain` which `JPText` uses
+    (`state_size`, `model`, `move()`, `gen()`, `walk()` and `to_json()`).
+    """
+    compiled = False
+
+    def __init__(self, state_size, words, states, offsets, next_ids,
+                 next_states, cumweights):
+        self.state_size = state_size
+        self.words = words
+        self.states = states
+        self.offsets = offsets
+        self.next_ids = next_ids
+        self.next_states = next_states
+        self.cumweights = cumweights
+        # (lowest, max_words) -> result of `compute_band_probabilities()`, and
+        # (lowest, max_words, state, length) -> cumulative weights of the
+        # transitions of states with many transitions
+        self._band_cache = {}
+
+    @abc.abstractmethod
+    def state_index(self, ids: tuple[int]) -> int:
+        """ Returns the index of the state of word IDs `ids`. Raises
+        `KeyError` if the state does not exist. """
+
+    @functools.cached_property
+    def word_ids(self):
+        return {word: i for i, word in enumerate(self.words)}
+
+    @functools.cached_property
+    def length_masks(self):
+        return compute_length_masks(self)
+
+    def band_probabilities(self, lowest: int, highest: int | None):
+        """ Returns `compute_band_probabilities()` of this chain, computed on
+        the first call for each band unless stored in the binary model file
+        (see `binmodel.write_model()`). The probabilities take
+        `4 * number of states * (highest or lowest + 1)` bytes per band. """
+        cache = self._band_cache
+        key = (lowest, highest)
+        if key not in cache:
+            with _band_lock:
+                if key not in cache:
+                    cache[key] = compute_band_probabilities(self, lowest,
+                                                            highest)
+        return cache[key]
+
+    @property
+    def model(self):
+        return _ModelView(self)
+
+    def encode(self, state: tuple[str]):
+        """ Encodes words into word IDs. Raises `KeyError` for unknown words. """
+        word_ids = self.word_ids
+        return tuple(word_ids[word] for word in state)
+
+    def decode_state(self, state_no: int):
+        """ Returns the state of index `state_no` as a tuple of words. """
+        base = state_no * self.state_size
+        return tuple(self.words[i]
+                     for i in self.states[base : base + self.state_size])
+
+    def _init_state_no(self, init_state):
+        if not init_state:
+            init_state = (BEGIN,) * self.state_size
+        return self.state_index(self.encode(init_state))
+
+    def _step(self, state_no):
+        """ Chooses a transition from the state `state_no` and returns its
+        index in `next_ids`. """
+        lo, hi = self.offsets[state_no], self.offsets[state_no + 1]
+        r = random.random() * self.cumweights[hi - 1]
+        return bisect.bisect(self.cumweights, r, lo, hi)
+
+    def move(self, state: tuple[str]):
+        """ Given a state, chooses the next word at random. """
+        return self.words[self.next_ids[self._step(
+            self.state_index(self.encode(state))
+        )]]
+
+    def gen_ids(self, init_state: tuple[str] | None = None):
+        """ Yields word IDs of a run that starts after `init_state`. """
+        offsets, cumweights = self.offsets, self.cumweights
+        next_ids, next_states = self.next_ids, self.next_states
+        rand, bisect_right = random.random, bisect.bisect
+
+        state_no = self._init_state_no(init_state)
+        while True:
+            # Same as `_step()`, inlined
+            hi = offsets[state_no + 1]
+            i = bisect_right(cumweights, rand() * cumweights[hi - 1],
+                             offsets[state_no], hi)
+            next_id = next_ids[i]
+            if next_id == END_ID:
+                break
+            yield next_id
+            state_no = next_states[i]
+            if state_no == NO_STATE:
+                raise KeyError(self._successor_state(i))
+
+    def _successor_state(self, i):
+        """ Returns the state after the transition `i` as a tuple of words. """
+        state_no = bisect.bisect(self.offsets, i) - 1
+        return self.decode_state(state_no)[1:] + (self.words[self.next_ids[i]],)
+
+    def walk_within(self, min_words: int | None = None,
+                    max_words: int | None = None,
+                    init_state: tuple[str] | None = None,
+                    prefix_length: int = 0):
+        """ Returns a run whose length (plus `prefix_length`) is more than
+        `min_words` and less than `max_words`, or None if no run from
+        `init_state` can be so.
+
+        At each step, the weight of each transition is multiplied by the
+        probability that the run ends within the bounds after it (see
+        `compute_band_probabilities()`), so that runs are distributed as
+        `walk()` runs that happen to fit the bounds, without walking those
+        that do not. The probabilities of the bounds are computed on the first
+        call with them (see `band_probabilities()`), and raise `ValueError`
+        for bounds above `MAX_BAND_WORDS` which the chain can reach.
+        """
+        offsets, cumweights = self.offsets, self.cumweights
+        next_ids, next_states = self.next_ids, self.next_states
+        masks = self.length_masks
+        rand, bisect_right = random.random, bisect.bisect
+
+        # Accept the length c if `min_words < c < max_words`
+        lowest = -1 if min_words is None else min_words
+        highest = LENGTH_MASK_BITS * 2 if max_words is None else max_words
+        length = prefix_length
+
+        state_no = self._init_state_no(init_state)
+        if not masks[state_no] & length_band_mask(lowest + 1 - length,
+                                                  highest - 1 - length):
+            return None
+
+        tables, tail = self.band_probabilities(lowest, max_words)
+        cache = self._band_cache
+
+        def probability_after(i):
+            # Probability of ending within the bounds after the transition i
+            if next_ids[i] == END_ID:
+                return 1.0 if lowest < length and (
+                    max_words is None or length < max_words
+                ) else 0.0
+            t = next_states[i]
+            if t == NO_STATE:
+                return 0.0
+            return tail if following is None else following[t]
+
+        ids = []
+        while True:
+            lo, hi = offsets[state_no], offsets[state_no + 1]
+            following = tables[length + 1] if length + 1 < len(tables) \
+                        else None
+
+            # Draw from all the transitions and accept the draw with the
+            # probability after it first, which mostly succeeds and chooses
+            # a transition in the same proportion as below
+            i = bisect_right(cumweights, rand() * cumweights[hi - 1], lo, hi)
+            if not rand() < probability_after(i):
+                key = (lowest, max_words, state_no, length)
+                cumdist = cache.get(key)
+                if cumdist is None:
+                    weights = []
+                    prev = 0
+                    for i in range(lo, hi):
+                        weights.append((cumweights[i] - prev) *
+                                       probability_after(i))
+                        prev = cumweights[i]
+                    cumdist = list(_accumulate(weights))
+                    if hi - lo > BAND_CACHE_MIN_DEGREE:
+                        cache[key] = cumdist
+                if not cumdist[-1] > 0:
+                    return None
+                i = lo + bisect_right(cumdist, rand() * cumdist[-1])
+
+            next_id = next_ids[i]
+            if next_id == END_ID:
+                break
+            ids.append(next_id)
+            length += 1
+            state_no = next_states[i]
+
+        return [self.words[i] for i in ids]
+
+    def gen(self, init_state: tuple[str] | None = None):
+        """ Starting either with a naive `BEGIN` state, or the provided
+        `init_state` (as a tuple), returns a generator that will yield
+        successive items until the chain reaches the `END` state. """
+        for next_id in self.gen_ids(init_state):
+            yield self.words[next_id]
+
+    def walk(self, init_state: tuple[str] | None = None):
+        """ Returns a list representing a single run of the chain. """
+        words = self.words
+        return [words[i] for i in self.gen_ids(init_state)]
+
+    def to_json(self):
+        """ Dumps the chain in the JSON format of `markovify.Chain`. """
+        return json.dumps(list(self.model.items()))
+
+class IntChain(FlatChain):
+    """ In-memory `FlatChain`, whose states are indexed by a dict of tuples of
+    word IDs.
+
+    It is a drop-in replacement of `markovify.Chain`, taking the same
+    arguments. Given the same corpus (or model) and random seed, it walks
+    exactly like `markovify.Chain`.
+
+    Args:
+        corpus: Iterable of runs (lists of words). Ignored if `model` is given.
+        state_size: Number of words in a state.
+        model: `markovify.Chain.model` to be encoded.
+    """
+    def __init__(self, corpus, state_size: int, model: dict | None = None):
+        if model is None:
+            vocab, id_model = count_transitions(corpus, state_size)
+        else:
+            vocab, id_model = encode_model(model)
+        self._init_from_id_model(vocab, id_model, state_size)
+
+    def _init_from_id_model(self, vocab, id_model, state_size):
+        flat = flatten_id_model(id_model, vocab.words, state_size)
+        super().__init__(state_size, **flat)
+        self.word_ids = vocab.word_ids
+        self._state_index = {state: i for i, state in enumerate(id_model)}
+
+    @classmethod
+    def from_counts(cls, vocab: Vocabulary, model: dict, state_size: int):
+        """ Makes a chain from transitions counted by `count_transitions()` or
+        `count_id_transitions()` with `vocab`. """
+        chain = cls.__new__(cls)
+        chain._init_from_id_model(vocab, model, state_size)
+        return chain
+
+    def state_index(self, ids: tuple[int]) -> int:
+        return self._state_index[ids]
+
+    @classmethod
+    def from_json(cls, json_thing):
+        """ Loads a chain dumped by `to_json()` (or `markovify.Chain`). """
+        obj = json.loads(json_thing) if isinstance(json_thing, str) \
+              else json_thing
+        if isinstance(obj, list):
+            model = {tuple(item[0]): item[1] for item in obj}
+        elif isinstance(obj, dict):
+            model = obj
+        else:
+            raise ValueError("Object should be dict or list")
+        state_size = len(next(iter(model)))
+        return cls(None, state_size, model)
@@ -2,15 +2,21 @@ import functools
 import json
 import random
 import re
+import threading
 
 from markovify.text import (Text, ParamError, DEFAULT_MAX_OVERLAP_RATIO,
                             DEFAULT_MAX_OVERLAP_TOTAL, DEFAULT_TRIES)
 from markovify.chain import Chain, BEGIN
 
+from binmodel import read_model, write_model
+from intchain import MAX_BAND_WORDS, IntChain
+from novelty import NoveltyIndex
+from preproc import iter_parsed_texts
+from stateidx import StatePrefixIndex
 from txtsplit import split_into_morps
 from txtutils import (KANA_REGEX, KANJI_REGEX, clean_split_text,
-                      chunk_and_split, join_chunks, check_co_exps_exist,
-                      check_co_exps_fulfilled)
+                      chunk_and_split, join_chunks, join_chunks_bulk,
+                      check_co_exps_exist, check_co_exps_fulfilled)
 
 DEFAULT_ALLOWED_OUTPUT_REPTN = re.compile(
     f"^([ 'a-z]|{KANA_REGEX}|{KANJI_REGEX})+$"
@@ -44,6 +50,10 @@ class JPText(Text):
         retain_original=True,
         well_formed=False,
         reject_reg="",
+        int_chain=False,
+        novelty_index=None,
+        state_prefix_index=None,
+        init_states_cache_size=256,
         **kwargs
     ):
         """
@@ -66,11 +76,24 @@ class JPText(Text):
                      can be provided.
         reject_reg: If well_formed is True, this can be provided to override the
                     standard rejection pattern.
+        int_chain: If True, the chain is built as `intchain.IntChain` (states
+                   encoded as integers) instead of `markovify.Chain`. Ignored
+                   if `chain` is given.
+        novelty_index: A `novelty.NoveltyIndex` of the original corpus, if
+                       pre-processed. It is built from the corpus on first
+                       use if `retain_original` is True and this is not
+                       given.
+        state_prefix_index: A `stateidx.StatePrefixIndex` of the chain, if
+                            pre-processed. It is built from the chain if not
+                            given.
+        init_states_cache_size: Number of beginnings whose initial states are
+                                cached for `make_sentence_with_start` with
+                                strict == False.
 
         `**kwargs` are pased to `self.generate_copus()`.
         """
         # Enable cache for the method
-        lru_cache = functools.lru_cache(maxsize=1)
+        lru_cache = functools.lru_cache(maxsize=init_states_cache_size)
         self.find_init_states_from_chain = lru_cache(
             self._find_init_states_from_chain
         )
@@ -83,6 +106,7 @@ class JPText(Text):
                              input_text is not None
         self.retain_original = retain_original and can_make_sentences
         self.state_size = state_size
+        chain_class = IntChain if int_chain else Chain
 
         if self.retain_original:
             self.parsed_sentences = parsed_sentences or list(
@@ -90,15 +114,56 @@ class JPText(Text):
             )
 
             # Rejoined text lets us assess the novelty of generated sentences
-            self.rejoined_text = self.sentence_join(
-                map(self.word_join, self.parsed_sentences)
-            )
-            self.chain = chain or Chain(self.parsed_sentences, state_size)
+            if type(self).word_join is JPText.word_join:
+                rejoined = join_chunks_bulk(self.parsed_sentences)
+            else:
+                rejoined = map(self.word_join, self.parsed_sentences)
+            self.rejoined_text = self.sentence_join(rejoined)
+            # The novelty index does the same in time independent of the
+            # corpus size. Built on first use, not to sort the suffixes every
+            # time a model is loaded.
+            self._novelty_index = novelty_index
+            self._novelty_index_pending = novelty_index is None
+            self.chain = chain or chain_class(self.parsed_sentences,
+                                              state_size)
         else:
+            self._novelty_index = novelty_index
+            self._novelty_index_pending = False
             if not chain:
                 parsed = parsed_sentences or self.generate_corpus(input_text,
                                                                   **kwargs)
-            self.chain = chain or Chain(parsed, state_size)
+            self.chain = chain or chain_class(parsed, state_size)
+
+        # Index for `make_sentence_with_start` with strict == False
+        self.state_prefix_index = state_prefix_index or \
+                                  StatePrefixIndex(self.chain)
+
+        self._novelty_index_lock = threading.Lock()
+
+        # Last section of the corpus the model has been made from, if known
+        # (see `mkmamodel.update_model()`)
+        self.high_water_mark = None
+
+    @property
+    def novelty_index(self):
+        """
+        The `novelty.NoveltyIndex` of the original corpus, or None if the
+        model has neither the index nor the corpus. Built from
+        `parsed_sentences` on first access if it has not been given.
+        """
+        if self._novelty_index_pending:
+            with self._novelty_index_lock:
+                if self._novelty_index_pending:
+                    self._novelty_index = NoveltyIndex.build(
+                        self.parsed_sentences
+                    )
+                    self._novelty_index_pending = False
+        return self._novelty_index
+
+    @novelty_index.setter
+    def novelty_index(self, novelty_index):
+        self._novelty_index = novelty_index
+        self._novelty_index_pending = False
 
     def to_json(self, *, skipkeys=False, ensure_ascii=False,
                 check_circular=True, allow_nan=True, cls=None, indent=None,
@@ -114,6 +179,82 @@ class JPText(Text):
                           cls=cls, indent=indent, separators=separators,
                           default=default, sort_keys=sort_keys, **kwargs)
 
+    def to_dict(self):
+        """
+        Returns the underlying data as a Python dict.
+
+        If the model has no original corpus (e.g. made by
+        `mkmamodel.ModelBuilder`), its novelty index and high-water mark are
+        included instead, so that the novelty of generated sentences can
+        still be checked after loading.
+        """
+        obj = super().to_dict()
+        if obj["parsed_sentences"] is None and self.novelty_index is not None:
+            obj["novelty_index"] = self.novelty_index.to_dict()
+        if self.high_water_mark is not None:
+            obj["high_water_mark"] = self.high_water_mark
+        return obj
+
+    @classmethod
+    def from_dict(cls, obj, int_chain=False, **kwargs):
+        """
+        Loads a model from a dict made by `to_dict()`.
+
+        If int_chain == True, the chain is loaded as `intchain.IntChain`.
+        """
+        chain_class = IntChain if int_chain else Chain
+        novelty_index = obj.get("novelty_index")
+        model = cls(
+            None,
+            state_size=obj["state_size"],
+            chain=chain_class.from_json(obj["chain"]),
+            parsed_sentences=obj.get("parsed_sentences"),
+            novelty_index=novelty_index and NoveltyIndex.from_dict(
+                novelty_index
+            ),
+        )
+        model.high_water_mark = obj.get("high_water_mark")
+        return model
+
+    @classmethod
+    def from_json(cls, json_str, **kwargs):
+        """
+        Loads a model from a JSON string made by `to_json()`.
+
+        `**kwargs` are passed to `from_dict()`.
+        """
+        return cls.from_dict(json.loads(json_str), **kwargs)
+
+    def to_binary(self, path, bands=()):
+        """
+        Saves the model as a binary model file (see `binmodel.py`).
+
+        The original corpus (`parsed_sentences`) is not saved, but the novelty
+        index (or the rejoined text if the model has no novelty index) is kept
+        for the novelty check of generated sentences. The probabilities of
+        `bands` of `(min_words, max_words)` for `constrain_length` of
+        `make_sentence()` are stored as well (see `binmodel.write_model()`).
+        """
+        write_model(self, path, bands)
+
+    @classmethod
+    def from_binary(cls, path):
+        """
+        Loads a model from a binary model file saved by `to_binary()`.
+
+        The file is memory-mapped, so loading takes no time for parsing, and
+        processes loading the same file share its physical pages.
+        """
+        loaded = read_model(path)
+        model = cls(None, state_size=loaded["state_size"],
+                    chain=loaded["chain"], retain_original=False,
+                    novelty_index=loaded["novelty_index"],
+                    state_prefix_index=loaded["state_prefix_index"])
+        if loaded["rejoined_text"] is not None:
+            model.rejoined_text = loaded["rejoined_text"]
+        model.high_water_mark = loaded["meta"].get("high_water_mark")
+        return model
+
     def sentence_split(self, text, **kwargs):
         """
         Splits full-text string into a list of sentences.
@@ -144,15 +285,36 @@ class JPText(Text):
         """
         return join_chunks(words)
 
-    def generate_corpus(self, text, **kwargs):
+    def generate_corpus(self, text, workers=1, **kwargs):
         """
         Given a text string, returns a list of lists; that is, a list of
         "sentences," each of which is a list of words. Before splitting into
         words, the sentences are filtered through `self.test_sentence_input`
 
+        If workers > 1 (or None for `os.cpu_count()`), the texts (lines of
+        `text` if it is not a string) are cleaned and split in a pool of
+        `workers` processes by `preproc.iter_parsed_texts()`. A text string
+        is split into sentences in this process, and only the sentences are
+        split into words in the pool. The results are the same as with
+        workers == 1. Subclasses overriding `sentence_split()`,
+        `word_split()` or `test_sentence_input()` are processed in this
+        process.
+
         `**kwargs` are passed to `self.sentence_split()` and
         `self.word_split()`.
         """
+        if workers != 1 and self._has_default_preprocessing():
+            reject_pat = self.reject_pat if self.well_formed else None
+            if isinstance(text, str):
+                runs = iter_parsed_texts(self.sentence_split(text, **kwargs),
+                                         workers, reject_pat=reject_pat,
+                                         clean=False, **kwargs)
+                return [run for run in runs if run is not None]
+            return [run for runs in iter_parsed_texts(text, workers,
+                                                      reject_pat=reject_pat,
+                                                      **kwargs)
+                    for run in runs]
+
         if isinstance(text, str):
             sentences = self.sentence_split(text, **kwargs)
         else:
@@ -164,6 +326,12 @@ class JPText(Text):
         runs = [self.word_split(sentence, **kwargs) for sentence in passing]
         return runs
 
+    def _has_default_preprocessing(self):
+        cls = type(self)
+        return cls.sentence_split is JPText.sentence_split and \
+               cls.word_split is JPText.word_split and \
+               cls.test_sentence_input is Text.test_sentence_input
+
     def test_sentence_output(self, words: list[str],
                              max_overlap_ratio=DEFAULT_MAX_OVERLAP_RATIO,
                              max_overlap_total=DEFAULT_MAX_OVERLAP_TOTAL, *,
@@ -187,10 +355,9 @@ class JPText(Text):
         gram_count = max((len(words) - overlap_max), 1)
         grams = [words[i : i + overlap_over] for i in range(gram_count)]
         for g in grams:
-            gram_joined = self.word_join(g)
-            if gram_joined in self.rejoined_text:
+            if self.exists_in_corpus(g):
                 if verbose == True:
-                    return {"ok": False, "gramJoined": gram_joined}
+                    return {"ok": False, "gramJoined": self.word_join(g)}
                 else:
                     return False
 
@@ -199,11 +366,27 @@ class JPText(Text):
         else:
             return True
 
+    def exists_in_corpus(self, words: list[str] | tuple[str]):
+        """
+        Returns True if the sequence of `words` appears in the original text.
+
+        The novelty index is used if the model has it. Otherwise, `words` are
+        joined and searched in the rejoined text. Returns None if the model
+        has neither, i.e. the novelty is unknown.
+        """
+        if self.novelty_index is not None:
+            return self.novelty_index.contains(words)
+        rejoined_text = getattr(self, "rejoined_text", None)
+        if rejoined_text is None:
+            return None
+        return self.word_join(words) in rejoined_text
+
     def make_sentence(
         self, init_state: tuple[str] = None, *, tries: int = DEFAULT_TRIES,
         test_output: bool = True, max_words: int | None = None,
         min_words: int | None = None, reject_co_exps: bool = False,
         reject_unfulfilled_co_exps: bool = False,
+        constrain_length: bool = False,
         allowed_output_regex: str | re.Pattern | None =  DEFAULT_ALLOWED_OUTPUT_REPTN,
         **kwargs
     ):
@@ -226,6 +409,13 @@ class JPText(Text):
         If `max_words` or `min_words` are specified, the word count for the
         sentence will be evaluated against the provided limit(s).
 
+        If constrain_length == True and the chain supports it (i.e. the chain
+        is `intchain.FlatChain` and the bounds are at most
+        `intchain.MAX_BAND_WORDS`), the chain is walked so that the sentence ends
+        within `min_words` and `max_words` (see `FlatChain.walk_within()`),
+        instead of rejecting sentences of other lengths after walking. Returns
+        None at once if no sentence from `init_state` can end within them.
+
         If reject_co_exps == True, words in the sentence are passed to
         `check_co_exps_exist()`, and tries making a sentence again when the
         sentence includes a co-occurrence expression.
@@ -257,9 +447,22 @@ class JPText(Text):
                 else:
                     break
 
+        # Bounds too large for `walk_within()` are checked after walking
+        constrain_length = constrain_length and \
+                           hasattr(self.chain, "walk_within") and \
+                           (max_words if max_words is not None
+                            else min_words or 0) <= MAX_BAND_WORDS
+
         rejected_outputs = []
         for counter in range(tries):
-            words = prefix + self.chain.walk(init_state)
+            if constrain_length:
+                walked = self.chain.walk_within(min_words, max_words,
+                                                init_state, len(prefix))
+                if walked is None:  # No sentence can end within the bounds
+                    return None
+                words = prefix + walked
+            else:
+                words = prefix + self.chain.walk(init_state)
             output = {
                 "counter": counter,
                 "words": words,
@@ -283,7 +486,8 @@ class JPText(Text):
                         rejected_outputs.append(output)
                     continue
 
-            if test_output and hasattr(self, "rejoined_text"):
+            if test_output and (self.novelty_index is not None or
+                                hasattr(self, "rejoined_text")):
                 output["testSentenceOutput"] = self.test_sentence_output(
                     words=words, **kwargs
                 )
@@ -307,7 +511,7 @@ class JPText(Text):
                     output["checkCoExpsFulfilled"] = check_co_exps_fulfilled(
                         words, greedy_for_unfulfilled=False
                     )
-                    if output["checkCoExps"]["unfulfilled"] != []:
+                    if output["checkCoExpsFulfilled"]["unfulfilled"] != []:
                         if verbose == True:
                             rejected_outputs.append(output)
                         continue
@@ -359,27 +563,9 @@ class JPText(Text):
         )
 
         for split_abandoned, split in split_gen:
-            word_count = len(split)
-
-            if word_count == self.state_size:
-                init_states = [split]
-
-            elif 0 < word_count < self.state_size:
-                if strict:
-                    init_states = [(BEGIN,) * (self.state_size - word_count) + \
-                                   split]
-
-                else:
-                    init_states = self.find_init_states_from_chain(split)
-
-                    random.shuffle(init_states)
-            else:
-                err_msg = (
-                    f"`make_sentence_with_start` for this model requires a "
-                    f"string containing 1 to {self.state_size} words. "
-                    f"Yours has {word_count}: {str(split)}"
-                )
-                raise ParamError(err_msg)
+            init_states = self.init_states_with_start(split, strict)
+            if not strict:
+                random.shuffle(init_states)
 
             for init_state in init_states:
                 try:
@@ -413,19 +599,95 @@ class JPText(Text):
         )
         raise ParamError(err_msg)
 
+    def init_states_with_start(self, split: tuple[str], strict: bool = True):
+        """
+        Returns a list of initial states for sentences that begin with `split`,
+        a tuple of one to `self.state_size` words.
+
+        If strict == True, the list has only one state, beginning with BEGINs.
+        Otherwise, it has all states that begin with `split` (see
+        `self.find_init_states_from_chain()`).
+        """
+        word_count = len(split)
+
+        if word_count == self.state_size:
+            return [split]
+
+        elif 0 < word_count < self.state_size:
+            if strict:
+                return [(BEGIN,) * (self.state_size - word_count) + split]
+            else:
+                return self.find_init_states_from_chain(split)
+
+        else:
+            err_msg = (
+                f"`make_sentence_with_start` for this model requires a "
+                f"string containing 1 to {self.state_size} words. "
+                f"Yours has {word_count}: {str(split)}"
+            )
+            raise ParamError(err_msg)
+
+    def make_sentences_with_start(self, beginning: str | tuple[str],
+                                  count: int, strict: bool = True, **kwargs):
+        """
+        Yields results of `count` tries of making a sentence that begins with
+        `beginning` string/tuple, like `self.make_sentence_with_start()` with
+        tolerate_beginning == False.
+
+        `beginning` is split and its initial states are looked up only once,
+        and reused for all sentences.
+
+        Yields the output of `self.make_sentence()` (a string, or a dictionary
+        if verbose == True) for each sentence, or None if failed to make it.
+
+        **kwargs are passed to `self.make_sentence()` and `self.word_split()`
+        (for split `beginning` string).
+        """
+        if type(beginning) is str:
+            split = tuple(self.word_split(beginning, **kwargs))
+        else:
+            split = tuple(beginning)
+
+        # Copy not to shuffle the cached list
+        init_states = list(self.init_states_with_start(split, strict))
+
+        for _ in range(count):
+            if not strict:
+                random.shuffle(init_states)
+
+            for init_state in init_states:
+                output = self.make_sentence(init_state, **kwargs)
+                if output is not None:
+                    break
+            else:
+                output = None
+
+            yield output
+
+    def make_sentence_with_start_or_none(self, beginning: str | tuple[str],
+                                         strict: bool = True, **kwargs):
+        """
+        Returns the result of one try of `self.make_sentences_with_start()`,
+        i.e. the output of `self.make_sentence()`, or None if failed to make
+        a sentence. Unlike `self.make_sentence_with_start()`, `ParamError` is
+        not raised for the failure. `KeyError` or `ParamError` is still raised
+        for an invalid `beginning` (unknown words, or too many words).
+
+        This is called for each sentence by the worker processes
+        (see `genpool.GenerationPool`), so that they omit failed sentences as
+        `self.make_sentences_with_start()` does.
+        """
+        return next(self.make_sentences_with_start(beginning, 1, strict,
+                                                   **kwargs))
+
     def _find_init_states_from_chain(self, split):
         """
         Find all chains that begin with the split when
         `self.make_sentence_with_start` is called with strict == False.
 
-        This is a very expensive operation, so lru_cache caches the results of
-        the latest query in case `self.make_sentence_with_start` is called
-        repeatedly with the same beginning string.
+        The states are looked up in `self.state_prefix_index`, and lru_cache
+        caches the results of the latest queries in case
+        `self.make_sentence_with_start` is called repeatedly with the same
+        beginning string.
         """
-        word_count = len(split)
-        return [
-            key
-            for key in self.chain.model.keys()
-            # check for starting with begin as well ordered lists
-            if tuple(filter(lambda x: x != BEGIN, key))[:word_count] == split
-        ]
+        return self.state_prefix_index.find(split)
@@ -1,51 +1,569 @@
+import argparse
+import array
+import concurrent.futures
+import hashlib
 import json
+import os
 import sqlite3
+import time
 
+from intchain import FlatChain, IntChain, Vocabulary, count_id_transitions
 from jptext import JPText
+from novelty import (DEFAULT_DEPTH, SEPARATOR_ID, NoveltyIndex,
+                     build_suffix_array, merge_suffix_array)
+from preproc import iter_parsed_texts
+from tokcache import has_token_cache, iter_cached_runs, update_token_cache
+
+GIIN_SECTION_TYPE, GYOSEI_SECTION_TYPE = 1, 3
+# `(min_words, max_words)` of the sentences made by each model in app.py
+# (`MODELS`), whose probabilities for `constrain_length` are stored in the
+# binary model files
+WORD_BOUNDS = {"giin": (17, 21), "gyosei": (12, 30)}
+DEFAULT_BATCH_SIZE = 256
+
+class ModelBuilder:
+    """
+    Builds a `JPText` model from runs fed in batches.
+
+    Only the transition counts of the chain and the word IDs of the corpus
+    (for the novelty index, see `novelty.py`) are kept, instead of the runs
+    themselves and their rejoined text, so that memory grows with the number
+    of distinct states rather than with the corpus as a list of lists.
+
+    Example:
+        ```
+        >>> builder = ModelBuilder(state_size=4)
+        >>> for runs in batches_of_runs:
+        ...     builder.add_runs(runs)
+        >>> model = builder.build()
+        ```
+    """
+    def __init__(self, state_size: int = 2, novelty_index: bool = True,
+                 novelty_depth: int = DEFAULT_DEPTH):
+        self.state_size = state_size
+        self.vocab = Vocabulary()
+        self.counts = {}
+        # Word IDs of the runs separated by `SEPARATOR_ID`, which share the
+        # vocabulary with the chain
+        self.corpus = array.array("I") if novelty_index else None
+        self.novelty_depth = novelty_depth
+        # Suffix array of `corpus[:_sorted_length]`, if already built
+        self._suffixes = None
+        self._sorted_length = 0
+
+    @classmethod
+    def from_model(cls, model: JPText, weight: float = 1):
+        """
+        Makes a builder having the counts of the chain (multiplied by
+        `weight`) and the corpus of the novelty index of `model`.
+
+        The suffix array of the novelty index is reused if its word IDs are
+        those of the chain, as in models made by `ModelBuilder`.
+        """
+        chain = model.chain
+        if not isinstance(chain, FlatChain):
+            chain = IntChain(None, model.state_size, chain.model)
+        novelty_index = model.novelty_index
+        builder = cls(model.state_size, novelty_index is not None,
+                      novelty_index.depth if novelty_index is not None
+                      else DEFAULT_DEPTH)
+
+        intern = builder.vocab.intern
+        for word in chain.words:
+            intern(word)
+
+        state_size = model.state_size
+        states, offsets = chain.states, chain.offsets
+        next_ids, cumweights = chain.next_ids, chain.cumweights
+        counts = builder.counts
+        for state_no in range(len(offsets) - 1):
+            state = tuple(states[state_no * state_size :
+                                 (state_no + 1) * state_size])
+            follows = counts[state] = {}
+            prev = 0
+            for i in range(offsets[state_no], offsets[state_no + 1]):
+                count = cumweights[i] - prev
+                prev = cumweights[i]
+                if count.is_integer():
+                    count = int(count)
+                follows[next_ids[i]] = count * weight
+
+        if novelty_index is not None:
+            remap = [intern(word) for word in novelty_index.words]
+            if remap == list(range(len(remap))):
+                builder.corpus = array.array("I", novelty_index.corpus)
+                builder._suffixes = array.array("I", novelty_index.suffixes)
+                builder._sorted_length = len(builder.corpus)
+            else:
+                builder.corpus = array.array(
+                    "I", [remap[i] for i in novelty_index.corpus]
+                )
+        return builder
+
+    def add_runs(self, runs):
+        """ Counts transitions of an iterable of runs (lists of words). """
+        intern = self.vocab.intern
+        corpus = self.corpus
+
+        id_runs = []
+        for run in runs:
+            ids = [intern(word) for word in run]
+            if corpus is not None:
+                corpus.extend(ids)
+                corpus.append(SEPARATOR_ID)
+            id_runs.append(ids)
+        count_id_transitions(id_runs, self.state_size, self.counts)
+
+    def merge(self, other: "ModelBuilder", weight: float = 1):
+        """ Adds the counts (multiplied by `weight`, as `markovify.combine()`
+        does) and the corpus of `other`, as if its runs were added to this
+        builder after the runs added so far.
+
+        Words of `other` are re-interned into the vocabulary of this builder,
+        so merging builders of consecutive slices of runs in order gives the
+        same counts, in the same order, as adding all the runs to one builder.
+        """
+        intern = self.vocab.intern
+        remap = [intern(word) for word in other.vocab.words]
+
+        counts = self.counts
+        for state, follows in other.counts.items():
+            state = tuple(remap[i] for i in state)
+            merged = counts.get(state)
+            if merged is None:
+                merged = counts[state] = {}
+            for next_id, count in follows.items():
+                next_id = remap[next_id]
+                merged[next_id] = merged.get(next_id, 0) + count * weight
+
+        if self.corpus is not None:
+            self.corpus.extend([remap[i] for i in other.corpus])
+
+    def build(self, high_water_mark: dict | None = None):
+        """ Returns a `JPText` model with an `intchain.IntChain` of the runs
+        added so far.
+
+        `high_water_mark` is set to the model (see `get_high_water_mark()`).
+        """
+        chain = IntChain.from_counts(self.vocab, self.counts, self.state_size)
+        novelty_index = None
+        if self.corpus is not None:
+            if self._suffixes is None:
+                suffixes = build_suffix_array(self.corpus, self.novelty_depth)
+            else:
+                suffixes = merge_suffix_array(self.corpus, self._suffixes,
+                                              self._sorted_length,
+                                              self.novelty_depth)
+            novelty_index = NoveltyIndex(self.vocab.words, self.corpus,
+                                         suffixes, self.novelty_depth)
+        model = JPText(None, state_size=self.state_size, chain=chain,
+                       novelty_index=novelty_index)
+        model.high_water_mark = high_water_mark
+        return model
+
+def iter_parsed_sentences(cur, section_type: int,
+                          batch_size: int = DEFAULT_BATCH_SIZE,
+                          rowid_range: tuple[int, int] | None = None):
+    """
+    Yields the parsed sentences (lists of words) of each section of
+    `section_type` in the order of rowid, fetching `batch_size` sections at a
+    time.
+
+    If `rowid_range` `(lo, hi)` is given, only sections with
+    `lo < rowid <= hi` are read (`lo` may be None for no lower bound).
+
+    The sentences are decoded from the JSON of `sections.parsed_sentences`,
+    not read from the token cache (see `tokcache.py`), which holds the
+    tokenization of `sections.content` and is used by
+    `make_model_from_text()` only.
+    """
+    query = "SELECT parsed_sentences FROM sections WHERE type=?"
+    params = [section_type]
+    if rowid_range is not None:
+        lo, hi = rowid_range
+        if lo is not None:
+            query += " AND rowid > ?"
+            params.append(lo)
+        query += " AND rowid <= ?"
+        params.append(hi)
+    cur.execute(query + " ORDER BY rowid", params)
+    while rows := cur.fetchmany(batch_size):
+        for fields in rows:
+            yield json.loads(fields[0])
+
+def iter_section_texts(cur, section_type: int,
+                       batch_size: int = DEFAULT_BATCH_SIZE,
+                       rowid_range: tuple[int, int] | None = None):
+    """
+    Yields the raw content of each section of `section_type`, in the same
+    way as `iter_parsed_sentences()` does for the parsed sentences.
+    """
+    query = "SELECT content FROM sections WHERE type=?"
+    params = [section_type]
+    if rowid_range is not None:
+        lo, hi = rowid_range
+        if lo is not None:
+            query += " AND rowid > ?"
+            params.append(lo)
+        query += " AND rowid <= ?"
+        params.append(hi)
+    cur.execute(query + " ORDER BY rowid", params)
+    while rows := cur.fetchmany(batch_size):
+        for fields in rows:
+            yield fields[0] or ""
+
+def checksum_sections(cur, section_type: int, max_rowid: int,
+                      batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Returns a checksum (hex string of a 16-byte hash) of the rowid, the
+    content and the parsed sentences of each section of `section_type` up to
+    `max_rowid`, so that any change of those sections changes the checksum.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    cur.execute("SELECT rowid, content, parsed_sentences FROM sections "
+                "WHERE type=? AND rowid<=? ORDER BY rowid",
+                (section_type, max_rowid))
+    while rows := cur.fetchmany(batch_size):
+        for rowid, content, parsed_sentences in rows:
+            h.update(json.dumps([rowid, content, parsed_sentences],
+                                ensure_ascii=False).encode())
+            h.update(b"\n")
+    return h.hexdigest()
+
+def get_high_water_mark(cur, section_type: int):
+    """
+    Returns the high-water mark of sections of `section_type`, i.e. a dict
+    `{"rowid": int, "sections": int, "checksum": str, "retrieved_at": str |
+    None}` of the last rowid, the number of sections up to it, their checksum
+    (see `checksum_sections()`), and the last `retrieved_at` of councils.
+    Models made from the sections up to the mark are updated with the
+    sections after it by `update_model()`.
+    """
+    cur.execute("SELECT MAX(rowid), COUNT(*) FROM sections WHERE type=?",
+                (section_type,))
+    rowid, n_sections = cur.fetchone()
+    rowid = rowid or 0
+    checksum = checksum_sections(cur, section_type, rowid)
+    cur.execute("SELECT MAX(retrieved_at) FROM councils")
+    return {
+        "rowid": rowid,
+        "sections": n_sections,
+        "checksum": checksum,
+        "retrieved_at": cur.fetchone()[0],
+    }
+
+def split_rowid_ranges(cur, section_type: int, n_shards: int,
+                       max_rowid: int | None = None):
+    """
+    Splits sections of `section_type` (up to `max_rowid` if given) into at
+    most `n_shards` consecutive shards of about the same number of sections.
+
+    Return:
+        list[tuple[int, int]]: `rowid_range` of each shard (see
+                               `iter_parsed_sentences()`), in order.
+    """
+    if max_rowid is None:
+        cur.execute("SELECT rowid FROM sections WHERE type=? ORDER BY rowid",
+                    (section_type,))
+    else:
+        cur.execute("SELECT rowid FROM sections WHERE type=? AND rowid<=? "
+                    "ORDER BY rowid", (section_type, max_rowid))
+    rowids = [fields[0] for fields in cur.fetchall()]
+    if not rowids:
+        return []
+
+    n_shards = min(n_shards, len(rowids))
+    ranges = []
+    lo = rowids[0] - 1
+    for shard_no in range(1, n_shards + 1):
+        hi = rowids[len(rowids) * shard_no // n_shards - 1]
+        ranges.append((lo, hi))
+        lo = hi
+    return ranges
+
+def _count_shard(db_path, section_type, rowid_range, batch_size, kwargs):
+    """ Counts transitions of a shard of sections in a worker process. """
+    builder = ModelBuilder(**kwargs)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    cur = conn.cursor()
+    for parsed_sentences in iter_parsed_sentences(cur, section_type,
+                                                  batch_size, rowid_range):
+        builder.add_runs(parsed_sentences)
+    cur.close()
+    conn.close()
+    return builder
+
+def make_models_in_parallel(db_path: str, section_types: list[int],
+                            workers: int | None = None,
+                            batch_size: int = DEFAULT_BATCH_SIZE, **kwargs):
+    """
+    Return a list of markov models of `section_types`, counting transitions
+    in a pool of `workers` processes (`os.cpu_count()` if None).
+
+    Sections of each type are split into `workers` shards, all of which are
+    counted concurrently. Partial counts are merged in the order of the
+    shards (see `ModelBuilder.merge()`), so the models are identical to those
+    made by `make_giin_gyosei_model()` in one process.
+    kwargs are passed to `ModelBuilder` constructor.
+    """
+    workers = workers or os.cpu_count()
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    high_water_marks = [get_high_water_mark(cur, section_type)
+                        for section_type in section_types]
+    shards = [split_rowid_ranges(cur, section_type, workers, mark["rowid"])
+              for section_type, mark in zip(section_types, high_water_marks)]
+    cur.close()
+    conn.close()
+
+    models = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [
+            [executor.submit(_count_shard, db_path, section_type, rowid_range,
+                             batch_size, kwargs)
+             for rowid_range in ranges]
+            for section_type, ranges in zip(section_types, shards)
+        ]
+        # Models are built in this process while the rest of the shards are
+        # still being counted
+        for shard_futures, mark in zip(futures, high_water_marks):
+            builder = ModelBuilder(**kwargs)
+            for future in shard_futures:
+                builder.merge(future.result())
+            models.append(builder.build(mark))
+    return models
+
+def make_model_from_text(db_path: str, section_type: int,
+                         workers: int | None = 1,
+                         batch_size: int = DEFAULT_BATCH_SIZE, **kwargs):
+    """
+    Return a markov model of `section_type` made from the raw content of the
+    sections instead of their `parsed_sentences`.
+
+    Sections are read `batch_size` at a time, cleaned and split into words in
+    a pool of `workers` processes (`os.cpu_count()` if None, see
+    `preproc.iter_parsed_texts()`), and counted by `ModelBuilder` in order,
+    so the model is the same for any number of workers.
+    kwargs are passed to `ModelBuilder` constructor.
+
+    If the database has the token cache (see `tokcache.py`), the cache of
+    the sections is updated first (only the sections changed since they were
+    cached are split), and the runs are read from the cache instead.
+    """
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cached = has_token_cache(cur)
+    if cached:
+        update_token_cache(db_path, section_type, workers, batch_size)
+
+    mark = get_high_water_mark(cur, section_type)
+    builder = ModelBuilder(**kwargs)
+    if cached:
+        runs_of_sections = iter_cached_runs(cur, section_type, batch_size,
+                                            (None, mark["rowid"]))
+    else:
+        texts = iter_section_texts(cur, section_type, batch_size,
+                                   (None, mark["rowid"]))
+        runs_of_sections = iter_parsed_texts(texts, workers)
+    for runs in runs_of_sections:
+        builder.add_runs(runs)
+    cur.close()
+    conn.close()
+    return builder.build(mark)
 
 def make_giin_gyosei_model(db_path:str, make_giin_model:bool=True,
-                           make_gyosei_model:bool=True, **kwargs):
+                           make_gyosei_model:bool=True,
+                           batch_size:int=DEFAULT_BATCH_SIZE, workers:int=1,
+                           from_text:bool=False, **kwargs):
     """
     Return a tuple of markov models `(giin_model, gyosei_model)`.
-    kwargs are passed to `JPText` constructor.
+    kwargs are passed to `ModelBuilder` constructor.
+
+    Sections are read `batch_size` at a time and counted by `ModelBuilder`,
+    without keeping the whole corpus. The models have an `intchain.IntChain`
+    and a novelty index but no `parsed_sentences`.
+
+    If workers > 1, the models are made by `make_models_in_parallel()` with
+    the same results.
+
+    If from_text == True, the models are made by `make_model_from_text()`
+    from the raw content of the sections, which is cleaned and split in
+    `workers` processes (streaming is implied).
     """
     giin_model, gyosei_model = None, None
 
+    if from_text:
+        if make_giin_model == True:
+            giin_model = make_model_from_text(db_path, GIIN_SECTION_TYPE,
+                                              workers, batch_size, **kwargs)
+        if make_gyosei_model == True:
+            gyosei_model = make_model_from_text(db_path, GYOSEI_SECTION_TYPE,
+                                                workers, batch_size, **kwargs)
+        return giin_model, gyosei_model
+
+    if workers > 1:
+        section_types = [
+            section_type for section_type, make in
+            [(GIIN_SECTION_TYPE, make_giin_model),
+             (GYOSEI_SECTION_TYPE, make_gyosei_model)] if make == True
+        ]
+        models = iter(make_models_in_parallel(db_path, section_types,
+                                              workers, batch_size, **kwargs))
+        if make_giin_model == True:
+            giin_model = next(models)
+        if make_gyosei_model == True:
+            gyosei_model = next(models)
+        return giin_model, gyosei_model
+
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
 
+    def make_model(section_type):
+        mark = get_high_water_mark(cur, section_type)
+        builder = ModelBuilder(**kwargs)
+        for parsed_sentences in iter_parsed_sentences(
+            cur, section_type, batch_size, (None, mark["rowid"])
+        ):
+            builder.add_runs(parsed_sentences)
+        return builder.build(mark)
+
     if make_giin_model == True:
-        cur.execute(f"SELECT parsed_sentences FROM sections WHERE type=1")
-        parsed_sentences = []
-        for fields in cur.fetchall():
-            parsed_sentences += json.loads(fields[0])
-        giin_model = JPText("", parsed_sentences=parsed_sentences, **kwargs)
+        giin_model = make_model(GIIN_SECTION_TYPE)
 
     if make_gyosei_model == True:
-        cur.execute(f"SELECT parsed_sentences FROM sections WHERE type=3")
-        parsed_sentences = []
-        for fields in cur.fetchall():
-            parsed_sentences += json.loads(fields[0])
-        gyosei_model = JPText("", parsed_sentences=parsed_sentences, **kwargs)
+        gyosei_model = make_model(GYOSEI_SECTION_TYPE)
 
     cur.close()
     conn.close()
 
     return giin_model, gyosei_model
 
+def update_model(model: JPText, db_path: str, section_type: int,
+                 weights: list[float] | None = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Return a markov model updated with the sections of `section_type` added
+    after the high-water mark of `model`.
+
+    Transitions are counted only for the new sections and added to those of
+    `model`, weighted by `weights` `[weight of model, weight of new sections]`
+    as in `markovify.combine()` (default: `[1, 1]`, i.e. the same as a full
+    rebuild). The new sections are also added to the novelty index.
+
+    Raises `ValueError` if `model` has no high-water mark, or if sections up
+    to the mark have been added, changed or deleted since the model was made
+    (i.e. their number or checksum differs, see `checksum_sections()`).
+    """
+    mark = model.high_water_mark
+    if mark is None or "checksum" not in mark:
+        raise ValueError("The model has no high-water mark with a checksum; "
+                         "rebuild it.")
+    old_weight, new_weight = weights or [1, 1]
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+
+    cur.execute("SELECT COUNT(*) FROM sections WHERE type=? AND rowid<=?",
+                (section_type, mark["rowid"]))
+    if (cur.fetchone()[0] != mark["sections"]
+            or checksum_sections(cur, section_type, mark["rowid"],
+                                 batch_size) != mark["checksum"]):
+        cur.close()
+        conn.close()
+        raise ValueError("Sections up to the high-water mark have been "
+                         "changed; rebuild the model.")
+
+    new_mark = get_high_water_mark(cur, section_type)
+    added = ModelBuilder(model.state_size, model.novelty_index is not None)
+    for parsed_sentences in iter_parsed_sentences(
+        cur, section_type, batch_size, (mark["rowid"], new_mark["rowid"])
+    ):
+        added.add_runs(parsed_sentences)
+
+    cur.close()
+    conn.close()
+
+    builder = ModelBuilder.from_model(model, old_weight)
+    builder.merge(added, new_weight)
+    return builder.build(new_mark)
+
+def save_models(giin_model: JPText, gyosei_model: JPText,
+                directory: str = "."):
+    """
+    Saves the models as JSON and binary model files in `directory`, and
+    returns the list of their paths.
+    """
+    paths = []
+    for model, name in [(giin_model, "giin"), (gyosei_model, "gyosei")]:
+        # JSON ファイルとして保存
+        json_path = os.path.join(
+            directory, f"{name}_model_state{model.state_size}.json"
+        )
+        with open(json_path, "w", newline="\n") as f:
+            f.write(model.to_json())
+        print(f"{name.capitalize()} model has been saved as '{json_path}'.")
+
+        # バイナリファイルとして保存 (app.py は JSON より優先して読み込む)
+        binary_path = os.path.join(
+            directory, f"{name}_model_state{model.state_size}.bin"
+        )
+        model.to_binary(binary_path, [WORD_BOUNDS[name]])
+        print(f"{name.capitalize()} model has been saved as '{binary_path}'.")
+
+        paths += [json_path, binary_path]
+    return paths
+
 if __name__ == "__main__":
-    giin_model, gyosei_model = make_giin_gyosei_model(
-        "./resource.sqlite3", state_size=4
+    parser = argparse.ArgumentParser(
+        description="Make the giin and gyosei models from ./resource.sqlite3."
     )
+    parser.add_argument("--state-size", type=int, default=4)
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="no effect; sections are always read in batches without "
+             "keeping the whole corpus (kept for existing scripts)"
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes counting sections, or cleaning and "
+             "splitting them with --from-text"
+    )
+    parser.add_argument(
+        "--from-text", action="store_true",
+        help="clean and split the raw content of sections (in --workers "
+             "processes) instead of reading their parsed sentences"
+    )
+    parser.add_argument(
+        "--update", action="store_true",
+        help="update the existing binary models with sections added since "
+             "they were made"
+    )
+    parser.add_argument(
+        "--weights", type=float, nargs=2, metavar=("OLD", "NEW"),
+        help="weights of the existing models and the added sections for "
+             "--update (default: 1 1)"
+    )
+    args = parser.parse_args()
 
-    # JSON ファイルとして保存
-    giin_model_filename = f"giin_model_state{giin_model.state_size}.json"
-    gyosei_model_filename = f"gyosei_model_state{gyosei_model.state_size}.json"
-
-    with open(giin_model_filename, "w", newline="\n") as f:
-        f.write(giin_model.to_json())
-    print(f"Giin model has been saved as '{giin_model_filename}'.")
+    start = time.perf_counter()
+    if args.update:
+        giin_model, gyosei_model = [
+            update_model(
+                JPText.from_binary(f"{name}_model_state{args.state_size}.bin"),
+                "./resource.sqlite3", section_type, args.weights,
+                args.batch_size
+            )
+            for name, section_type in [("giin", GIIN_SECTION_TYPE),
+                                       ("gyosei", GYOSEI_SECTION_TYPE)]
+        ]
+    else:
+        giin_model, gyosei_model = make_giin_gyosei_model(
+            "./resource.sqlite3", state_size=args.state_size,
+            batch_size=args.batch_size,
+            workers=args.workers, from_text=args.from_text
+        )
+    print(f"Models have been made in {time.perf_counter() - start:.1f} s.")
 
-    with open(gyosei_model_filename, "w", newline="\n") as f:
-        f.write(gyosei_model.to_json())
-    print(f"Gyosei model has been saved as '{gyosei_model_filename}'.")
+    save_models(giin_model, gyosei_model)
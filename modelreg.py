@@ -0,0 +1,226 @@
+import datetime
+import os
+import threading
+import time
+import traceback
+from typing import NamedTuple
+
+def load_model(path: str):
+    """ Loads a `JPText` model from a binary model file `*.bin`
+    (memory-mapped) or a JSON file. Either way, the chain of the model is
+    encoded in integers (see `intchain.py`). """
+    # Imported here, not to import markovify until a model is needed
+    from jptext import JPText
+
+    if path.endswith(".bin"):
+        return JPText.from_binary(path)
+    with open(path) as f:
+        return JPText.from_json(f.read(), int_chain=True)
+
+def find_model_file(basename: str):
+    """ Returns the path of the model file to be loaded, i.e. `{basename}.bin`
+    if it exists, or `{basename}.json` otherwise. """
+    if os.path.exists(f"{basename}.bin"):
+        return f"{basename}.bin"
+    return f"{basename}.json"
+
+def file_stamp(path: str):
+    """ Returns the stamp `(path, inode, mtime in ns, size)` of a model file,
+    which identifies a version of the model, or None if the file does not
+    exist. """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+class LoadedModel(NamedTuple):
+    """ A version of a model loaded by `ModelRegistry`. """
+    model: object
+    path: str
+    # Last modified time of the model file (ISO 8601), which identifies the
+    # version across processes loading the same file
+    version: str
+    loaded_at: float  # UNIX time
+    load_seconds: float
+    stamp: tuple
+
+class ModelRegistry:
+    """ Registry of models which are reloaded when their files change.
+
+    A background thread checks the model files (inode, mtime and size) every
+    `interval` seconds. When a file has changed and stayed unchanged for one
+    more interval (so that a file being written is not read), the new version
+    is loaded in the thread and replaces the old one at once. A request that
+    took a model by `get()` keeps using that version until it finishes, while
+    later requests get the new one. If loading fails, the old version stays.
+
+    Models registered with lazy == True are loaded on the first `get()`, which
+    blocks until the model has been loaded (by whichever thread came first).
+    `warm_up()` loads them in advance in the background.
+
+    The thread starts on the first `get()` (again after a fork, since threads
+    do not survive it) unless `interval` is 0 or `stop()` has been called.
+
+    Args:
+        load: Function that loads a model from a model file path.
+        interval: Seconds between checks of the files. 0 disables reloading.
+
+    Example:
+        ```
+        >>> registry = ModelRegistry(load_model, interval=5)
+        >>> registry.register("giin", "giin_model_state4")
+        >>> loaded = registry.get("giin")
+        >>> loaded.model.make_sentence()
+        "..."
+        ```
+    """
+    def __init__(self, load, interval: float = 5.0):
+        self.load = load
+        self.interval = interval
+        self._basenames = {}
+        # Name -> `LoadedModel`. Replaced item by item, each of which is
+        # atomic.
+        self._loaded = {}
+        # Name -> stamp of the file which could not be loaded, not to retry
+        # until the file changes again
+        self._failed_stamps = {}
+        # Name -> lock held while the model is loaded for the first time
+        self._load_locks = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def _load(self, path: str, stamp: tuple):
+        start = time.perf_counter()
+        model = self.load(path)
+        load_seconds = time.perf_counter() - start
+        version = datetime.datetime.fromtimestamp(
+            stamp[2] / 1e9
+        ).isoformat(timespec="seconds")
+        return LoadedModel(model, path, version, time.time(), load_seconds,
+                           stamp)
+
+    def register(self, name: str, basename: str, lazy: bool = False):
+        """ Registers the model `name` of the file of `basename` (see
+        `find_model_file()`), and watches the file after it has been loaded.
+        The model is loaded now unless lazy == True. """
+        self._basenames[name] = basename
+        self._load_locks[name] = threading.Lock()
+        if not lazy:
+            self._load_first(name)
+
+    def _load_first(self, name: str):
+        with self._load_locks[name]:
+            loaded = self._loaded.get(name)
+            if loaded is None:
+                path = find_model_file(self._basenames[name])
+                loaded = self._load(path, file_stamp(path))
+                self._loaded[name] = loaded
+                print(f"Model '{name}' has been loaded from '{path}' "
+                      f"(version {loaded.version}) in "
+                      f"{loaded.load_seconds:.2f} s.")
+        return loaded
+
+    def add_listener(self, listener):
+        """ Adds a function called as `listener(name, loaded)` after a new
+        version of a model has replaced the old one. """
+        self._listeners.append(listener)
+
+    def get(self, name: str) -> LoadedModel:
+        """ Returns the current version of the model `name`, loading it if it
+        has not been loaded yet. """
+        if self.interval > 0 and not self._stopped.is_set() and (
+            self._pid != os.getpid() or not self._thread.is_alive()
+        ):
+            self.start()
+        loaded = self._loaded.get(name)
+        if loaded is None:
+            loaded = self._load_first(name)
+        return loaded
+
+    def warm_up(self):
+        """ Loads the models not loaded yet in a background thread, and
+        returns the thread. """
+        thread = threading.Thread(
+            target=lambda: [self.get(name) for name in self._basenames],
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def status(self):
+        """ Returns a dict of the current versions of the models (None for
+        models not loaded yet), to be reported by the app. """
+        status = {}
+        for name in self._basenames:
+            loaded = self._loaded.get(name)
+            status[name] = loaded and {
+                "path": loaded.path,
+                "version": loaded.version,
+                "loadedAt": datetime.datetime.fromtimestamp(
+                    loaded.loaded_at
+                ).isoformat(timespec="seconds"),
+                "loadSeconds": round(loaded.load_seconds, 3),
+            }
+        return status
+
+    def check(self, pending: dict | None = None):
+        """ Reloads the models whose files have changed.
+
+        `pending` maps the names of changed models to their file stamps seen
+        at the previous check. Models are reloaded only if the stamps are the
+        same at this check, unless `pending` is None. Returns `pending` for
+        the next check.
+        """
+        next_pending = {}
+        for name, basename in self._basenames.items():
+            if name not in self._loaded:  # Not loaded for the first time yet
+                continue
+            path = find_model_file(basename)
+            stamp = file_stamp(path)
+            if stamp is None or stamp == self._loaded[name].stamp \
+               or stamp == self._failed_stamps.get(name):
+                continue
+            if pending is not None and pending.get(name) != stamp:
+                next_pending[name] = stamp
+                continue
+
+            try:
+                loaded = self._load(path, stamp)
+            except Exception:
+                traceback.print_exc()
+                # Keep the old version (with its own stamp, which the worker
+                # processes of `genpool.py` load by), and retry when the file
+                # changes again
+                self._failed_stamps[name] = stamp
+                continue
+
+            self._loaded[name] = loaded
+            print(f"Model '{name}' has been reloaded from '{path}' "
+                  f"(version {loaded.version}) in {loaded.load_seconds:.2f} s.")
+            for listener in self._listeners:
+                listener(name, loaded)
+        return next_pending
+
+    def _watch(self):
+        pending = {}
+        while not self._stopped.wait(self.interval):
+            pending = self.check(pending)
+
+    def start(self):
+        """ Starts the background thread if it is not running in this
+        process. """
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """ Stops the background thread. """
+        self._stopped.set()
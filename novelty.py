@@ -0,0 +1,182 @@
+import array
+import bisect
+import functools
+
+from intchain import END_ID, Vocabulary
+
+# Suffixes are sorted by their first `DEFAULT_DEPTH` words. Longer sequences are
+# still found, by verifying the suffixes sharing the first `depth` words.
+DEFAULT_DEPTH = 32
+# Separates runs in `NoveltyIndex.corpus`, so that no match spans two runs.
+SEPARATOR_ID = END_ID
+
+def build_suffix_array(corpus, depth: int = DEFAULT_DEPTH):
+    """ Sorts positions of `corpus` by the sequences of (at most) `depth` IDs
+    starting at them, by prefix doubling.
+
+    Args:
+        corpus: Sequence of word IDs.
+        depth: Number of IDs to be compared.
+
+    Return:
+        array: uint32 array of positions, except those of `SEPARATOR_ID`.
+    """
+    n = len(corpus)
+    # Ranks are kept in an array rather than a list of int objects, to save
+    # memory on large corpora
+    rank = array.array("I", corpus)
+    suffixes = sorted(range(n), key=rank.__getitem__)
+
+    h = 1
+    while h < depth:
+        # Sort by `(rank of the first h IDs, rank of the next h IDs)`
+        # (the end of `corpus` comes first)
+        m = max(rank, default=0) + 2
+        keys = [rank[i] * m + (rank[i + h] + 1 if i + h < n else 0)
+                for i in range(n)]
+        suffixes.sort(key=keys.__getitem__)
+
+        new_rank = array.array("I", bytes(4 * n))
+        r = 0
+        for prev, i in zip(suffixes, suffixes[1:]):
+            if keys[i] != keys[prev]:
+                r += 1
+            new_rank[i] = r
+        rank = new_rank
+        h *= 2
+        if r == n - 1:  # All suffixes are distinct
+            break
+
+    return array.array("I", [i for i in suffixes if corpus[i] != SEPARATOR_ID])
+
+def merge_suffix_array(corpus, suffixes, start: int,
+                       depth: int = DEFAULT_DEPTH):
+    """ Adds the suffixes of IDs appended to `corpus` to its suffix array.
+
+    Each new suffix is inserted by binary search, so this takes time depending
+    on the size of the appended IDs, rather than sorting all suffixes again.
+    Suffixes are compared up to their first `SEPARATOR_ID`, so the order of
+    suffixes which are equal up to there may differ from that of
+    `build_suffix_array()`, which does not matter for `NoveltyIndex`.
+
+    Args:
+        corpus: Sequence of word IDs. IDs before `start` must end with
+                `SEPARATOR_ID`.
+        suffixes: Suffix array of `corpus[:start]`.
+        start: Position of the first appended ID.
+        depth: Number of IDs to be compared.
+
+    Return:
+        array: uint32 array of positions, except those of `SEPARATOR_ID`.
+    """
+    def key(i):
+        ids = corpus[i : i + depth].tolist()
+        if SEPARATOR_ID in ids:
+            del ids[ids.index(SEPARATOR_ID) + 1 :]
+        return ids
+
+    new_suffixes = build_suffix_array(corpus[start:], depth)
+    merged = array.array("I")
+    lo = 0
+    for i in new_suffixes:
+        i += start
+        # New suffixes are sorted, so insertion points never go back
+        hi = bisect.bisect_right(suffixes, key(i), lo, key=key)
+        merged.extend(suffixes[lo:hi])
+        merged.append(i)
+        lo = hi
+    merged.extend(suffixes[lo:])
+    return merged
+
+class NoveltyIndex:
+    """ Index of the corpus to test whether a sequence of words appears in it,
+    in time depending on the length of the sequence but not on the size of the
+    corpus.
+
+    The corpus is kept as a flat sequence of word IDs where runs are separated
+    by `SEPARATOR_ID`, together with its suffix array. A sequence appears in
+    the corpus if it is a contiguous part of a run.
+
+    Args:
+        words: Sequence of words (word ID -> word).
+        corpus: Sequence of word IDs of runs, separated by `SEPARATOR_ID`.
+        suffixes: Suffix array of `corpus` (see `build_suffix_array()`).
+        depth: Number of words by which `suffixes` are sorted.
+    """
+    def __init__(self, words, corpus, suffixes, depth: int = DEFAULT_DEPTH):
+        self.words = words
+        self.corpus = corpus
+        self.suffixes = suffixes
+        self.depth = depth
+
+    @classmethod
+    def build(cls, runs, depth: int = DEFAULT_DEPTH):
+        """ Builds the index from an iterable of runs (lists of words). """
+        vocab = Vocabulary()
+        intern = vocab.intern
+        corpus = array.array("I")
+        for run in runs:
+            corpus.extend([intern(word) for word in run])
+            corpus.append(SEPARATOR_ID)
+        return cls(vocab.words, corpus, build_suffix_array(corpus, depth),
+                   depth)
+
+    def to_dict(self):
+        """ Returns the index as a dict of lists, to be saved as JSON. """
+        return {
+            "words": list(self.words),
+            "corpus": self.corpus.tolist(),
+            "suffixes": self.suffixes.tolist(),
+            "depth": self.depth,
+        }
+
+    @classmethod
+    def from_dict(cls, obj):
+        """ Loads an index from a dict made by `to_dict()`. """
+        return cls(obj["words"], array.array("I", obj["corpus"]),
+                   array.array("I", obj["suffixes"]), obj["depth"])
+
+    @functools.cached_property
+    def word_ids(self):
+        return {word: i for i, word in enumerate(self.words)}
+
+    def _prefix(self, suffix_no, length):
+        start = self.suffixes[suffix_no]
+        return self.corpus[start : start + length].tolist()
+
+    def contains_ids(self, ids: list[int]):
+        """ Returns True if the sequence of word IDs `ids` appears in the
+        corpus. """
+        if not ids:
+            return True
+
+        key_length = min(len(ids), self.depth)
+        key = ids[:key_length]
+
+        # Lower bound of suffixes beginning with `key`
+        lo, hi = 0, len(self.suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._prefix(mid, key_length) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        for suffix_no in range(lo, len(self.suffixes)):
+            if self._prefix(suffix_no, key_length) != key:
+                return False
+            if key_length == len(ids) or \
+               self._prefix(suffix_no, len(ids)) == ids:
+                return True
+        return False
+
+    def contains(self, words: list[str] | tuple[str]):
+        """ Returns True if the sequence of `words` appears in the corpus. """
+        word_ids = self.word_ids
+        ids = []
+        for word in words:
+            i = word_ids.get(word)
+            if i is None:  # Unknown words never appear in the corpus
+                return False
+            ids.append(i)
+        return self.contains_ids(ids)
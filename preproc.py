@@ -0,0 +1,144 @@
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+
+from unidecode import unidecode
+
+from txtsplit import split_into_morps, tokenizer_version, warm_up_taggers
+from txtutils import chunk_and_split, clean_split_text
+
+# Number of texts sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 64
+# Version of the cleaning and splitting of `parse_text()` with the default
+# arguments. Increment it when a change of `txtutils` or `txtsplit` changes
+# the results, so that the cached results (see `tokcache.py`) are made again.
+PREPROC_VERSION = 1
+
+def pipeline_version():
+    """ Returns a string identifying the version of `parse_text()` with the
+    default arguments, i.e. `PREPROC_VERSION` and the version of MeCab and
+    its dictionary (see `txtsplit.tokenizer_version()`). """
+    return f"preproc-{PREPROC_VERSION}/{tokenizer_version()}"
+
+def split_sentence(sentence: str, reject_pat=None, splitter=None, **kwargs):
+    """ Splits a sentence into words, unless it is rejected as
+    `JPText.test_sentence_input()` does.
+
+    Args:
+        sentence (str): Sentence cleaned and split by `clean_split_text()`.
+        reject_pat (re.Pattern): Pattern of the sentences to be rejected (on
+                                 the text decoded by `unidecode()`), or None
+                                 to reject only empty sentences.
+        splitter (function): Callback function for `chunk_and_split()`.
+                             Default is `split_into_morps()`.
+
+    `**kwargs` are passed to `chunk_and_split()`.
+
+    Return:
+        list (str) | None: List of words, or None if rejected.
+    """
+    if len(sentence.strip()) == 0:
+        return None
+    if reject_pat is not None and reject_pat.search(unidecode(sentence)):
+        return None
+    return chunk_and_split(splitter or split_into_morps, sentence, **kwargs)
+
+def parse_text(text: str, reject_pat=None, splitter=None, **kwargs):
+    """ Cleans text, splits it into sentences, and splits the sentences into
+    words, i.e. the same as `JPText.generate_corpus()` with the default
+    methods.
+
+    `**kwargs` are passed to `clean_split_text()` and `chunk_and_split()`
+    (see `split_sentence()` for the other arguments).
+
+    Return:
+        list (list[str]): List of runs (lists of words).
+
+    Example:
+        ```
+        >>> parse_text("吾輩は猫である。名前はまだ無い。")
+        [["吾輩", "は", "猫", "で", "ある", "。"],
+         ["名前", "は", "まだ", "無い", "。"]]
+        ```
+    """
+    runs = []
+    for sentence in clean_split_text(text, **kwargs):
+        run = split_sentence(sentence, reject_pat, splitter, **kwargs)
+        if run is not None:
+            runs.append(run)
+    return runs
+
+def _init_worker():
+    # Create the tagger of the worker process before the first chunk
+    warm_up_taggers()
+
+def _parse_chunk(texts: list[str], clean: bool, reject_pat, kwargs: dict):
+    """ Parses a chunk of texts in a worker process. """
+    if clean:
+        return [parse_text(text, reject_pat, **kwargs) for text in texts]
+    return [split_sentence(sentence, reject_pat, **kwargs)
+            for sentence in texts]
+
+def _iter_chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def iter_parsed_texts(texts, workers: int | None = 1,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, reject_pat=None,
+                      clean: bool = True, **kwargs):
+    """ Yields the runs of each text of `texts` (see `parse_text()`) in
+    order, cleaning and splitting the texts in a pool of `workers` processes
+    (`os.cpu_count()` if None).
+
+    `texts` are read lazily, `chunk_size` texts at a time for each worker, and
+    at most two chunks per worker are in flight, so a stream of texts (e.g.
+    sections read from a cursor) is never held as a whole. Each worker
+    process splits words with its own MeCab tagger, since the tagger holds
+    the GIL while parsing. Workers are started with the "spawn" method (see
+    `genpool.GenerationPool`). If workers == 1, the texts are parsed in this
+    process.
+
+    If clean == False, `texts` are taken as sentences already cleaned and
+    split, and the words of each sentence are yielded instead (None if
+    rejected, see `split_sentence()`).
+
+    `reject_pat` and `**kwargs` are passed to `parse_text()`, and must be
+    picklable.
+
+    Example:
+        ```
+        >>> for runs in iter_parsed_texts(sections, workers=4):
+        ...     builder.add_runs(runs)
+        ```
+    """
+    workers = workers or os.cpu_count()
+    if workers < 1:
+        raise ValueError(f"Number of workers must be positive, got "
+                         f"{workers}.")
+
+    if workers == 1:
+        for chunk in _iter_chunks(texts, chunk_size):
+            yield from _parse_chunk(chunk, clean, reject_pat, kwargs)
+        return
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )
+    pending = collections.deque()
+    try:
+        for chunk in _iter_chunks(texts, chunk_size):
+            pending.append(executor.submit(_parse_chunk, chunk, clean,
+                                           reject_pat, kwargs))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Not to be run when the results are not needed any more
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
@@ -0,0 +1,144 @@
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import urllib.request
+
+class ConnectionPool:
+    """ Pool of read-only SQLite connections shared across threads.
+
+    Connections are opened lazily up to `size`, and a thread borrows one
+    connection at a time with `connection()`. When all connections are in use,
+    `connection()` blocks until one is returned to the pool.
+
+    Args:
+        db_path: Path to the database file.
+        size: Maximum number of open connections.
+        immutable: If True, the database is opened with `immutable=1`, which
+                   skips file locking and change detection. Use it only if
+                   the file is never modified while the pool is alive.
+        mmap_size: Value of `PRAGMA mmap_size` (bytes).
+        cache_size: Page cache size of each connection (KiB).
+
+    Example:
+        ```
+        >>> pool = ConnectionPool("resource.sqlite3", size=4)
+        >>> with pool.connection() as conn:
+        ...     conn.execute("SELECT COUNT(*) FROM councils").fetchone()
+        (42,)
+        ```
+    """
+    def __init__(self, db_path: str, size: int = 8, immutable: bool = False,
+                 mmap_size: int = 256 * 1024 ** 2, cache_size: int = 64 * 1024):
+        if size < 1:
+            raise ValueError(f"Pool size must be positive, got {size}.")
+
+        self.db_path = db_path
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+
+        # Most recently used connections first, to keep their caches warm.
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        path = urllib.request.pathname2url(os.path.abspath(self.db_path))
+        uri = f"file:{path}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        # Negative value of `cache_size` means the size in KiB.
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_size)}")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """ Borrows a connection from the pool during the `with` block. """
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """ Closes idle connections in the pool. """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class ResourceLookup:
+    """ In-process lookup tables of `councils` and `speakers` in the corpus
+    database.
+
+    The tables are loaded with one query each, and reloaded when the database
+    file (or its WAL file) changes on disk, so that routes can resolve council
+    and speaker fields of any number of records without extra queries.
+
+    Example:
+        ```
+        >>> lookup = ResourceLookup("resource.sqlite3")
+        >>> councils, speakers = lookup.tables(cur)
+        >>> councils.get("council_id", ("", ""))
+        ("令和5年3月定例会", "2023-03-01")
+        ```
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._stamp = None
+        # `(councils, speakers)`. Replaced as a whole on reload.
+        self._tables = ({}, {})
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stamp.append(None)
+            else:
+                stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def tables(self, cur: sqlite3.Cursor):
+        """ Returns a tuple of dicts `(councils, speakers)`.
+
+        `councils` maps council IDs to `(name, held_on)`, and `speakers` maps
+        speaker IDs to `(name, party)`. When the database file has changed
+        since the last call, the tables are reloaded by using `cur`.
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return self._tables
+
+        with self._lock:
+            if stamp != self._stamp:
+                cur.execute("SELECT id, name, held_on FROM councils")
+                councils = {
+                    fields[0]: (fields[1], fields[2])
+                    for fields in cur.fetchall()
+                }
+                cur.execute("SELECT id, name, party FROM speakers")
+                speakers = {
+                    fields[0]: (fields[1], fields[2])
+                    for fields in cur.fetchall()
+                }
+                self._tables = (councils, speakers)
+                self._stamp = stamp
+
+        return self._tables
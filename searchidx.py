@@ -0,0 +1,261 @@
+import json
+import sqlite3
+
+# Morpheme-level inverted index over `sections.parsed_sentences`.
+# One row per (morpheme, section) pair. `section_rowid` refers to the rowid of
+# `sections`, so hits can be fetched by rowid lookups in the original order.
+# `position` is the offset of the first occurrence of the morpheme in the
+# joined text of the section (see `joined_text()`), stored in `TEXTS_TABLE`,
+# from which snippets are cut out by SQLite without loading the section.
+# Keywords are looked up in the distinct morphemes `MORPS_TABLE` by `LIKE`, so
+# that they match parts of morphemes as `parsed_sentences LIKE '%kw%'` does.
+# `META_TABLE` records the largest rowid of `sections` which is indexed.
+POSTINGS_TABLE = "search_postings"
+TEXTS_TABLE = "search_texts"
+MORPS_TABLE = "search_morps"
+META_TABLE = "search_meta"
+
+# Characters with which `parsed_sentences LIKE '%kw%'` does not only match
+# parts of morphemes: the JSON syntax (and escapes) and the wildcards of `LIKE`
+UNINDEXABLE_CHARS = set('"\\,[] %_')
+
+# Maximum number of characters of a snippet, excluding the ellipses
+SNIPPET_CHARS = 100
+ELLIPSIS = "(…)"
+# Lowers only ASCII letters, as `LIKE` and `lower()` of SQLite do, keeping the
+# offsets of the characters
+_ASCII_LOWER_TRANS = str.maketrans(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"
+)
+
+def section_morps(parsed_sentences: str | list[list[str]]):
+    """ Returns the set of morphemes in a `parsed_sentences` value.
+
+    Args:
+        parsed_sentences: JSON string (as stored in `sections.parsed_sentences`)
+                          or list of lists of morphemes.
+
+    Return:
+        set [str]: Distinct morphemes of the section.
+    """
+    if type(parsed_sentences) is str:
+        parsed_sentences = json.loads(parsed_sentences)
+    return {morp for sentence in parsed_sentences for morp in sentence}
+
+def joined_text(parsed_sentences: list[list[str]]):
+    """ Joins morphemes by spaces and sentences by " | ", the text from which
+    the snippets of `/search` are made. """
+    return " | ".join([" ".join(morps) for morps in parsed_sentences])
+
+def first_positions(parsed_sentences: list[list[str]]):
+    """ Returns a dict of each morpheme in `parsed_sentences` to the offset of
+    its first occurrence in `joined_text(parsed_sentences)`. """
+    positions = {}
+    pos = 0
+    for sentence in parsed_sentences:
+        for morp in sentence:
+            positions.setdefault(morp, pos)
+            pos += len(morp) + 1  # Followed by " "
+        pos += 2  # " | " instead of the last " "
+    return positions
+
+def highlight_spans(text: str, kws: list[str]):
+    """ Returns the spans of all occurrences of any of `kws` (in lower case)
+    in `text`, ignoring the case of ASCII letters as `LIKE` does.
+
+    Return:
+        list [list[int]]: Sorted list of `[start, end]` offsets, where
+                          overlapping or adjacent spans are merged.
+
+    Example:
+        ```
+        >>> highlight_spans("議会 の 議員 と 議会", ["議会", "議"])
+        [[0, 2], [5, 6], [10, 12]]
+        ```
+    """
+    text = text.translate(_ASCII_LOWER_TRANS)
+    spans = []
+    for kw in set(kws):
+        if not kw:
+            continue
+        start = text.find(kw)
+        while start != -1:
+            spans.append([start, start + len(kw)])
+            start = text.find(kw, start + 1)
+    spans.sort()
+
+    merged = []
+    for span in spans:
+        if merged and span[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span[1])
+        else:
+            merged.append(span)
+    return merged
+
+def make_snippet(window: str, kws: list[str], position: int,
+                 text_length: int):
+    """ Makes a snippet of a search hit from a window of its text.
+
+    Args:
+        window: Characters of the text from `position`, e.g. cut out by
+                `substr()` of SQLite. The snippet has the first
+                `SNIPPET_CHARS` of them, and the next one (if any) is used
+                only to tell whether the last word of the snippet is cut off.
+        kws: Keywords to be highlighted.
+        position: Offset of the window in the text.
+        text_length: Length of the whole text.
+
+    Return:
+        tuple[str, list[list[int]]]: The snippet with `ELLIPSIS` before and
+                                     after it if the text continues, and the
+                                     spans of the keywords in it (see
+                                     `highlight_spans()`).
+    """
+    snippet = window[:SNIPPET_CHARS]
+    prefix = f"{ELLIPSIS} " if position > 0 else ""
+    suffix = f" {ELLIPSIS}" if position + len(snippet) < text_length else ""
+    # Words cut off at the end of the snippet are not highlighted
+    spans = [[start + len(prefix), end + len(prefix)]
+             for start, end in highlight_spans(window, kws)
+             if end <= len(snippet)]
+    return prefix + snippet + suffix, spans
+
+def build_search_index(db_path: str, batch_size: int = 1000):
+    """ (Re)builds the inverted index table `POSTINGS_TABLE`, the distinct
+    morphemes `MORPS_TABLE`, and the joined texts `TEXTS_TABLE` of snippets,
+    in the database.
+
+    Morphemes are taken from the existing `sections.parsed_sentences` column,
+    i.e. they are produced by the same `chunk_and_split(split_into_morps, ...)`
+    tokenization which `/search` applies to queries with `splitQuery`.
+    The largest rowid of `sections` is recorded in `META_TABLE` when the index
+    is complete, and `has_search_index()` compares it with `sections`.
+
+    Args:
+        db_path: Path to the corpus database (`resource.sqlite3`).
+        batch_size: Number of sections read from the cursor at once.
+    """
+    conn = sqlite3.connect(db_path)
+    read_cur = conn.cursor()
+    write_cur = conn.cursor()
+
+    # Dropped first, so that an interrupted build leaves no usable index
+    write_cur.execute(f"DROP TABLE IF EXISTS {META_TABLE}")
+    write_cur.execute(f"DROP TABLE IF EXISTS {POSTINGS_TABLE}")
+    write_cur.execute(f"DROP TABLE IF EXISTS {MORPS_TABLE}")
+    write_cur.execute(f"DROP TABLE IF EXISTS {TEXTS_TABLE}")
+    write_cur.execute(
+        f"CREATE TABLE {POSTINGS_TABLE} ("
+        "morp TEXT NOT NULL, "
+        "section_rowid INTEGER NOT NULL, "
+        "position INTEGER NOT NULL, "
+        "PRIMARY KEY (morp, section_rowid)"
+        ") WITHOUT ROWID"
+    )
+    write_cur.execute(
+        f"CREATE TABLE {TEXTS_TABLE} ("
+        "section_rowid INTEGER PRIMARY KEY, "
+        "text TEXT NOT NULL"
+        ")"
+    )
+
+    read_cur.execute("SELECT MAX(rowid) FROM sections")
+    max_rowid = read_cur.fetchone()[0]
+    read_cur.execute(
+        "SELECT rowid, parsed_sentences FROM sections WHERE rowid <= ?",
+        [max_rowid]
+    )
+    while True:
+        records = read_cur.fetchmany(batch_size)
+        if not records:
+            break
+        records = [(rowid, json.loads(parsed_sentences))
+                   for rowid, parsed_sentences in records if parsed_sentences]
+        write_cur.executemany(
+            f"INSERT INTO {POSTINGS_TABLE} (morp, section_rowid, position) "
+            "VALUES (?, ?, ?)",
+            [
+                (morp, rowid, position)
+                for rowid, parsed_sentences in records
+                for morp, position in first_positions(parsed_sentences).items()
+            ]
+        )
+        write_cur.executemany(
+            f"INSERT INTO {TEXTS_TABLE} (section_rowid, text) VALUES (?, ?)",
+            [(rowid, joined_text(parsed_sentences))
+             for rowid, parsed_sentences in records]
+        )
+
+    write_cur.execute(
+        f"CREATE TABLE {MORPS_TABLE} (morp TEXT PRIMARY KEY) WITHOUT ROWID"
+    )
+    write_cur.execute(
+        f"INSERT INTO {MORPS_TABLE} SELECT DISTINCT morp FROM {POSTINGS_TABLE}"
+    )
+    write_cur.execute(f"CREATE TABLE {META_TABLE} (max_rowid INTEGER)")
+    write_cur.execute(f"INSERT INTO {META_TABLE} VALUES (?)", [max_rowid])
+
+    conn.commit()
+    read_cur.close()
+    write_cur.close()
+    conn.close()
+
+def has_search_index(cur: sqlite3.Cursor):
+    """ Returns True if the database of `cur` has a complete search index
+    which is up to date, i.e. built when the largest rowid of `sections` was
+    the current one. An index built before the distinct morphemes and the
+    high-water mark were added is not used, nor is one older than the
+    sections appended since (run `build_search_index()` again). Sections
+    rewritten in place are not detected. """
+    cur.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN "
+        "(?, ?, ?, ?)", [POSTINGS_TABLE, TEXTS_TABLE, MORPS_TABLE, META_TABLE]
+    )
+    if cur.fetchone()[0] != 4:
+        return False
+    cur.execute(
+        f"SELECT (SELECT max_rowid FROM {META_TABLE}) IS "
+        "(SELECT MAX(rowid) FROM sections)"
+    )
+    return cur.fetchone()[0] == 1
+
+def is_indexable(kws: list[str]):
+    """ Returns True if the hits of `kws` found by the search index are the
+    same as `parsed_sentences LIKE '%kw%'` for all keywords, i.e. no keyword
+    is empty or has any of `UNINDEXABLE_CHARS`. """
+    return all(kw and UNINDEXABLE_CHARS.isdisjoint(kw) for kw in kws)
+
+def matching_morps_query():
+    """ Returns a SQL subquery selecting the morphemes which contain a keyword
+    (ignoring the case of ASCII letters), which is to be passed as its
+    parameter by `like_pattern()`. """
+    return f"SELECT morp FROM {MORPS_TABLE} WHERE morp LIKE ?"
+
+def like_pattern(kw: str):
+    """ Returns the parameter of `matching_morps_query()` for `kw`. """
+    return f"%{kw}%"
+
+def matching_rowids_query(kws: list[str]):
+    """ Returns a SQL subquery selecting rowids of sections that contain all
+    keywords `kws`, each of which is to be passed as its parameter by
+    `like_pattern()`.
+
+    A keyword matches any morpheme containing it (e.g. "議" matches "議会"),
+    so the hits are the same as `parsed_sentences LIKE '%kw%'` if
+    `is_indexable(kws)`.
+
+    Example:
+        ```
+        >>> sql = matching_rowids_query(["議会", "の"])
+        >>> cur.execute(f"SELECT COUNT(*) FROM ({sql})",
+        ...             [like_pattern(kw) for kw in ["議会", "の"]])
+        ```
+    """
+    return " INTERSECT ".join(
+        [f"SELECT DISTINCT section_rowid FROM {POSTINGS_TABLE} WHERE morp IN "
+         f"({matching_morps_query()})" for _ in kws]
+    )
+
+if __name__ == "__main__":
+    build_search_index("./resource.sqlite3")
+    print(f"Search index '{POSTINGS_TABLE}' has been built.")
@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import traceback
+
+# Seconds waited after `make_sentence()` failed, doubled on each consecutive
+# failure up to `MAX_BACKOFF`
+MIN_BACKOFF = 0.1
+MAX_BACKOFF = 10.0
+
+class SentencePool:
+    """ Pool of already-validated sentences, kept filled to `depth` by a
+    background thread.
+
+    The thread starts on the first `pop()` (again after a fork, since threads
+    do not survive it) unless `stop()` has been called. It calls
+    `make_sentence()` and keeps its outputs except None. When it returns None
+    or raises an exception (which is printed), the thread waits before the
+    next call, longer for each consecutive failure (from `MIN_BACKOFF` to
+    `MAX_BACKOFF` seconds), so that a model failing to make sentences does
+    not keep a CPU busy. `pop()` takes a sentence in O(1) without waiting for
+    it to be made.
+
+    Args:
+        make_sentence: Function that returns a new sentence, or None if failed.
+        depth: Number of sentences to be kept in the pool.
+
+    Example:
+        ```
+        >>> pool = SentencePool(lambda: model.make_sentence(tries=10), 32)
+        >>> pool.pop() or model.make_sentence(tries=10)
+        "..."
+        ```
+    """
+    def __init__(self, make_sentence, depth: int = 32):
+        if depth < 1:
+            raise ValueError(f"Pool depth must be positive, got {depth}.")
+
+        self.make_sentence = make_sentence
+        self.depth = depth
+        self._queue = queue.Queue(maxsize=depth)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def _fill(self):
+        backoff = MIN_BACKOFF
+        while not self._stopped.is_set():
+            try:
+                output = self.make_sentence()
+            except Exception:
+                traceback.print_exc()
+                output = None
+            if output is None:
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = MIN_BACKOFF
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(output, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def start(self):
+        """ Starts the background thread if it is not running in this
+        process. """
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Sentences copied from the parent process may be popped in
+                # other processes as well
+                self._queue = queue.Queue(maxsize=self.depth)
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._fill, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """ Stops the background thread. """
+        self._stopped.set()
+
+    def clear(self):
+        """ Discards the sentences in the pool, e.g. when the model has been
+        replaced. """
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def pop(self):
+        """ Returns a sentence in the pool, or None if the pool is empty. """
+        if not self._stopped.is_set() and (
+            self._pid != os.getpid() or not self._thread.is_alive()
+        ):
+            self.start()
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
@@ -0,0 +1,88 @@
+import array
+import bisect
+
+from markovify.chain import BEGIN
+
+from intchain import BEGIN_ID, FlatChain
+
+class StatePrefixIndex:
+    """ Index of the states of a chain by their leading words (`BEGIN`s
+    excluded), to find the states that begin with given words in
+    O(log(number of states)).
+
+    States are kept in the order sorted by their words without `BEGIN`s, which
+    works as a flattened trie of the states: states beginning with the same
+    words are adjacent in the order.
+
+    Args:
+        chain: `markovify.Chain` or `intchain.FlatChain`.
+        order: Sequence of state indices in the sorted order (see
+               `sort_states()`). Sorted here if None.
+    """
+    def __init__(self, chain, order=None):
+        self.chain = chain
+        if isinstance(chain, FlatChain):
+            self._states = None
+            self._key = self._flat_key
+        else:
+            self._states = list(chain.model.keys())
+            self._key = self._model_key
+        self.order = self.sort_states() if order is None else order
+
+    def _model_key(self, state_no):
+        return tuple(word for word in self._states[state_no] if word != BEGIN)
+
+    def _flat_key(self, state_no):
+        state_size = self.chain.state_size
+        return tuple(
+            i for i in self.chain.states[state_no * state_size :
+                                         (state_no + 1) * state_size]
+            if i != BEGIN_ID
+        )
+
+    def sort_states(self):
+        """ Returns an uint32 array of state indices in the sorted order. """
+        if self._states is None:
+            n_states = len(self.chain.offsets) - 1
+        else:
+            n_states = len(self._states)
+        return array.array("I", sorted(range(n_states), key=self._key))
+
+    def _state(self, state_no):
+        if self._states is None:
+            return self.chain.decode_state(state_no)
+        return self._states[state_no]
+
+    def find(self, beginning: tuple[str]):
+        """ Returns a list of the states (tuples of words) that begin with the
+        words `beginning` when `BEGIN`s are excluded. """
+        if self._states is None:
+            try:
+                prefix = self.chain.encode(beginning)
+            except KeyError:  # Unknown words
+                return []
+        else:
+            prefix = tuple(beginning)
+        length = len(prefix)
+
+        key = lambda order_no: self._key(self.order[order_no])[:length]
+        lo = bisect.bisect_left(_KeyView(key, len(self.order)), prefix)
+
+        ret = []
+        for order_no in range(lo, len(self.order)):
+            if key(order_no) != prefix:
+                break
+            ret.append(self._state(self.order[order_no]))
+        return ret
+
+class _KeyView:
+    """ Sequence of keys computed on demand, to be searched by `bisect`. """
+    def __init__(self, key, length):
+        self._key = key
+        self._length = length
+
+    def __getitem__(self, i):
+        return self._key(i)
+
+    def __len__(self):
+        return self._length
@@ -0,0 +1,256 @@
+import array
+import hashlib
+import sqlite3
+import sys
+
+from preproc import iter_parsed_texts, pipeline_version
+
+# Cache of the runs of each section made by `preproc.parse_text()` from
+# `sections.content`, with one row per section. `content_key` is a hash of the
+# content and the version of the pipeline (see `content_key()`), and `tokens`
+# is a uint32 array (little-endian) of word IDs of the runs, each of which is
+# followed by `RUN_END_ID`. Word IDs refer to `VOCAB_TABLE`, to which new words
+# are only appended, so IDs never change.
+# The cache is read by `mkmamodel.make_model_from_text()` (`--from-text`) only;
+# the other builds read `sections.parsed_sentences`, which may not match it.
+CACHE_TABLE = "token_cache"
+VOCAB_TABLE = "token_vocab"
+RUN_END_ID = 0
+
+DEFAULT_BATCH_SIZE = 256
+
+def content_key(content: str, version: str):
+    """ Returns the key (16-byte hash) of a section with `content` tokenized
+    by the pipeline of `version` (see `preproc.pipeline_version()`). """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(version.encode())
+    h.update(b"\0")
+    h.update(content.encode())
+    return h.digest()
+
+def encode_runs(runs: list[list[str]], intern):
+    """ Encodes runs into `tokens` of `CACHE_TABLE`.
+
+    Args:
+        runs: List of runs (lists of words).
+        intern: Function that returns the ID of a word.
+
+    Return:
+        bytes: Little-endian uint32 array of the word IDs.
+    """
+    ids = array.array("I")
+    for run in runs:
+        ids.extend([intern(word) for word in run])
+        ids.append(RUN_END_ID)
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids.tobytes()
+
+def decode_runs(tokens: bytes, words: list[str | None]):
+    """ Decodes `tokens` of `CACHE_TABLE` into runs.
+
+    Args:
+        tokens: Encoded runs (see `encode_runs()`).
+        words: Vocabulary loaded by `load_vocab()`.
+
+    Return:
+        list (list[str]): List of runs (lists of words).
+    """
+    ids = array.array("I")
+    ids.frombytes(tokens)
+    if sys.byteorder == "big":
+        ids.byteswap()
+    # `words[RUN_END_ID]` is None, which marks the end of each run
+    decoded = list(map(words.__getitem__, ids))
+    runs = []
+    start = 0
+    while start < len(decoded):
+        end = decoded.index(None, start)
+        runs.append(decoded[start:end])
+        start = end + 1
+    return runs
+
+def has_token_cache(cur: sqlite3.Cursor):
+    """ Returns True if the database of `cur` has the token cache. """
+    cur.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?",
+        [CACHE_TABLE]
+    )
+    return cur.fetchone()[0] == 1
+
+def load_vocab(cur: sqlite3.Cursor):
+    """ Returns the list of words of `VOCAB_TABLE` indexed by word ID, where
+    `RUN_END_ID` is None. """
+    words = [None]
+    cur.execute(f"SELECT word FROM {VOCAB_TABLE} ORDER BY id")
+    words += [fields[0] for fields in cur.fetchall()]
+    return words
+
+def update_token_cache(db_path: str, section_type: int | None = None,
+                       workers: int | None = 1,
+                       batch_size: int = DEFAULT_BATCH_SIZE):
+    """ Creates or updates the token cache in the database.
+
+    Only sections whose content or pipeline version has changed since they
+    were cached (i.e. whose key differs, see `content_key()`) are tokenized,
+    in `workers` processes (see `preproc.iter_parsed_texts()`). Sections with
+    the same content as a cached one copy its tokens without tokenizing. The
+    cache of deleted sections is removed.
+
+    Args:
+        db_path: Path to the corpus database (`resource.sqlite3`).
+        section_type: Type of sections to be updated, or None for all.
+        workers: Number of processes tokenizing sections.
+        batch_size: Number of sections read or written at once.
+
+    Return:
+        int: Number of sections tokenized.
+    """
+    version = pipeline_version()
+    conn = sqlite3.connect(db_path)
+    read_cur = conn.cursor()
+    write_cur = conn.cursor()
+
+    write_cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {VOCAB_TABLE} ("
+        "id INTEGER PRIMARY KEY, "
+        "word TEXT NOT NULL UNIQUE"
+        ")"
+    )
+    write_cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {CACHE_TABLE} ("
+        "section_rowid INTEGER PRIMARY KEY, "
+        "content_key BLOB NOT NULL, "
+        "tokens BLOB NOT NULL"
+        ")"
+    )
+    write_cur.execute(
+        f"CREATE INDEX IF NOT EXISTS {CACHE_TABLE}_key "
+        f"ON {CACHE_TABLE} (content_key)"
+    )
+    write_cur.execute(f"DELETE FROM {CACHE_TABLE} WHERE section_rowid NOT IN "
+                      "(SELECT rowid FROM sections)")
+
+    read_cur.execute(f"SELECT section_rowid, content_key FROM {CACHE_TABLE}")
+    cached_keys = dict(read_cur.fetchall())
+
+    query = "SELECT rowid, content FROM sections"
+    params = []
+    if section_type is not None:
+        query += " WHERE type=?"
+        params.append(section_type)
+    query += " ORDER BY rowid"
+
+    # Keys whose tokens are (or will be) in the cache
+    valid_keys = set()
+    stale = []
+    read_cur.execute(query, params)
+    while rows := read_cur.fetchmany(batch_size):
+        for rowid, content in rows:
+            key = content_key(content or "", version)
+            if cached_keys.get(rowid) == key:
+                valid_keys.add(key)
+            else:
+                stale.append((rowid, key))
+    to_copy = []
+    to_tokenize = []
+    for rowid, key in stale:
+        if key in valid_keys:
+            to_copy.append((rowid, key))
+        else:
+            to_tokenize.append((rowid, key))
+            valid_keys.add(key)
+
+    word_ids = {word: i for i, word in enumerate(load_vocab(read_cur))
+                if word is not None}
+    new_words = []
+
+    def intern(word):
+        word_id = word_ids.get(word)
+        if word_id is None:
+            word_id = word_ids[word] = len(word_ids) + 1
+            new_words.append((word_id, word))
+        return word_id
+
+    def write(records):
+        write_cur.executemany(
+            f"INSERT INTO {VOCAB_TABLE} (id, word) VALUES (?, ?)", new_words
+        )
+        new_words.clear()
+        write_cur.executemany(
+            f"INSERT OR REPLACE INTO {CACHE_TABLE} "
+            "(section_rowid, content_key, tokens) VALUES (?, ?, ?)", records
+        )
+
+    def iter_stale_texts():
+        tokenize_rowids = {rowid for rowid, _ in to_tokenize}
+        read_cur.execute(query, params)
+        while rows := read_cur.fetchmany(batch_size):
+            for rowid, content in rows:
+                if rowid in tokenize_rowids:
+                    yield content or ""
+
+    records = []
+    for (rowid, key), runs in zip(
+        to_tokenize, iter_parsed_texts(iter_stale_texts(), workers)
+    ):
+        records.append((rowid, key, encode_runs(runs, intern)))
+        if len(records) >= batch_size:
+            write(records)
+            records = []
+    write(records)
+
+    write_cur.executemany(
+        f"INSERT OR REPLACE INTO {CACHE_TABLE} "
+        "(section_rowid, content_key, tokens) "
+        f"SELECT ?, content_key, tokens FROM {CACHE_TABLE} "
+        "WHERE content_key=? LIMIT 1", to_copy
+    )
+
+    conn.commit()
+    read_cur.close()
+    write_cur.close()
+    conn.close()
+    return len(to_tokenize)
+
+def iter_cached_runs(cur: sqlite3.Cursor, section_type: int,
+                     batch_size: int = DEFAULT_BATCH_SIZE,
+                     rowid_range: tuple[int, int] | None = None):
+    """ Yields the cached runs of each section of `section_type` in the order
+    of rowid, in the same way as `mkmamodel.iter_parsed_sentences()` does.
+
+    Raises `ValueError` if a section is not cached; update the cache by
+    `update_token_cache()` before.
+    """
+    words = load_vocab(cur)
+    query = (f"SELECT tokens FROM sections LEFT JOIN {CACHE_TABLE} "
+             "ON section_rowid = sections.rowid WHERE type=?")
+    params = [section_type]
+    if rowid_range is not None:
+        lo, hi = rowid_range
+        if lo is not None:
+            query += " AND sections.rowid > ?"
+            params.append(lo)
+        query += " AND sections.rowid <= ?"
+        params.append(hi)
+    cur.execute(query + " ORDER BY sections.rowid", params)
+    while rows := cur.fetchmany(batch_size):
+        for fields in rows:
+            if fields[0] is None:
+                raise ValueError("A section is not in the token cache; "
+                                 "update it.")
+            yield decode_runs(fields[0], words)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Update the token cache of ./resource.sqlite3."
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    n_tokenized = update_token_cache("./resource.sqlite3",
+                                     workers=args.workers)
+    print(f"Token cache '{CACHE_TABLE}' has been updated "
+          f"({n_tokenized} sections tokenized).")
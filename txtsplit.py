@@ -1,19 +1,300 @@
+import collections
+import contextlib
 import os
+import queue
+import threading
+from typing import NamedTuple
 
-import MeCab
-import unidic
+# MeCab and unidic are imported, and the taggers are created, on first use
+# (see `TaggerPool`), so that importing this module takes no time. A MeCab
+# tagger must not parse in two threads at once, so a thread borrows a tagger
+# from the pool while it parses.
+_import_lock = threading.Lock()
 
-UNIDIC_DIR = unidic.DICDIR.replace(os.sep, '/')
-m = MeCab.Tagger('-d ' + UNIDIC_DIR)  # 形態素出力
-mw = MeCab.Tagger('-Owakati -d ' + UNIDIC_DIR)  # 分かち書き出力
+# Maximum number of taggers of each output format (see `TaggerPool`)
+TAGGER_POOL_SIZE = 8
+
+# Number of chunks whose morphemes are cached by `split_into_morps()`
+MORPS_CACHE_SIZE = 4096
+# Normalized chunk -> tuple of its morphemes, in least recently used order
+_morps_cache = collections.OrderedDict()
+_morps_cache_lock = threading.Lock()
+
+def get_unidic_dir():
+    """Returns the directory of the unidic dictionary."""
+    import unidic
+
+    return unidic.DICDIR.replace(os.sep, '/')
+
+def _import_mecab():
+    # Importing a module in several threads at once may deadlock on old
+    # Pythons, and MeCab is imported by the first thread that needs a tagger
+    with _import_lock:
+        import MeCab
+
+    return MeCab
+
+def create_tagger(wakati:bool=False):
+    """Creates a new MeCab tagger.
+
+    Args:
+        wakati (bool): If True, the tagger outputs words separated by spaces
+                       (`-Owakati`). Otherwise, it outputs morphemes with
+                       their features.
+
+    Return:
+        MeCab.Tagger: The tagger.
+    """
+    MeCab = _import_mecab()
+    options = '-d ' + get_unidic_dir()
+    if wakati:
+        options = '-Owakati ' + options  # 分かち書き出力
+    return MeCab.Tagger(options)
+
+class TaggerPool:
+    """Pool of MeCab taggers shared across threads.
+
+    Taggers are created lazily up to `size`, and a thread borrows one tagger
+    at a time with `tagger()`, since a tagger is not safe to be called
+    concurrently. When all taggers are in use, `tagger()` blocks until one is
+    returned to the pool. Taggers are kept in the pool, so that threads
+    serving one request each (e.g. under `flask run`) reuse them instead of
+    creating one per thread. The dictionary files are memory-mapped by MeCab,
+    so all the taggers share them.
+
+    Args:
+        wakati (bool): Output format of the taggers (see `create_tagger()`).
+        size (int): Maximum number of taggers.
+
+    Example:
+        ```
+        >>> pool = TaggerPool(wakati=True, size=4)
+        >>> with pool.tagger() as tagger:
+        ...     tagger.parse("吾輩は猫である")
+        "吾輩 は 猫 で ある \\n"
+        ```
+    """
+    def __init__(self, wakati:bool=False, size:int=TAGGER_POOL_SIZE):
+        if size < 1:
+            raise ValueError(f"Pool size must be positive, got {size}.")
+
+        self.wakati = wakati
+        self.size = size
+        # Most recently used taggers first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def tagger(self):
+        """Borrows a tagger from the pool during the `with` block."""
+        self._slots.acquire()
+        try:
+            try:
+                tagger = self._idle.get_nowait()
+            except queue.Empty:
+                tagger = create_tagger(self.wakati)
+            try:
+                yield tagger
+            finally:
+                self._idle.put(tagger)
+        finally:
+            self._slots.release()
+
+    def warm_up(self, count:int=1):
+        """Creates taggers in advance until the pool has `count` of them (at
+        most `size`)."""
+        count = min(count, self.size)
+        while self._idle.qsize() < count:
+            self._slots.acquire()
+            try:
+                self._idle.put(create_tagger(self.wakati))
+            finally:
+                self._slots.release()
+
+# Output format (wakati or not) -> pool of the taggers
+_tagger_pools = {False: TaggerPool(False), True: TaggerPool(True)}
+# Taggers of the module attributes `m` and `mw` (see `__getattr__()`)
+_shared_taggers = {}
+
+def get_tagger_pool(wakati:bool=False):
+    """Returns the `TaggerPool` used by `parse()`."""
+    return _tagger_pools[wakati]
+
+def warm_up_taggers(count:int=1, wakati:bool=True):
+    """Creates `count` taggers of the pool in advance (see
+    `TaggerPool.warm_up()`), which also loads MeCab and the dictionary."""
+    get_tagger_pool(wakati).warm_up(count)
+
+def __getattr__(name:str):
+    # The taggers used to be created on import as these module attributes.
+    # They are created on first access now, and are not safe to be used in
+    # several threads at once; use `parse()` instead.
+    if name in ('m', 'mw'):  # 形態素出力, 分かち書き出力
+        wakati = name == 'mw'
+        with _import_lock:
+            tagger = _shared_taggers.get(wakati)
+        if tagger is None:
+            tagger = create_tagger(wakati)
+            with _import_lock:
+                tagger = _shared_taggers.setdefault(wakati, tagger)
+        return tagger
+    if name == 'UNIDIC_DIR':
+        return get_unidic_dir()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def tokenizer_version():
+    """Returns a string identifying the version of MeCab and its dictionary,
+    which changes the results of `split_into_morps()` when updated.
+
+    Example:
+        ```
+        >>> tokenizer_version()
+        "mecab-0.996/dic-102-utf8-756264"
+        ```
+    """
+    MeCab = _import_mecab()
+    with get_tagger_pool(wakati=True).tagger() as tagger:
+        info = tagger.dictionary_info()
+    return f"mecab-{MeCab.VERSION}/dic-{info.version}-{info.charset}-{info.size}"
+
+def parse(text:str, wakati:bool=False):
+    """Parses text with a tagger borrowed from the pool (see `TaggerPool`),
+    and returns the output of MeCab.
+    """
+    with _tagger_pools[wakati].tagger() as tagger:
+        return tagger.parse(text)
+
+class Morpheme(NamedTuple):
+    """A morpheme with its features, parsed by `parse_morphemes()`."""
+    surface: str
+    pronunciation: str
+    reading: str  # Reading of the lemma
+    lemma: str
+    pos: str  # Part of speech, e.g. "名詞-普通名詞-一般"
+    conjugation_type: str
+    conjugation_form: str
+
+def parse_morphemes(text:str):
+    """Parses Japanese text into morphemes with their features (part of
+    speech, lemma, etc.) by the full-feature tagger `m`.
+
+    Args:
+        text (str): String data to parse.
+
+    Return:
+        list (Morpheme): List of morphemes.
+
+    Example:
+        ```
+        >>> parse_morphemes("猫である")
+        [Morpheme(surface="猫", pronunciation="ネコ", reading="ネコ",
+                  lemma="猫", pos="名詞-普通名詞-一般", conjugation_type="",
+                  conjugation_form=""), ...]
+        ```
+    """
+    n_fields = len(Morpheme._fields)
+    ret = []
+    for line in parse(text).splitlines():
+        if line == 'EOS':
+            break
+        # The output format of unidic: surface, pronunciation, reading, lemma,
+        # POS, conjugation type, conjugation form, and accent type
+        fields = line.split('\t')[:n_fields]
+        fields += [''] * (n_fields - len(fields))
+        ret.append(Morpheme(*fields))
+    return ret
+
+def normalize_chunk(text:str):
+    """Normalizes text into the key of the cache of `split_into_morps()`.
+    Leading and trailing whitespaces, which MeCab skips, are stripped.
+    """
+    return text.strip()
+
+def _cache_get(key:str):
+    with _morps_cache_lock:
+        morps = _morps_cache.get(key)
+        if morps is not None:
+            _morps_cache.move_to_end(key)
+        return morps
+
+def _cache_put(key:str, morps:tuple):
+    with _morps_cache_lock:
+        _morps_cache[key] = morps
+        _morps_cache.move_to_end(key)
+        while len(_morps_cache) > MORPS_CACHE_SIZE:
+            _morps_cache.popitem(last=False)
+
+def clear_morps_cache():
+    """Clears the cache of `split_into_morps()`."""
+    with _morps_cache_lock:
+        _morps_cache.clear()
 
 def split_into_morps(text:str):
     """Splits Japanese text into morphems.
 
+    Results are cached for the last `MORPS_CACHE_SIZE` chunks of normalized
+    text (see `normalize_chunk()`), since the same chunks (e.g. prompts and
+    search queries) are split again and again.
+
     Args:
         text (str): String data to split.
 
     Return:
         list (str): List of morphems.
     """
-    return mw.parse(text).strip().split(' ')
+    key = normalize_chunk(text)
+    morps = _cache_get(key)
+    if morps is None:
+        morps = tuple(parse(key, wakati=True).strip().split(' '))
+        _cache_put(key, morps)
+    return list(morps)
+
+def split_chunks_into_morps(chunks:list[str]):
+    """Splits many chunks of Japanese text into morphems with one call of
+    MeCab.
+
+    The chunks not in the cache of `split_into_morps()` are joined by spaces
+    and parsed at once, and the morphemes are assigned back to the chunks by
+    their lengths (MeCab never makes a morpheme across a space). The results
+    are not cached, since MeCab may split the edges of a chunk differently
+    next to its neighbours than alone.
+
+    Args:
+        chunks (list[str]): Chunks to split.
+
+    Return:
+        list (list[str]): List of morphems of each chunk.
+
+    Example:
+        ```
+        >>> split_chunks_into_morps(["吾輩は猫である", "名前はまだ無い"])
+        [["吾輩", "は", "猫", "で", "ある"], ["名前", "は", "まだ", "無い"]]
+        ```
+    """
+    keys = [normalize_chunk(chunk) for chunk in chunks]
+    ret = [None] * len(keys)
+    misses = []
+    for i, key in enumerate(keys):
+        morps = _cache_get(key)
+        if morps is not None:
+            ret[i] = list(morps)
+        elif key == '':
+            ret[i] = ['']  # The same as `split_into_morps('')`
+        else:
+            misses.append(i)
+    if not misses:
+        return ret
+
+    morps = parse(' '.join(keys[i] for i in misses), wakati=True).split()
+    pos = 0
+    for i in misses:
+        length = sum(len(word) for word in keys[i].split())
+        start = pos
+        while length > 0 and pos < len(morps):
+            length -= len(morps[pos])
+            pos += 1
+        if length != 0:
+            # Not aligned with the chunks (never expected); split one by one
+            return [split_into_morps(key) for key in keys]
+        ret[i] = morps[start:pos]
+    return ret
@@ -1,3 +1,4 @@
+import functools
 import re
 import unicodedata
 
@@ -16,14 +17,24 @@ HALFWIDTH_REGEX = r'[\x01-\x7E\xA1-\xDF]'
 HALFWIDTH_REPTN = re.compile(HALFWIDTH_REGEX)  # Used by `tear_paren_contents()`
 FULLWIDTH_REGEX = r'[^\x01-\x7E\xA1-\xDF]'
 
-# Serial width-different characters. Used by `space_width_gap()`.
+# Serial width-different characters.
 HALF_AND_FULLWIDTH_REPTN = re.compile(f'({HALFWIDTH_REGEX})({FULLWIDTH_REGEX})')
 FULL_AND_HALFWIDTH_REPTN = re.compile(f'({FULLWIDTH_REGEX})({HALFWIDTH_REGEX})')
+# A character followed by one of the other width. Used by `space_width_gap()`.
+WIDTH_GAP_REPTN = re.compile(
+    f'({HALFWIDTH_REGEX}(?={FULLWIDTH_REGEX})'
+    f'|{FULLWIDTH_REGEX}(?={HALFWIDTH_REGEX}))'
+)
 
-# Used by `join_chunks()`
 SPACE_BETWEEN_FULLWIDTH_REPTN = re.compile(
     f'({FULLWIDTH_REGEX}) ({FULLWIDTH_REGEX})'
 )
+# A space between fullwidth characters, which does not consume them unlike
+# `SPACE_BETWEEN_FULLWIDTH_REPTN` (the space comes first so that the regex
+# engine looks only at spaces). Used by `join_chunks()`.
+FULLWIDTH_GAP_REPTN = re.compile(
+    f' (?<={FULLWIDTH_REGEX} )(?={FULLWIDTH_REGEX})'
+)
 # Default pattern of sentence separators
 SENTENCE_SEP_REGEX = r'[\r\n\?!。]'
 # Used by `clean_split_text()`
@@ -36,6 +47,9 @@ UNSPLITTABLE_CHUNKS = [f'^{HALFWIDTH_REGEX}+$', f'^{SENTENCE_SEP_REGEX}+$']
 MULTI_WHITESPACES_REPTNS = [re.compile(f"({i})" + "{2,}") for i in [
     " ", r"\r\n", r"\r", r"\n", r"\t"
 ]]
+# The same as `MULTI_WHITESPACES_REPTNS` in one pass for text without line
+# breaks, where spaces and tabs do not affect each other
+MULTI_SPACES_OR_TABS_REPTN = re.compile(r"( ){2,}|(\t){2,}")
 
 # Default pattern of strings in parentheses to be discarded in text cleaning.
 # Used by `tear_paren_contents()`.
@@ -94,6 +108,28 @@ CLEAN_TEXT_SUBS = [[re.compile(i[0]), i[1]] for i in [
     # Remove en/em dashes at the top of sentences/first index. E.g. "—hoge"
     ['(' + SENTENCE_SEP_REGEX + '|^) *[–—]+', r'\1']
 ]]
+
+# `CLEAN_TEXT_SUBS` fused into fewer passes. Used by `clean_text()`.
+# Substitutions of single characters, which do not depend on their neighbours,
+# are merged into `str.translate()` tables, and the number masking and the
+# abbreviation terms, whose matches never overlap, into one alternation.
+# Others may make new matches of the following ones, so they stay in order,
+# but are skipped when the text has no character they need.
+HTML_TAG_REPTN = CLEAN_TEXT_SUBS[0][0]
+EDITORS_NOTE_REPTN = CLEAN_TEXT_SUBS[1][0]
+QUOTE_TRANS = str.maketrans({'’': "'"})
+# "\d+" -> "0" and "0[\.,'・0/]*0[\.,'・0/]*" -> "0" at once, or "a.b" -> "ab"
+NUMBER_OR_ABBREV_REPTN = re.compile(
+    r"(\d+(?:[\.,'・/]*\d[\.,'・/\d]*)?)|([a-z])\.([a-z])"
+)
+MARKS_TRANS = str.maketrans({
+    **{c: None for c in '「」『』‘"“”'},
+    **{c: ' ' for c in '.,、-~・/'},
+})
+RUBY_AOZORA_REPTN = CLEAN_TEXT_SUBS[8][0]
+RUBY_LATEX_REPTN = CLEAN_TEXT_SUBS[9][0]
+TAIL_DASHES_REPTN = CLEAN_TEXT_SUBS[10][0]
+HEAD_DASHES_REPTN = CLEAN_TEXT_SUBS[11][0]
 ################################################################################
 
 ##### Consts for syntax check ##################################################
@@ -156,6 +192,38 @@ CO_EXPS = [[re.compile(f" {i[0]} "), i[1]] for i in [
 ]]
 ################################################################################
 
+@functools.lru_cache(maxsize=64)
+def compile_alternation(patterns: tuple[str | re.Pattern]):
+    """ Compiles regular expressions into one which matches where any of them
+    matches, e.g. for `search()`.
+
+    Args:
+        patterns: Tuple of regular expressions (strings or compiled).
+
+    Return:
+        re.Pattern | None: Compiled pattern, or None if the patterns cannot be
+                           merged, in which case they are to be searched one
+                           by one.
+
+    Patterns cannot be merged if some of them have flags (given to
+    `re.compile()` or inline ones such as `(?i)`, which are global and not
+    allowed inside a group), named groups (which may be duplicated in
+    others), or backreferences (whose group numbers would change).
+    """
+    default_flags = re.compile('').flags
+    sources = []
+    for pattern in patterns:
+        if type(pattern) is not re.Pattern:
+            pattern = re.compile(pattern)
+        if pattern.flags != default_flags or pattern.groupindex:
+            return None
+        if re.search(r'\\[1-9]|\(\?P=', pattern.pattern):
+            return None
+        sources.append(f'(?:{pattern.pattern})')
+    if not sources:
+        return None
+    return re.compile('|'.join(sources))
+
 def space_width_gap(text: str):
     """ Inserts a space between halfwidth and fullwidth characters.
 
@@ -165,9 +233,7 @@ def space_width_gap(text: str):
         "ほげ foo ほげ 012"
         ```
     """
-    text = HALF_AND_FULLWIDTH_REPTN.sub(r'\1 \2', text)
-    text = FULL_AND_HALFWIDTH_REPTN.sub(r'\1 \2', text)
-    return text
+    return WIDTH_GAP_REPTN.sub(r'\1 ', text)
 
 def join_chunks(chunks: list):
     """ Joins strings in `chunks` into one string.
@@ -183,15 +249,29 @@ def join_chunks(chunks: list):
         "ほげふが foo bar"
         ```
     """
-    text = ' '.join(chunks)
+    # Removing a space does not change the neighbours of other spaces, so
+    # each space is kept or removed by its neighbours in one pass
+    return FULLWIDTH_GAP_REPTN.sub('', ' '.join(chunks))
 
-    while True:
-        s = SPACE_BETWEEN_FULLWIDTH_REPTN.subn(r'\1\2', text)
-        if s[1] == 0:
-            break
-        text = s[0]
+def join_chunks_bulk(runs: list[list[str]]):
+    """ Joins each list of strings in `runs` as `join_chunks()` does, in one
+    pass over all of them.
 
-    return text
+    Return:
+        list [str]: Joined strings.
+
+    Example:
+        ```
+        >>> join_chunks_bulk([["ほげ", "ふが"], ["foo", "ほげ"]])
+        ["ほげふが", "foo ほげ"]
+        ```
+    """
+    runs = list(runs)
+    # Line breaks, which are halfwidth, separate the runs
+    text = '\n'.join(' '.join(run) for run in runs)
+    if text.count('\n') != len(runs) - 1:  # Some strings have line breaks
+        return [join_chunks(run) for run in runs]
+    return FULLWIDTH_GAP_REPTN.sub('', text).split('\n')
 
 def chunk_and_split(
     splitter, text: str,
@@ -220,8 +300,12 @@ def chunk_and_split(
         ["吾輩", "は", "tomcat", "で", "ある", "24h"]
         ```
     """
-    no_split_reptns = [i if type(i) is re.Pattern else re.compile(i)
-                       for i in no_split_patterns]
+    no_split_reptn = compile_alternation(tuple(no_split_patterns))
+    if no_split_reptn is None:
+        no_split_reptns = [i if type(i) is re.Pattern else re.compile(i)
+                           for i in no_split_patterns]
+    else:
+        no_split_reptns = [no_split_reptn]
 
     chunks = text.split(' ')
     ret = []
@@ -239,10 +323,222 @@ def chunk_and_split(
     return ret
 
 def remove_extra_whitespaces(text:str):
+    if '\r' not in text and '\n' not in text:
+        return MULTI_SPACES_OR_TABS_REPTN.sub(r"\1\2", text)
     for i in MULTI_WHITESPACES_REPTNS:
         text = i.sub(r"\1", text)
     return text
 
+def _replace_number_or_abbrev(match: re.Match):
+    if match.group(1) is not None:
+        return '0'
+    return match.group(2) + match.group(3)
+
+def clean_text(text: str):
+    """ Applies `CLEAN_TEXT_SUBS` to the text in fewer passes.
+
+    The result is the same as that of applying the substitutions of
+    `CLEAN_TEXT_SUBS` one by one in order, as `clean_split_text()` does with
+    other `subs`.
+
+    Example:
+        ```
+        >>> clean_text("<b>1,000円</b>「ほげ」(注1)")
+        "0円ほげ"
+        ```
+    """
+    if '<' in text:
+        text = HTML_TAG_REPTN.sub('', text)
+    text = EDITORS_NOTE_REPTN.sub('', text)
+    text = text.translate(QUOTE_TRANS)
+    text = NUMBER_OR_ABBREV_REPTN.sub(_replace_number_or_abbrev, text)
+    text = text.translate(MARKS_TRANS)
+    if '《' in text:
+        text = RUBY_AOZORA_REPTN.sub(r'\1', text)
+    if '{' in text:
+        text = RUBY_LATEX_REPTN.sub(r'\1', text)
+    if '–' in text or '—' in text:
+        text = TAIL_DASHES_REPTN.sub(r'\1', text)
+        text = HEAD_DASHES_REPTN.sub(r'\1', text)
+    return text
+
+def _is_content_valid(content: str, invalid_content_reptns: list[re.Pattern]):
+    for r in invalid_content_reptns:
+        if r.search(content):
+            return False
+    return True
+
+def _tear_parens_by_regex(text: str, start: str, end: str,
+                          invalid_content_reptns: list[re.Pattern], ret: list):
+    """ Removes the parentheses `start` and `end` from the text, appending
+    their valid contents to `ret`, and returns the text.
+
+    The innermost parentheses are found by a regular expression and removed,
+    again and again until none is left. Each matched string is removed
+    wherever it appears in the text.
+    """
+    start = re.escape(start)
+    end = re.escape(end)
+    paren_reptn = re.compile(f' *{start}([^{start}{end}]+){end} *')
+    while True:
+        found_parens = list(paren_reptn.finditer(text))
+        if found_parens == []:
+            break
+
+        # List to be used when remove/replace parens in `text`.
+        subs = []
+        for p in found_parens:
+            pre_halfwidth = HALFWIDTH_REPTN.match(
+                text[p.start() - 1 : p.start()]
+            )
+            post_halfwidth = HALFWIDTH_REPTN.match(text[p.end() : p.end() + 1])
+            # If the parens are surrounded half width characters, replace
+            # its part with a space.
+            # E.g. "foo(bar)baz" -> "foo baz",
+            #      "ほげ(ふが)もげ" -> "ほげもげ"
+            if pre_halfwidth and post_halfwidth:
+                repl = ' '
+            else:
+                repl = ''
+            subs.append([p.group(), repl])
+
+            if _is_content_valid(p.group(1), invalid_content_reptns):
+                ret.append(p.group(1))
+
+        for pattern, repl in subs:
+            text = text.replace(pattern, repl)
+
+    return text
+
+def _tear_parens_in_one_scan(text: str, start: str, end: str,
+                             invalid_content_reptns: list[re.Pattern],
+                             ret: list):
+    """ Does the same as `_tear_parens_by_regex()` in linear time for
+    parentheses of different single characters, and returns the text.
+
+    The pairs of parentheses are found by a stack in one scan, and removed in
+    rounds which correspond to the loops of `_tear_parens_by_regex()`: the
+    innermost pairs first, then the pairs whose inner pairs have been removed,
+    and so on. The text is kept in a doubly linked list of tokens (each
+    parenthesis, each space, and each run of other characters), so that a
+    parenthetical part is removed in constant time.
+
+    Returns None if two parentheses have the same contents, since
+    `_tear_parens_by_regex()` removes all the occurrences of a matched string
+    at once, which is not reproduced here.
+    """
+    tokens = re.findall(f'[{re.escape(start)}{re.escape(end)} ]'
+                       f'|[^{re.escape(start)}{re.escape(end)} ]+', text)
+    n = len(tokens)
+    # Next and previous tokens in the list (-1 for none)
+    nxt = list(range(1, n + 1))
+    prv = list(range(-1, n - 1))
+    if n:
+        nxt[-1] = -1
+    head = 0 if n else -1
+    seen_contents = set()
+
+    def remove_round(pairs):
+        """ Removes the pairs of (start, end) token indices, which are in
+        the text order. Returns False if a content has been seen before. """
+        nonlocal head
+
+        spans = []
+        last = None
+        for s, e in pairs:
+            # Spaces are taken by the previous match first, like `finditer()`
+            first = s
+            while prv[first] != -1 and prv[first] != last \
+                  and tokens[prv[first]] == ' ':
+                first = prv[first]
+            last = e
+            while nxt[last] != -1 and tokens[nxt[last]] == ' ':
+                last = nxt[last]
+
+            content = []
+            i = nxt[s]
+            while i != e:
+                content.append(tokens[i])
+                i = nxt[i]
+            content = ''.join(content)
+            if content in seen_contents:
+                return False
+            seen_contents.add(content)
+
+            # See `_tear_parens_by_regex()`
+            halfwidth = prv[first] != -1 and nxt[last] != -1 \
+                and HALFWIDTH_REPTN.match(tokens[prv[first]][-1]) \
+                and HALFWIDTH_REPTN.match(tokens[nxt[last]][0])
+            spans.append((first, last, halfwidth))
+
+            if _is_content_valid(content, invalid_content_reptns):
+                ret.append(content)
+
+        for first, last, halfwidth in spans:
+            p = prv[first]
+            q = nxt[last]
+            if halfwidth:
+                tokens.append(' ')
+                nxt.append(q)
+                prv.append(p)
+                p_next = q_prev = len(tokens) - 1
+            else:
+                p_next = q
+                q_prev = p
+            if p == -1:
+                head = p_next
+            else:
+                nxt[p] = p_next
+            if q != -1:
+                prv[q] = q_prev
+        return True
+
+    # Pairs of (start, end) token indices, their heights (1 for the innermost
+    # pairs) and the indices of their outer pairs
+    pairs = []
+    heights = []
+    outers = []
+    stack = []  # [start index, indices of inner pairs]
+    for i, token in enumerate(tokens):
+        if token == start:
+            stack.append([i, []])
+        elif token == end and stack:
+            s, inners = stack.pop()
+            k = len(pairs)
+            pairs.append((s, i))
+            heights.append(1 + max((heights[j] for j in inners), default=0))
+            outers.append(-1)
+            for j in inners:
+                outers[j] = k
+            if stack:
+                stack[-1][1].append(k)
+
+    rounds = [[] for _ in range(max(heights, default=0))]
+    for k in range(len(pairs)):
+        rounds[heights[k] - 1].append(k)
+    # Pairs which are never removed, i.e. ones that are empty or have such
+    # a pair inside
+    stuck = [False] * len(pairs)
+    for round_pairs in rounds:
+        round_pairs.sort(key=lambda k: pairs[k][0])
+        removed = []
+        for k in round_pairs:
+            s, e = pairs[k]
+            if stuck[k] or nxt[s] == e:
+                if outers[k] != -1:
+                    stuck[outers[k]] = True
+            else:
+                removed.append(pairs[k])
+        if not remove_round(removed):
+            return None
+
+    ret_tokens = []
+    i = head
+    while i != -1:
+        ret_tokens.append(tokens[i])
+        i = nxt[i]
+    return ''.join(ret_tokens)
+
 def tear_paren_contents(
     text: str, parens: list[list[str, str]] = PARENS,
     invalid_contents: list[str | re.Pattern] = INVALID_PAREN_CONTENTS
@@ -274,49 +570,19 @@ def tear_paren_contents(
                               for i in invalid_contents]
 
     ret = []
-    for paren in parens:
-        start = re.escape(paren[0])
-        end = re.escape(paren[1])
-        while True:
-            found_parens = [
-                {
-                    'span': i.span(),
-                    'pattern': re.escape(i.group()),
-                    'content': i.group(1)
-                }
-                for i in re.finditer(f' *{start}([^{start}{end}]+){end} *',
-                                     text)
-                ]
-            if found_parens == []:
-                break
-
-            # List to be used when remove/replace parens in `text`.
-            subs = []
-            for p in found_parens:
-                pre_halfwidth = HALFWIDTH_REPTN.match(
-                    text[p['span'][0] - 1 : p['span'][0]]
-                )
-                post_halfwidth = HALFWIDTH_REPTN.match(
-                    text[p['span'][1] : p['span'][1] + 1]
-                )
-                # If the parens are surrounded half width characters, replace
-                # its part with a space.
-                # E.g. "foo(bar)baz" -> "foo baz",
-                #      "ほげ(ふが)もげ" -> "ほげもげ"
-                if pre_halfwidth and post_halfwidth:
-                    repl = ' '
-                else:
-                    repl = ''
-                subs.append([p['pattern'], repl])
-
-                for r in invalid_content_reptns:
-                    if r.search(p['content']):
-                        break
-                else:
-                    ret.append(p['content'])
-
-            for pattern, repl in subs:
-                text = re.sub(pattern, repl, text)
+    for start, end in parens:
+        n_contents = len(ret)
+        torn = None
+        # Dashes (e.g. "—foo—") are paired without nesting, and are left to
+        # the regular expression
+        if len(start) == 1 and len(end) == 1 and start != end:
+            torn = _tear_parens_in_one_scan(text, start, end,
+                                            invalid_content_reptns, ret)
+        if torn is None:
+            del ret[n_contents:]
+            torn = _tear_parens_by_regex(text, start, end,
+                                         invalid_content_reptns, ret)
+        text = torn
 
     ret.insert(0, text)
     return ret
@@ -367,11 +633,14 @@ def clean_split_text(
     # ｱ -> ア, ２ -> 2, （ -> (, … -> ...
     text = unicodedata.normalize('NFKC', text).lower()
 
-    for s in subs:
-        if type(s[0]) is re.Pattern:
-            text = s[0].sub(s[1], text)
-        else:
-            text = re.sub(s[0], s[1], text)
+    if subs is CLEAN_TEXT_SUBS:
+        text = clean_text(text)
+    else:
+        for s in subs:
+            if type(s[0]) is re.Pattern:
+                text = s[0].sub(s[1], text)
+            else:
+                text = re.sub(s[0], s[1], text)
 
     if parens:
         if separate_paren_contents:
@@ -395,6 +664,177 @@ def clean_split_text(
 
     return valid_sentences
 
+# Characters with special meanings in regular expressions
+_REGEX_SPECIAL_CHARS = set('\\.^$*+?{}[]|()')
+
+def _split_alternatives(source: str):
+    """ Splits a regular expression by `|` at the top level, or returns None if
+    the parentheses are not balanced. """
+    alternatives = ['']
+    depth = 0
+    in_class = False
+    for c in source:
+        if c == '\\':
+            return None
+        if in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+        elif c == '|' and depth == 0:
+            alternatives.append('')
+            continue
+        alternatives[-1] += c
+    return alternatives if depth == 0 and not in_class else None
+
+def _first_chars(source: str):
+    """ Returns the set of characters with which strings matching the regular
+    expression `source` can start, or None if it is not known (the regular
+    expression is not as simple as those of `CO_EXPS`). """
+    if source == '':
+        return None
+    c = source[0]
+    if c == '[':
+        end = source.find(']')
+        members = source[1:end]
+        if end < 2 or members[0] == '^' or '-' in members or '\\' in members:
+            return None
+        chars, rest = set(members), source[end + 1:]
+    elif c == '(':
+        depth = 0
+        for end, d in enumerate(source):
+            depth += d == '('
+            depth -= d == ')'
+            if depth == 0:
+                break
+        inner = source[1:end]
+        if depth != 0 or inner.startswith('?'):
+            return None
+        alternatives = _split_alternatives(inner)
+        if alternatives is None:
+            return None
+        chars = set()
+        for alternative in alternatives:
+            alternative_chars = _first_chars(alternative)
+            if alternative_chars is None:
+                return None
+            chars |= alternative_chars
+        rest = source[end + 1:]
+    elif c not in _REGEX_SPECIAL_CHARS:
+        chars, rest = {c}, source[1:]
+    else:
+        return None
+    # The first item may be skipped
+    if rest[:1] in ('?', '*', '{'):
+        return None
+    return chars
+
+class SyntaxChecker:
+    """ Checker of co-occurrence expressions in a list of morphemes, which does
+    what `check_co_exps_exist()` and `check_co_exps_fulfilled()` do with
+    patterns compiled once.
+
+    The expressions that take co-occurrence expressions (e.g. " もし ") start
+    with a space and one of a few characters. The checker indexes them by the
+    characters, and searches only the expressions which can start with the
+    first character of a morpheme. The co-occurrence expressions of each
+    expression are merged into one alternation.
+
+    Args:
+        co_exps: List of co-occurrence expressions (see
+                 `check_co_exps_exist()`).
+
+    Example:
+        ```
+        >>> checker = SyntaxChecker()
+        >>> checker.find(["もし", "空", "を", "飛べ", "る"])
+        [[re.compile(" [も若](し|し も) "), [...]]]
+        ```
+    """
+    def __init__(self, co_exps: list[list[str | re.Pattern]] = CO_EXPS):
+        self.co_exps = co_exps
+        self._triggers = [co[0] if type(co[0]) is re.Pattern
+                          else re.compile(co[0]) for co in co_exps]
+        # The same lists as those returned by `check_co_exps_fulfilled()`
+        self._fulfilled_co_exps = [[
+            co[0], [j if type(j) is re.Pattern else re.compile(j)
+                    for j in co[1]]
+        ] for co in co_exps]
+        self._co_reptns = [
+            compile_alternation(tuple(co[1])) for co in self._fulfilled_co_exps
+        ]
+
+        # First character of a morpheme -> indices of the expressions which
+        # can start with it, and indices of the expressions always searched
+        self._triggers_by_char = {}
+        self._unindexed = set()
+        for i, trigger in enumerate(self._triggers):
+            chars = None
+            if trigger.pattern.startswith(' ') \
+               and trigger.flags == re.compile(trigger.pattern).flags:
+                chars = _first_chars(trigger.pattern[1:])
+            if chars is None or ' ' in chars:
+                self._unindexed.add(i)
+                continue
+            for c in chars:
+                self._triggers_by_char.setdefault(c, set()).add(i)
+
+    @staticmethod
+    def join(morps: list | tuple):
+        """ Joins morphemes into the string which the patterns search. """
+        return f" {' '.join(morps)} "
+
+    def _found_triggers(self, joined: str):
+        """ Returns the indices of the expressions found in `joined` (see
+        `join()`) in order. """
+        candidates = set(self._unindexed)
+        # Characters after spaces, i.e. the first characters of morphemes
+        # (or of their parts if they have spaces)
+        for word in joined.split(' '):
+            candidates.update(self._triggers_by_char.get(word[:1], ()))
+        return [i for i in sorted(candidates)
+                if self._triggers[i].search(joined)]
+
+    def find(self, morps: list | tuple, greedy: bool = True):
+        """ The same as `check_co_exps_exist()`. """
+        joined = self.join(morps)
+        ret = []
+        for i in self._found_triggers(joined):
+            ret.append(self.co_exps[i])
+            if greedy == False:
+                break
+        return ret
+
+    def check(self, morps: list | tuple, greedy_for_fulfilled: bool = True,
+              greedy_for_unfulfilled: bool = True):
+        """ The same as `check_co_exps_fulfilled()`. """
+        joined = self.join(morps)
+        ret = {"fulfilled": [], "unfulfilled": []}
+        for i in self._found_triggers(joined):
+            co = self._fulfilled_co_exps[i]
+            co_reptn = self._co_reptns[i]
+            if co_reptn is None:
+                fulfilled = any(exp.search(joined) for exp in co[1])
+            else:
+                fulfilled = co_reptn.search(joined) is not None
+            if fulfilled:
+                ret["fulfilled"].append(co)
+                if greedy_for_fulfilled == False:
+                    return ret
+            else:
+                ret["unfulfilled"].append(co)
+                if greedy_for_unfulfilled == False:
+                    return ret
+        return ret
+
+# Used by `check_co_exps_exist()` and `check_co_exps_fulfilled()` for `CO_EXPS`
+SYNTAX_CHECKER = SyntaxChecker()
+
 def check_co_exps_exist(morps: list | tuple, greedy: bool = True,
     co_exps: list[list[str | re.Pattern]] = CO_EXPS) -> (
         list[list[str | re.Pattern]]
@@ -419,6 +859,9 @@ def check_co_exps_exist(morps: list | tuple, greedy: bool = True,
         >> [["[も若](し|し も)", ["なら", "ば", "たら", "も"]]
         ```
     """
+    if co_exps is CO_EXPS:
+        return SYNTAX_CHECKER.find(morps, greedy)
+
     joined = f" {' '.join(morps)} "
     ret = []
     for co in co_exps:
@@ -461,6 +904,10 @@ def check_co_exps_fulfilled(
         "unfulfilled": [["[も若](し|し も)", ["なら", "ば", "たら", "も"]]}
         ```
     """
+    if co_exps is CO_EXPS:
+        return SYNTAX_CHECKER.check(morps, greedy_for_fulfilled,
+                                    greedy_for_unfulfilled)
+
     joined = f" {' '.join(morps)} "
     reptn_co_exps = [[
         # `[expression<str | re.Pattern>,